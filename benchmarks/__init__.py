@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+
+from utils.config import Config
+
+# config.ini next to the benchmarks, read for the defaults of bench_config.
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+
+# Config from config.ini, with attributes replaced by overrides.
+def bench_config(**overrides):
+    cparser = ConfigParser()
+    cparser.read(CONFIG_FILE)
+    config = Config(cparser)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return config
+
+# Run the block in a temporary directory, so the logs, save files and
+# checkpoints a benchmark writes never end up in the repository.
+@contextmanager
+def scratch_dir():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+# Best of repeat runs of function(), in seconds.
+def best_of(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def report(name, value, unit):
+    print(f"{name:<40} {value:>14,.2f} {unit}")
+
+# (url, content) of up to pages saved pages in a directory, each given a url
+# on www.ics.uci.edu to resolve its relative links against, or of generated
+# pages of a cache_server.Site when there is no directory.
+def page_corpus(pages_dir=None, pages=500, words=1000):
+    if pages_dir:
+        corpus = []
+        for name in sorted(os.listdir(pages_dir))[:pages]:
+            path = os.path.join(pages_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    corpus.append((f"https://www.ics.uci.edu/{name}", file.read()))
+        return corpus
+    from benchmarks.cache_server import Site
+    site = Site(hosts=max(pages // 50, 1), pages_per_host=min(pages, 50), words=words)
+    return [(url, site.page(url)) for url in site.urls()[:pages]]
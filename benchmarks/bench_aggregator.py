@@ -0,0 +1,157 @@
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from threading import Thread, Lock, RLock
+
+from benchmarks import scratch_dir, report
+from scraper_data import ScraperData, CHECKPOINT_PAGES
+
+
+class TimedLock(object):
+    # A lock that adds up how long it is held, from the outermost acquire to
+    # its release, and the longest it was held at once.
+    def __init__(self, lock):
+        self.lock = lock
+        self.depth = 0
+        self.held = 0.0
+        self.longest = 0.0
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+        if self.depth == 1:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            held = time.perf_counter() - self.start
+            self.held += held
+            self.longest = max(self.longest, held)
+        self.lock.release()
+
+
+class OldCounts(object):
+    # How the scraper counted pages before the per-thread buffers: straight
+    # into shared dicts, each url appended to unique_links.txt and
+    # all_tokens.txt rewritten when the page count hit CHECKPOINT_PAGES
+    # exactly. With locked set, every page takes one shared lock instead.
+    def __init__(self, locked):
+        self.lock = TimedLock(Lock()) if locked else None
+        self.all_tokens = defaultdict(int)
+        self.unique_links = dict()
+        self.file_count = 0
+        self.checkpoints = 0
+
+    def count_page(self, url, word_counts):
+        if self.lock is None:
+            self._count(url, word_counts)
+        else:
+            with self.lock:
+                self._count(url, word_counts)
+
+    def _count(self, url, word_counts):
+        for token, count in word_counts.items():
+            self.all_tokens[token] += count
+        self.unique_links[url] = sum(word_counts.values())
+        with open("unique_links.txt", 'a') as file:
+            file.write(f"{url}, {self.unique_links[url]}\n")
+        self.file_count += 1
+        if self.file_count == CHECKPOINT_PAGES:
+            self.checkpoints += 1
+            with open("all_tokens.txt", 'w') as file:
+                for token, freq in self.all_tokens.items():
+                    file.write(f"{token}, {freq}\n")
+            self.file_count = 0
+
+# The token counts of the pages each thread counts.
+def thread_pages(threads, pages, words, vocabulary, seed=0):
+    rng = random.Random(seed)
+    tokens = [f"word{i}" for i in range(vocabulary)]
+    return [[(f"https://h{thread}.ics.uci.edu/page{page}", Counter(rng.choices(tokens, k=words)))
+             for page in range(pages)] for thread in range(threads)]
+
+# Run count(url, word_counts) for every page, a thread per list of pages.
+# A page that raises is counted as an error and skipped, as scraper.scraper
+# does. Returns (pages per second, errors).
+def run_threads(count, work):
+    errors = []
+
+    def count_pages(pages):
+        for url, word_counts in pages:
+            try:
+                count(url, word_counts)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [Thread(target=count_pages, args=(pages,)) for pages in work]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(len(pages) for pages in work) / (time.perf_counter() - start), len(errors)
+
+def old_run(work, locked):
+    counts = OldCounts(locked)
+    with scratch_dir():
+        rate, errors = run_threads(counts.count_page, work)
+    return rate, errors, sum(counts.all_tokens.values()), len(counts.unique_links), counts.checkpoints, counts.lock
+
+# ScraperData as count_page uses it: tokens and url into the calling
+# thread's buffer, then the page counted, merging every MERGE_PAGES pages.
+def scraper_data_run(work):
+    with scratch_dir():
+        data = ScraperData()
+        data.lock = TimedLock(RLock())
+        checkpoints = []
+
+        def count(url, word_counts):
+            data.update_unique_links(url, data.add_tokens(word_counts))
+            if data.incr_file_count():
+                checkpoints.append(url)
+
+        rate, errors = run_threads(count, work)
+        data.flush()
+        data.close_checkpoint()
+    return rate, errors, sum(data.all_tokens.values()), len(data.unique_links), len(checkpoints), data.lock
+
+# Pages per second counted from many threads, and the errors, tokens and
+# checkpoints each way ended up with: unlocked shared dicts, one shared
+# lock, and ScraperData's per-thread buffers merged in batches, which have
+# to be exact. With a lock, also how long it was held per page and at most
+# at once, the time a crawler thread done downloading can wait for it.
+def main(threads, pages, words, vocabulary, switch_interval):
+    # A short switch interval makes the threads interleave as they would on
+    # a busy crawler.
+    sys.setswitchinterval(switch_interval)
+    work = thread_pages(threads, pages, words, vocabulary)
+    total_pages = threads * pages
+    expected = (total_pages * words, total_pages, total_pages // CHECKPOINT_PAGES)
+    print(f"expected: {expected[0]:,} tokens, {expected[1]:,} urls, {expected[2]:,} checkpoints")
+    runs = (("unlocked dicts", lambda: old_run(work, False)), ("one shared lock", lambda: old_run(work, True)),
+            ("per-thread buffers", lambda: scraper_data_run(work)))
+    for name, run in runs:
+        rate, errors, tokens, urls, checkpoints, lock = run()
+        report(f"{name}, {threads} threads", rate, "pages/s")
+        report(f"{name}, pages failed", errors, "pages")
+        report(f"{name}, tokens lost", expected[0] - tokens, "tokens")
+        report(f"{name}, checkpoints", checkpoints, "checkpoints")
+        if lock is not None:
+            report(f"{name}, lock held", lock.held / total_pages * 1000000, "us/page")
+            report(f"{name}, lock held at most", lock.longest * 1000, "ms")
+        if name == "per-thread buffers":
+            assert (errors, tokens, urls, checkpoints) == (0,) + expected, f"ScraperData counted {(errors, tokens, urls, checkpoints)}"
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Page counting from many threads, shared dicts against per-thread buffers.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=2000, help="pages per thread")
+    parser.add_argument("--words", type=int, default=300, help="tokens per page")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--switch_interval", type=float, default=0.00001, help="sys.setswitchinterval")
+    args = parser.parse_args()
+    main(args.threads, args.pages, args.words, args.vocabulary, args.switch_interval)
@@ -0,0 +1,76 @@
+import random
+import time
+from argparse import ArgumentParser
+from hashlib import sha256
+from urllib.parse import urlparse
+
+from benchmarks import report
+from utils import get_urlhash, normalize
+
+
+# The normalize and get_urlhash before utils/canonical.py: a trailing slash
+# stripped and a sha256 of everything but the scheme.
+def old_normalize(url):
+    if url.endswith("/"):
+        return url.rstrip("/")
+    return url
+
+def old_get_urlhash(url):
+    parsed = urlparse(url)
+    return sha256(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+
+# The ways links on different pages spell the same url.
+def variants(host, path, query, rng):
+    params = [f"{name}={value}" for name, value in query]
+    shuffled = rng.sample(params, len(params))
+    return [
+        f"https://{host}{path}?{'&'.join(params)}",
+        f"https://{host}{path}?{'&'.join(shuffled)}",
+        f"https://{host.upper()}{path}?{'&'.join(params)}",
+        f"https://{host}:443{path}?{'&'.join(params)}",
+        f"https://{host}{path}?{'&'.join(params + ['utm_source=newsletter'])}",
+        f"https://{host}{path}?{'&'.join(params)}#section{rng.randrange(5)}",
+        f"https://{host}/x/..{path}?{'&'.join(params)}",
+        f"https://{host}{path}/index.html?{'&'.join(params)}",
+    ]
+
+# Links of a crawl over pages distinct pages, each linked to with every
+# spelling of its url, shuffled.
+def links(pages, seed=0):
+    rng = random.Random(seed)
+    urls = []
+    for page in range(pages):
+        host = f"h{page % 50}.ics.uci.edu"
+        path = f"/dir{page % 97}/page{page}"
+        query = [(f"p{i}", str(rng.randrange(100))) for i in range(rng.randrange(3))]
+        urls += variants(host, path, query, rng)
+    rng.shuffle(urls)
+    return urls
+
+# Urls per second through normalize and get_urlhash, as the frontier hashes them.
+def throughput(normalize, get_urlhash, urls):
+    start = time.perf_counter()
+    for url in urls:
+        get_urlhash(normalize(url))
+    return len(urls) / (time.perf_counter() - start)
+
+# Distinct hashes, each a fetch, of links to pages pages spelled eight ways,
+# with the old hashing and with canonicalization, and urls/s of both.
+# Canonicalization has to bring it down to one hash per page.
+def main(pages):
+    urls = links(pages)
+    old_fetches = len({old_get_urlhash(old_normalize(url)) for url in urls})
+    fetches = len({get_urlhash(normalize(url)) for url in urls})
+    assert fetches == pages, f"{fetches:,} hashes for {pages:,} pages"
+    report(f"old hashing, fetches of {pages:,} pages", old_fetches, "urls")
+    report("canonical hashing, fetches", fetches, "urls")
+    report("old normalize + get_urlhash", throughput(old_normalize, old_get_urlhash, urls), "urls/s")
+    report("canonical normalize + get_urlhash", throughput(normalize, get_urlhash, urls), "urls/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Duplicate fetches and hashing speed, before and after canonicalization.")
+    parser.add_argument("--pages", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.pages)
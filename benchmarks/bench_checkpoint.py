@@ -0,0 +1,122 @@
+import random
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from benchmarks import scratch_dir, best_of, report
+from scraper_data import ScraperData, PageCounts, CHECKPOINT_PAGES
+
+
+# The checkpoint ScraperData.write_checkpoint replaced: a line appended to
+# unique_links.txt and hash_vals.txt for every page, each in a file opened for
+# it, and all_tokens.txt and subdomains.txt rewritten whole every
+# CHECKPOINT_PAGES pages.
+def old_checkpoint(all_tokens, subdomains, pages):
+    for url, tokens, simhash in pages:
+        with open("unique_links.txt", 'a') as file:
+            file.write(f"{url}, {tokens}\n")
+        with open("hash_vals.txt", 'a') as file:
+            file.write(f"{simhash}\n")
+    with open("all_tokens.txt", 'w') as file:
+        for token, freq in all_tokens.items():
+            file.write(f"{token}, {freq}\n")
+    with open("subdomains.txt", 'w') as file:
+        for subdom, freq in subdomains.items():
+            file.write(f"{subdom}, {freq}\n")
+
+# The old read_unique_links, read_simhash, read_all_tokens and read_subdomains.
+def old_recover():
+    unique_links, simhash_values = dict(), set()
+    all_tokens, subdomains = defaultdict(int), defaultdict(int)
+    for line in open("unique_links.txt"):
+        url, count = line.rstrip('\n').split(", ")
+        unique_links[url] = count
+    for line in open("hash_vals.txt"):
+        simhash_values.add(int(line.rstrip('\n')))
+    for line in open("all_tokens.txt"):
+        token, freq = line.rstrip('\n').split(", ")
+        all_tokens[token] = int(freq)
+    for line in open("subdomains.txt"):
+        subdom, freq = line.rstrip('\n').split(", ")
+        subdomains[subdom] = int(freq)
+
+# A checkpoint's worth of pages, as (url, tokens, simhash) and as the
+# PageCounts they add, each page with words tokens from the vocabulary.
+def checkpoint_pages(vocabulary, round, words, rng):
+    pages = []
+    counts = PageCounts()
+    for page in range(CHECKPOINT_PAGES):
+        url = f"https://h{page % 20}.ics.uci.edu/round{round}/page{page}"
+        simhash = rng.getrandbits(64)
+        pages.append((url, words, simhash))
+        counts.tokens.update(rng.choice(vocabulary) for _ in range(words))
+        counts.subdomains[f"h{page % 20}.ics.uci.edu"] += 1
+        counts.unique_links[url] = words
+        counts.simhashes.append(simhash)
+    # One short, so merging does not checkpoint on its own.
+    counts.pages = CHECKPOINT_PAGES - 1
+    return pages, counts
+
+# Milliseconds per checkpoint, the old files against the checkpoint logs,
+# for a crawl whose vocabulary already holds size tokens, and the time to
+# recover each once rounds checkpoints were written.
+def measure(size, rounds, words):
+    rng = random.Random(size)
+    vocabulary = [f"token{i}" for i in range(size)]
+    with scratch_dir():
+        data = ScraperData()
+        start = PageCounts()
+        start.tokens.update(vocabulary)
+        data.merge(start)
+        data.write_checkpoint(full=True)
+        all_tokens, subdomains = defaultdict(int, data.all_tokens), defaultdict(int)
+        old_time = new_time = 0.0
+        for round in range(rounds):
+            pages, counts = checkpoint_pages(vocabulary, round, words, rng)
+            for token, count in counts.tokens.items():
+                all_tokens[token] += count
+            for subdomain, count in counts.subdomains.items():
+                subdomains[subdomain] += count
+            begin = time.perf_counter()
+            old_checkpoint(all_tokens, subdomains, pages)
+            old_time += time.perf_counter() - begin
+            data.merge(counts)
+            begin = time.perf_counter()
+            data.write_checkpoint()
+            new_time += time.perf_counter() - begin
+        data.close_checkpoint()
+        old_read = best_of(old_recover, 1)
+        # As after a crash: the increments logged since the last compaction
+        # are added up again.
+        recovered = ScraperData()
+        crash_read = best_of(recovered.read_checkpoint, 1)
+        assert recovered.all_tokens == all_tokens, "the checkpoint logs recovered other token counts"
+        # As after the crawl stopped, which compacts the counts.
+        recovered.write_checkpoint(compact=True)
+        recovered.close_checkpoint()
+        recovered = ScraperData()
+        stop_read = best_of(recovered.read_checkpoint, 1)
+        recovered.close_checkpoint()
+        assert recovered.all_tokens == all_tokens, "the compacted logs recovered other token counts"
+    return old_time / rounds * 1000, new_time / rounds * 1000, old_read * 1000, crash_read * 1000, stop_read * 1000
+
+# Checkpoint and recovery time as the vocabulary grows. The old checkpoint
+# grows with it, the logs should stay flat. Recovery reads the totals either
+# way, the logs also the increments since they were last compacted, unless
+# the crawl stopped and compacted them.
+def main(sizes, rounds, words):
+    for size in sizes:
+        old_time, new_time, old_read, crash_read, stop_read = measure(size, rounds, words)
+        report(f"old files, {size:,} tokens", old_time, "ms/checkpoint")
+        report(f"checkpoint logs, {size:,} tokens", new_time, "ms/checkpoint")
+        report("old files, recover", old_read, "ms")
+        report("checkpoint logs, recover after a crash", crash_read, "ms")
+        report("checkpoint logs, recover after a stop", stop_read, "ms")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="ScraperData checkpoint and recovery time against vocabulary size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="tokens in the vocabulary")
+    parser.add_argument("--rounds", type=int, default=20, help="checkpoints written")
+    parser.add_argument("--words", type=int, default=300, help="tokens per page")
+    args = parser.parse_args()
+    main(args.sizes, args.rounds, args.words)
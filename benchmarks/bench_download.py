@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+from argparse import ArgumentParser
+
+import aiohttp
+import cbor
+import requests
+
+from benchmarks import bench_config, report
+from benchmarks.cache_server import CacheServer, Site
+from utils.download import download, download_async
+from utils.response import Response
+
+
+# The download this module replaced: a HEAD and a GET per page, each on a new
+# connection to the cache server.
+def unpooled_download(url, config):
+    host, port = config.cache_server
+    params = [("q", f"{url}"), ("u", f"{config.user_agent}")]
+    requests.head(f"http://{host}:{port}/", params=params)
+    resp = requests.get(f"http://{host}:{port}/", params=params)
+    return Response(cbor.loads(resp.content))
+
+# Download every url one after the other, checking each page against the
+# site, returns the milliseconds each took.
+def timed_downloads(fetch, urls, site):
+    millis = []
+    for url in urls:
+        start = time.perf_counter()
+        resp = fetch(url)
+        millis.append((time.perf_counter() - start) * 1000)
+        assert resp.status == 200 and resp.raw_response.content == site.page(url), f"Bad download of {url}"
+    return millis
+
+async def timed_downloads_async(config, urls, site):
+    async with aiohttp.ClientSession() as session:
+        millis = []
+        for url in urls:
+            start = time.perf_counter()
+            resp = await download_async(url, config, session)
+            millis.append((time.perf_counter() - start) * 1000)
+            assert resp.status == 200 and resp.raw_response.content == site.page(url), f"Bad download of {url}"
+        return millis
+
+def report_millis(name, millis):
+    millis = sorted(millis)
+    report(f"{name}, mean", sum(millis) / len(millis), "ms")
+    report(f"{name}, p50", millis[len(millis) // 2], "ms")
+
+# Per-page latency of a download from a local cache server: one new
+# connection per request with a HEAD first, the pooled session with and
+# without the HEAD, and the async download. Every page is checked.
+def main(pages, latency):
+    logging.disable(logging.INFO)
+    site = Site(hosts=max(pages // 20, 1), pages_per_host=20)
+    urls = site.urls()[:pages]
+    with CacheServer(site, latency) as server:
+        config = bench_config(cache_server=server.address, head_check=True, page_store_size=0)
+        report_millis("new connections, HEAD + GET", timed_downloads(lambda url: unpooled_download(url, config), urls, site))
+        report_millis("pooled session, HEAD + GET", timed_downloads(lambda url: download(url, config), urls, site))
+        config.head_check = False
+        report_millis("pooled session, streamed GET", timed_downloads(lambda url: download(url, config), urls, site))
+        report_millis("async session, streamed GET", asyncio.run(timed_downloads_async(config, urls, site)))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Per-page download latency from a local cache server.")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds the cache server takes per request")
+    args = parser.parse_args()
+    main(args.pages, args.latency)
@@ -0,0 +1,79 @@
+import logging
+import os
+import random
+import time
+from argparse import ArgumentParser
+from threading import Thread
+
+from benchmarks import bench_config, scratch_dir, report
+from benchmarks.cache_server import Site
+from crawler.counting_lock import CountingLock
+from crawler.frontier import Frontier
+
+
+# Link lists of pages of a site spread over the four crawled domains, the
+# same number per thread.
+def page_links(threads, pages, links, seed=0):
+    rng = random.Random(seed)
+    site = Site(hosts=40, pages_per_host=1000)
+    for host in range(len(site.hosts)):
+        site.hosts[host] = f"h{host}{('.ics', '.cs', '.stat', '.informatics')[host % 4]}.uci.edu"
+    urls = site.urls()
+    return [[[rng.choice(urls) for _ in range(links)] for _ in range(pages)] for _ in range(threads)]
+
+# How the workers added links before the sharded frontier: one url at a
+# time, each under a lock every worker shares.
+def add_per_link(frontier, pages, lock):
+    for links in pages:
+        for url in links:
+            with lock:
+                frontier.add_url(url)
+
+def add_per_page(frontier, pages, lock):
+    for links in pages:
+        frontier.add_urls(links)
+
+# Links added per second from every thread at once, and the milliseconds the
+# threads waited on the shared lock and on each kind of frontier lock.
+def run(add, threads, pages, links):
+    work = page_links(threads, pages, links)
+    with scratch_dir():
+        frontier = Frontier(bench_config(threads_count=threads, seed_urls=[]), True)
+        lock = CountingLock("shared")
+        workers = [Thread(target=add, args=(frontier, work[thread], lock)) for thread in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        waits = {"shared": lock.stats()["wait_ms"], "shards": 0.0, "seen": 0.0, "journal": 0.0, "scheduler": 0.0}
+        for name, stats in frontier.lock_stats().items():
+            if name in frontier.shards:
+                name = "shards"
+            elif name not in waits:
+                name = "scheduler"
+            waits[name] += stats["wait_ms"]
+        frontier.close()
+    return threads * pages * links / elapsed, waits
+
+# Links per second and lock wait with a lock per link, the way workers used
+# to add links, and with a batch per page through add_urls. Wait times add up
+# over every waiting thread.
+def main(threads, pages, links):
+    logging.disable(logging.INFO)
+    # With fewer cpus than threads, the waits include threads blocked on the GIL.
+    print(f"{threads} threads, {pages * links:,} links each, {os.cpu_count()} cpus")
+    for name, add in (("lock per link", add_per_link), ("batch per page", add_per_page)):
+        rate, waits = run(add, threads, pages, links)
+        report(name, rate, "links/s")
+        for lock, wait in waits.items():
+            report(f"{name}, {lock} lock wait", wait, "ms")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Frontier adds from many threads, a lock per link against a batch per page.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=500, help="pages per thread")
+    parser.add_argument("--links", type=int, default=50, help="links per page")
+    args = parser.parse_args()
+    main(args.threads, args.pages, args.links)
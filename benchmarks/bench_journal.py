@@ -0,0 +1,58 @@
+import logging
+import shelve
+import time
+from argparse import ArgumentParser
+
+from benchmarks import bench_config, scratch_dir, report
+from crawler.journal import FrontierJournal
+from utils import get_urlhash
+
+
+def urls(count):
+    return [f"https://h{i % 50}.ics.uci.edu/page{i}" for i in range(count)]
+
+# The persistence the journal replaced: every add written to the shelve and
+# synced, twice, as Frontier.add_url did.
+def shelve_adds(count):
+    with scratch_dir():
+        save = shelve.open("frontier.shelve")
+        start = time.perf_counter()
+        for url in urls(count):
+            urlhash = get_urlhash(url)
+            save[urlhash] = (url, False)
+            save.sync()
+            save[urlhash] = (url, False)
+            save.sync()
+        elapsed = time.perf_counter() - start
+        save.close()
+    return count / elapsed
+
+# Adds per second through the journal, a page's links at a time, including
+# closing it, which folds the rest into the shelve.
+def journal_adds(count, sync, links_per_page=50):
+    records = [(get_urlhash(url), url) for url in urls(count)]
+    with scratch_dir():
+        config = bench_config(journal_sync=sync)
+        save = shelve.open("frontier.shelve")
+        journal = FrontierJournal("frontier.shelve.log", lambda: save, config, logging.getLogger("bench"))
+        start = time.perf_counter()
+        for page in range(0, count, links_per_page):
+            journal.add_many(records[page:page + links_per_page])
+        journal.close()
+        elapsed = time.perf_counter() - start
+        save.close()
+    return count / elapsed
+
+# Frontier adds per second with a shelve sync per add and through the journal,
+# with each JOURNALSYNC setting.
+def main(count, shelve_count):
+    report(f"shelve + sync per add, {shelve_count:,} urls", shelve_adds(shelve_count), "adds/s")
+    for sync in ("flush", "fsync"):
+        report(f"journal, JOURNALSYNC={sync}, {count:,} urls", journal_adds(count, sync), "adds/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Frontier adds per second, shelve against journal.")
+    parser.add_argument("--urls", type=int, default=100000)
+    parser.add_argument("--shelve_urls", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.urls, args.shelve_urls)
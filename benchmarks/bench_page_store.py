@@ -0,0 +1,59 @@
+import logging
+import multiprocessing
+import os
+import time
+from argparse import ArgumentParser
+
+from benchmarks import bench_config, page_corpus, scratch_dir, report
+from benchmarks.cache_server import RawResponse
+
+
+class PageResponse(object):
+    # A 200 from the cache server with the page in it, as Response unpickles it.
+    def __init__(self, url, content):
+        self.url = url
+        self.status = 200
+        self.error = None
+        self.raw_response = RawResponse(url, content)
+
+# One crawl of the corpus through scraper.scraper in a fresh process, in
+# directory, so a page store left there by an earlier crawl is kept.
+# Returns (pages per second, pages parsed, links followed).
+def crawl(corpus, directory, store_size):
+    logging.disable(logging.INFO)
+    import scraper
+    from utils.telemetry import telemetry
+    os.chdir(directory)
+    scraper.configure(bench_config(page_store_size=store_size, parser_processes=0), restart=True)
+    responses = [(url, PageResponse(url, content)) for url, content in corpus]
+    start = time.perf_counter()
+    links = sum(len(scraper.scraper(url, resp)) for url, resp in responses)
+    elapsed = time.perf_counter() - start
+    scraper.shutdown()
+    return len(corpus) / elapsed, telemetry.histogram("scraper.parse").count, links
+
+# Pages per second of crawling the corpus without a page store, then twice
+# with one, the second time as after a restart, where every page comes back
+# byte-identical and is counted from the store without being parsed. All
+# three have to follow the same links.
+def main(corpus, store_size):
+    context = multiprocessing.get_context("spawn")
+    with scratch_dir() as directory:
+        results = []
+        for name, size in (("no page store", 0), ("first crawl", store_size), ("recrawl", store_size)):
+            # Each crawl gets a new interpreter, ScraperData is per process.
+            with context.Pool(1) as pool:
+                rate, parsed, links = pool.apply(crawl, (corpus, directory, size))
+            report(f"{name}, pages/s", rate, "pages/s")
+            report(f"{name}, pages parsed", parsed, "pages")
+            results.append(links)
+    assert len(set(results)) == 1, f"links followed differ: {results}"
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Recrawl throughput with the page store.")
+    parser.add_argument("--pages_dir", help="directory of saved pages, generated pages if not given")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=1000, help="words per generated page")
+    parser.add_argument("--store_size", type=int, default=200000, help="PAGESTORESIZE")
+    args = parser.parse_args()
+    main(page_corpus(args.pages_dir, args.pages, args.words), args.store_size)
@@ -0,0 +1,42 @@
+import time
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+
+from benchmarks import page_corpus, report
+from document_parser import parse_document
+
+
+# What the scraper got from a page before parse_document: a BeautifulSoup
+# tree, walked for the text, again for the tag count and again for the links.
+def soup_parse(content):
+    soup = BeautifulSoup(content, "lxml")
+    text = soup.get_text()
+    tag_count = len(soup.find_all())
+    hrefs = [link.get('href') for link in soup.find_all('a', href=True)]
+    return text, tag_count, hrefs
+
+# Pages per second through a parser, over every page.
+def throughput(function, corpus):
+    start = time.perf_counter()
+    for _, content in corpus:
+        function(content)
+    return len(corpus) / (time.perf_counter() - start)
+
+# Pages per second of BeautifulSoup and of the streaming parse_document, after
+# checking that both find the same tag count and links on every page.
+def main(corpus):
+    for url, content in corpus:
+        _, tag_count, hrefs = soup_parse(content)
+        document = parse_document(content)
+        assert (document.tag_count, document.hrefs) == (tag_count, hrefs), f"parse_document differs on {url}"
+    report(f"BeautifulSoup, {len(corpus):,} pages", throughput(soup_parse, corpus), "pages/s")
+    report(f"parse_document, {len(corpus):,} pages", throughput(parse_document, corpus), "pages/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Page parsing throughput, BeautifulSoup against parse_document.")
+    parser.add_argument("--pages_dir", help="directory of saved pages, generated pages if not given")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--words", type=int, default=1000, help="words per generated page")
+    args = parser.parse_args()
+    main(page_corpus(args.pages_dir, args.pages, args.words))
@@ -0,0 +1,46 @@
+import logging
+import os
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import scraper
+from benchmarks import bench_config, page_corpus, scratch_dir, report
+
+
+# Pages per second through run_parse_page from threads threads, the way the
+# workers call it, with processes parser processes (PARSERPROCESSES).
+def throughput(corpus, processes, threads):
+    with scratch_dir():
+        config = bench_config(parser_processes=processes, page_store_size=0)
+        scraper.configure(config, restart=True)
+        try:
+            with ThreadPoolExecutor(threads) as pool:
+                # Start the parser processes before timing.
+                list(pool.map(lambda page: scraper.run_parse_page(*page), corpus[:max(processes, 1) * 2]))
+                start = time.perf_counter()
+                pages = list(pool.map(lambda page: scraper.run_parse_page(*page), corpus))
+                elapsed = time.perf_counter() - start
+        finally:
+            scraper.shutdown()
+    assert all(page.simhash is not None for page in pages)
+    return len(corpus) / elapsed
+
+# Parsing throughput of the worker threads with each number of parser
+# processes, 0 parsing on the threads themselves.
+def main(corpus, processes, threads):
+    logging.disable(logging.INFO)
+    # More processes than cpus can't parse any faster.
+    print(f"{len(corpus):,} pages, {threads} threads, {os.cpu_count()} cpus")
+    for count in processes:
+        report(f"PARSERPROCESSES={count}", throughput(corpus, count, threads), "pages/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Page parsing throughput with each number of parser processes.")
+    parser.add_argument("--pages_dir", help="directory of saved pages, generated pages if not given")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=1000, help="words per generated page")
+    parser.add_argument("--processes", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8, help="worker threads parsing at once")
+    args = parser.parse_args()
+    main(page_corpus(args.pages_dir, args.pages, args.words), args.processes, args.threads)
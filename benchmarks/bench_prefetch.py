@@ -0,0 +1,41 @@
+import multiprocessing
+from argparse import ArgumentParser
+
+from benchmarks import report
+from benchmarks.bench_workers import crawl
+from benchmarks.cache_server import CacheServer, Site
+
+
+# Pages per second of the threaded workers with each PREFETCH, on a site
+# where a slow_fraction of the pages take slow_latency seconds to come back.
+# One download at a time waits out every slow page, more of them overlap it.
+# Every page has to be downloaded exactly once, never more than HOSTINFLIGHT
+# (1) from a host at once and never more than threads * PREFETCH in all.
+def main(hosts, pages_per_host, latency, slow_fraction, slow_latency, threads, prefetch, politeness):
+    site = Site(hosts, pages_per_host)
+    context = multiprocessing.get_context("spawn")
+    for count in prefetch:
+        with CacheServer(site, latency, slow_fraction, slow_latency) as server, context.Pool(1) as pool:
+            pages, elapsed, p50, p99 = pool.apply(
+                crawl, ("prefetch", server.address, site, threads, count, politeness))
+            missed = set(site.urls()) - set(server.requests)
+            repeated = [url for url, requests in server.requests.items() if requests > 1]
+            assert not missed and not repeated, f"PREFETCH={count}: {len(missed)} pages missed, {len(repeated)} fetched twice"
+            assert server.max_host_active <= 1, f"PREFETCH={count}: {server.max_host_active} downloads from one host at once"
+            assert server.max_active <= threads * count, f"PREFETCH={count}: {server.max_active} downloads at once"
+        report(f"PREFETCH={count}, pages/s", pages / elapsed, "pages/s")
+        report(f"PREFETCH={count}, most in flight", server.max_active, "downloads")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Crawl throughput with slow pages against PREFETCH.")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages_per_host", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the cache server takes per request")
+    parser.add_argument("--slow_fraction", type=float, default=0.1, help="fraction of the pages that are slow")
+    parser.add_argument("--slow_latency", type=float, default=1.0, help="seconds a slow page takes")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--politeness", type=float, default=0.05)
+    args = parser.parse_args()
+    main(args.hosts, args.pages_per_host, args.latency, args.slow_fraction, args.slow_latency,
+         args.threads, args.prefetch, args.politeness)
@@ -0,0 +1,61 @@
+import time
+from argparse import ArgumentParser
+
+from benchmarks import report
+from crawler.frontier_queue import FifoQueue, PriorityQueue
+
+
+class ListQueue(object):
+    # The frontier's queue before FifoQueue, a list popped from the front.
+    def __init__(self):
+        self.urls = []
+
+    def __len__(self):
+        return len(self.urls)
+
+    def push(self, url):
+        self.urls.append(url)
+
+    def pop(self):
+        return self.urls.pop(0)
+
+
+QUEUES = {
+    "list.pop(0)": ListQueue,
+    "FifoQueue": FifoQueue,
+    "PriorityQueue": PriorityQueue,
+}
+
+
+def urls(count, start=0):
+    return [f"https://www.ics.uci.edu/dir{i % 20}/page{i}?id={i}" for i in range(start, start + count)]
+
+# Pops and pushes per second of a queue holding depth urls, a url is pushed
+# for every one popped, as in a crawl that keeps finding links.
+def steady_ops(queue_type, depth, ops):
+    queue = queue_type()
+    for url in urls(depth):
+        queue.push(url)
+    pushed = urls(ops, depth)
+    start = time.perf_counter()
+    for url in pushed:
+        queue.pop()
+        queue.push(url)
+    return 2 * ops / (time.perf_counter() - start)
+
+# Push and pop throughput of each queue kind as the frontier grows. The list
+# is skipped past --max_list urls, each of its pops moves the whole list.
+def main(depths, ops, max_list):
+    for depth in depths:
+        for name, queue_type in QUEUES.items():
+            if queue_type is ListQueue and depth > max_list:
+                continue
+            report(f"{name}, {depth:,} queued", steady_ops(queue_type, depth, ops), "ops/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Frontier queue push and pop throughput.")
+    parser.add_argument("--depths", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--ops", type=int, default=100000, help="pops (and as many pushes) per run")
+    parser.add_argument("--max_list", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.depths, args.ops, args.max_list)
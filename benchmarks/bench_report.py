@@ -0,0 +1,84 @@
+import heapq
+import random
+from argparse import ArgumentParser
+
+import scraper
+from benchmarks import scratch_dir, best_of, report
+from report_generator import report_generator
+from scraper_data import PageCounts, MERGE_PAGES
+
+
+# report_generator before the statistics were kept up to date: a max over
+# every unique link, a sort of the subdomains and a heap over the whole
+# vocabulary, each time the report is written.
+def old_report_generator(data):
+    if len(data.unique_links.keys()) == 0:
+        longest_page_url, longest_page_words = ("", 0)
+    else:
+        longest_page_url = max(data.unique_links, key=data.unique_links.get)
+        longest_page_words = data.unique_links[longest_page_url]
+    sorted_subdoms = sorted(data.subdomains.items(), key=lambda x: (x[0], x[1]))
+    top_fifty = heapq.nlargest(50, data.all_tokens.items(), key=lambda item: item[1])
+
+    with open('report.txt', 'w') as f:
+        f.write(f"Number of Unique Links: {len(data.get_unique_links_keys())}\n")
+        f.write("\n")
+
+        f.write(f"Longest Page: {longest_page_url}, {longest_page_words}\n")
+        f.write("\n")
+
+        f.write("ics.uci.edu Subdomains\n")
+        for i in sorted_subdoms:
+            f.write(f"{i[0]}, {i[1]}\n")
+        f.write("\n")
+
+        f.write("Top 50 Words\n")
+        for ind, item in enumerate(top_fifty):
+            f.write(f"{ind+1}. {item[0]} : {item[1]}\n")
+
+# Count pages into the scraper's ScraperData until it holds about links
+# unique links and tokens distinct tokens, in batches as the threads merge
+# them.
+def fill(data, links, tokens, subdomains, rng):
+    words = max(tokens // links, 1) * 4
+    for start in range(len(data.unique_links), links, MERGE_PAGES):
+        counts = PageCounts()
+        for page in range(start, min(start + MERGE_PAGES, links)):
+            subdomain = f"s{page % subdomains}.ics.uci.edu"
+            counts.tokens.update(f"token{rng.randrange(tokens)}" for _ in range(words))
+            counts.subdomains[subdomain] += 1
+            counts.unique_links[f"https://{subdomain}/page{page}"] = rng.randrange(100000)
+        counts.pages = MERGE_PAGES
+        data.merge(counts)
+
+# report.txt, with the top words reduced to their counts: tokens with the
+# same count can come in any order, and either can make the cut.
+def read_report():
+    with open("report.txt") as file:
+        head, _, words = file.read().partition("Top 50 Words\n")
+    return head, [line.rpartition(" : ")[2] for line in words.splitlines()]
+
+# Milliseconds to write report.txt, the old way and from the statistics kept
+# up to date, as the crawl grows. Both have to write the same report.
+def main(sizes, tokens_per_link, subdomains):
+    rng = random.Random(0)
+    data = scraper.ScraperData
+    with scratch_dir():
+        data.open_checkpoint("checkpoint")
+        for links in sizes:
+            fill(data, links, links * tokens_per_link, subdomains, rng)
+            old_time = best_of(lambda: old_report_generator(data))
+            old = read_report()
+            new_time = best_of(report_generator)
+            assert read_report() == old, "report_generator and the old report differ"
+            report(f"old report, {links:,} pages", old_time * 1000, "ms")
+            report(f"live report, {links:,} pages", new_time * 1000, "ms")
+        data.close_checkpoint()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Time to write report.txt as the crawl grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="unique links")
+    parser.add_argument("--tokens_per_link", type=int, default=10, help="distinct tokens per unique link")
+    parser.add_argument("--subdomains", type=int, default=500)
+    args = parser.parse_args()
+    main(args.sizes, args.tokens_per_link, args.subdomains)
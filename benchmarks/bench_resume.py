@@ -0,0 +1,59 @@
+import logging
+import shelve
+import shutil
+import time
+from argparse import ArgumentParser
+
+from benchmarks import bench_config, scratch_dir, report
+from crawler.frontier import Frontier
+from utils import get_urlhash, HASH_VERSION
+
+
+# Save file of a crawl that has discovered urls urls over hosts hosts and
+# downloaded the given fraction of them.
+def write_save_file(config, urls, hosts, downloaded):
+    with shelve.open(config.save_file) as save:
+        done = int(urls * downloaded)
+        for i in range(urls):
+            url = f"https://h{i % hosts}.ics.uci.edu/page{i}"
+            save[get_urlhash(url)] = (url, i < done)
+    with open(f"{config.save_file}.hashversion", 'w') as file:
+        file.write(str(HASH_VERSION))
+
+# Seconds until the frontier is built, and until every pending url is in it.
+def timed_resume(config):
+    start = time.perf_counter()
+    frontier = Frontier(config, False)
+    started = time.perf_counter() - start
+    if frontier.loading:
+        frontier.loader.join()
+    loaded = time.perf_counter() - start
+    frontier.close()
+    return started, loaded
+
+# Startup time of a saved crawl, scanning the whole save file as the frontier
+# used to and reading the resume index, which needs only the pending urls and
+# loads most of them in the background.
+def main(urls, hosts, downloaded):
+    logging.disable(logging.INFO)
+    with scratch_dir():
+        config = bench_config(save_file="frontier.shelve", seed_urls=[], stats_interval=0)
+        write_save_file(config, urls, hosts, downloaded)
+        # The first start builds the seen set, which both ways have afterwards.
+        Frontier(config, False).close()
+
+        shutil.rmtree(f"{config.save_file}.pending")
+        started, _ = timed_resume(config)
+        report(f"save file scan, {urls:,} urls", started, "s")
+
+        started, loaded = timed_resume(config)
+        report(f"resume index, {urls:,} urls, first urls", started, "s")
+        report(f"resume index, {urls:,} urls, all loaded", loaded, "s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Frontier startup time, save file scan against the resume index.")
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--downloaded", type=float, default=0.5, help="fraction of the urls already downloaded")
+    args = parser.parse_args()
+    main(args.urls, args.hosts, args.downloaded)
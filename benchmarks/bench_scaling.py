@@ -0,0 +1,36 @@
+import multiprocessing
+from argparse import ArgumentParser
+
+from benchmarks import report
+from benchmarks.bench_workers import crawl
+from benchmarks.cache_server import CacheServer, Site
+
+
+# Pages per second of the threaded workers crawling the same site with each
+# THREADCOUNT. Every host of the site is on ics.uci.edu, which used to be a
+# single worker's domain however many threads there were. With hosts
+# scheduled over every worker, throughput should grow with the threads until
+# the per-host politeness delay is the limit.
+def main(hosts, pages_per_host, latency, threads, politeness):
+    site = Site(hosts, pages_per_host)
+    context = multiprocessing.get_context("spawn")
+    limit = hosts / max(politeness, latency)
+    print(f"{hosts} hosts, at most {limit:,.0f} pages/s with a {politeness}s politeness delay")
+    for count in threads:
+        with CacheServer(site, latency) as server, context.Pool(1) as pool:
+            pages, elapsed, p50, p99 = pool.apply(
+                crawl, ("threaded", server.address, site, count, 1, politeness))
+            missed = set(site.urls()) - set(server.requests)
+            repeated = [url for url, requests in server.requests.items() if requests > 1]
+            assert not missed and not repeated, f"{count} threads: {len(missed)} pages missed, {len(repeated)} fetched twice"
+        report(f"THREADCOUNT={count}, pages/s", pages / elapsed, "pages/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Crawl throughput against the number of worker threads.")
+    parser.add_argument("--hosts", type=int, default=40)
+    parser.add_argument("--pages_per_host", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the cache server takes per request")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--politeness", type=float, default=0.1)
+    args = parser.parse_args()
+    main(args.hosts, args.pages_per_host, args.latency, args.threads, args.politeness)
@@ -0,0 +1,62 @@
+import random
+import time
+from argparse import ArgumentParser
+
+from benchmarks import report
+from scraper_data import SIMILARITY_THRESHOLD
+from simhash import SimhashIndex, FINGERPRINT_BITS, max_bit_distance, hamming_distance
+
+# Lookups timed at each corpus size, fewer for the much slower linear scan.
+LOOKUPS = 2000
+LINEAR_LOOKUPS = 200
+
+
+# The near-duplicate check the index replaced: a scan over every fingerprint.
+def linear_similar(fingerprints, fingerprint):
+    for other in fingerprints:
+        if hamming_distance(fingerprint, other) < SIMILARITY_THRESHOLD:
+            return True
+    return False
+
+# Microseconds per lookup, half of them a few bits away from a stored
+# fingerprint (hits) and half random (misses, the common case).
+def lookup_micros(similar, stored, rng, k, lookups=LOOKUPS):
+    queries = []
+    for i in range(lookups):
+        fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+        if i % 2:
+            fingerprint = rng.choice(stored)
+            for bit in rng.sample(range(FINGERPRINT_BITS), k):
+                fingerprint ^= 1 << bit
+        queries.append(fingerprint)
+    start = time.perf_counter()
+    for fingerprint in queries:
+        similar(fingerprint)
+    return (time.perf_counter() - start) / lookups * 1000000
+
+# Lookup latency of the simhash index and of the linear scan as the number of
+# pages grows. The index should stay flat, the scan grows with the corpus.
+def main(max_pages, max_linear):
+    rng = random.Random(0)
+    k = max_bit_distance(SIMILARITY_THRESHOLD, FINGERPRINT_BITS)
+    index = SimhashIndex(bits=FINGERPRINT_BITS, k=k)
+    stored = []
+    size = 1000
+    while size <= max_pages:
+        while len(stored) < size:
+            fingerprint = rng.getrandbits(FINGERPRINT_BITS)
+            stored.append(fingerprint)
+            index.add(fingerprint)
+        report(f"index lookup, {size:,} pages", lookup_micros(index.near, stored, rng, k), "us")
+        if size <= max_linear:
+            report(f"linear scan, {size:,} pages",
+                   lookup_micros(lambda fingerprint: linear_similar(stored, fingerprint), stored, rng, k,
+                                 LINEAR_LOOKUPS), "us")
+        size *= 10
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Near-duplicate lookup latency against corpus size.")
+    parser.add_argument("--max_pages", type=int, default=1000000)
+    parser.add_argument("--max_linear", type=int, default=10000)
+    args = parser.parse_args()
+    main(args.max_pages, args.max_linear)
@@ -0,0 +1,91 @@
+import random
+import time
+from argparse import ArgumentParser
+from threading import Thread
+
+from benchmarks import report
+from utils.telemetry import Telemetry, PERCENTILES
+
+# Stages a crawled page is timed in, about as many as Worker.run and
+# scraper.scraper time for one page.
+STAGES = ("worker.crawl_delay", "worker.robots", "worker.download", "worker.scrape", "scraper.parse",
+          "scraper.similar", "scraper.merge", "frontier.add_urls", "frontier.complete", "frontier.get_tbd_url")
+
+
+# Microseconds per call of function(stage) over calls calls, less the cost of
+# the loop calling it.
+def call_micros(function, calls):
+    def loop(function):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function("worker.download")
+        return time.perf_counter() - start
+    return (loop(function) - loop(lambda stage: None)) / calls * 1000000
+
+def timed(telemetry):
+    def time_stage(stage):
+        with telemetry.timer(stage):
+            pass
+    return time_stage
+
+# Records per second into the same histograms from threads threads at once.
+def threaded_records(telemetry, threads, records):
+    def record():
+        for i in range(records):
+            telemetry.record(STAGES[i % len(STAGES)], 0.001)
+
+    workers = [Thread(target=record) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * records / (time.perf_counter() - start)
+
+# Largest error, relative to the exact value, of each reported percentile of
+# samples log-normal latencies around median_ms.
+def percentile_errors(samples, median_ms, rng):
+    telemetry = Telemetry()
+    latencies = sorted(rng.lognormvariate(0, 1.5) * median_ms / 1000 for _ in range(samples))
+    for seconds in latencies:
+        telemetry.record("worker.download", seconds)
+    histogram = telemetry.histogram("worker.download")
+    errors = dict()
+    for percentile in PERCENTILES:
+        exact = latencies[max(int(samples * percentile / 100) - 1, 0)]
+        errors[percentile] = abs(histogram.percentile(percentile) - exact) / exact
+    return errors
+
+# Cost of telemetry to the crawl: each call per stage, recording from many
+# threads, how far the histogram percentiles are from the exact ones, and
+# the time to build the stats log line and the /metrics page.
+def main(calls, threads, samples, median_ms):
+    telemetry = Telemetry()
+    report("telemetry.timer", call_micros(timed(telemetry), calls), "us/call")
+    report("telemetry.record", call_micros(lambda stage: telemetry.record(stage, 0.001), calls), "us/call")
+    report("telemetry.count", call_micros(telemetry.count, calls), "us/call")
+    report(f"record, {threads} threads", threaded_records(telemetry, threads, calls // threads), "records/s")
+    for percentile, error in percentile_errors(samples, median_ms, random.Random(0)).items():
+        report(f"p{percentile} error", error * 100, "%")
+        # Half a bucket, a bucket being 1 / SUB_BUCKETS of its values.
+        assert error < 0.02, f"p{percentile} is {error:.1%} off"
+    for stage in STAGES:
+        for _ in range(1000):
+            telemetry.record(stage, 0.001)
+    telemetry.gauge("queue_depth", lambda: {f"h{host}.ics.uci.edu": host for host in range(100)})
+    start = time.perf_counter()
+    line = telemetry.summary(telemetry.started_at, 0)[0]
+    report("stats log line", (time.perf_counter() - start) * 1000, "ms")
+    start = time.perf_counter()
+    metrics = telemetry.metrics()
+    report("/metrics page", (time.perf_counter() - start) * 1000, "ms")
+    assert all(stage in line and stage in metrics for stage in STAGES)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Per-call cost and percentile accuracy of the crawl telemetry.")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--samples", type=int, default=100000, help="latencies recorded for the percentiles")
+    parser.add_argument("--median_ms", type=float, default=50.0, help="median latency recorded")
+    args = parser.parse_args()
+    main(args.calls, args.threads, args.samples, args.median_ms)
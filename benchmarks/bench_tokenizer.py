@@ -0,0 +1,109 @@
+import os
+import random
+import time
+from argparse import ArgumentParser
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+from benchmarks import report
+from benchmarks.cache_server import VOCABULARY
+from tokenizer import STOP_WORDS, tokenize, count_tokens, computeWordFrequencies
+
+
+# The tokenizer before TOKEN_PATTERN and count_tokens: a character at a time,
+# with the stop word set built again for every word checked.
+def old_stop_word(word):
+    stop_words = set(STOP_WORDS)
+    return word in stop_words
+
+def old_tokenize(website):
+    toks = []
+    tok = ''
+    for char in website:
+        if ("a" <= char <= "z" or "A" <= char <= "Z" or
+            "0" <= char <= "9" or
+            char == "'" or char == "’"):
+            tok += char
+        else:
+            if tok != '':
+                if not old_stop_word(tok):
+                    toks.append(tok.lower())
+                tok = ''
+    return toks
+
+def old_computeWordFrequencies(toks, freq):
+    count = 0
+    for token in toks:
+        if not old_stop_word(token):
+            freq[token] += 1
+            count += 1
+    return count
+
+# Text of the pages (any files) in a directory, as the scraper tokenizes it.
+def saved_texts(directory):
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                texts.append(BeautifulSoup(file.read(), "lxml").get_text())
+    return texts
+
+# Page texts of English-like words: stop words in any case, words with
+# apostrophes, numbers and punctuation.
+def generated_texts(pages, words, seed=0):
+    rng = random.Random(seed)
+    stop_words = sorted(STOP_WORDS)
+    texts = []
+    for _ in range(pages):
+        parts = []
+        for _ in range(words):
+            kind = rng.random()
+            if kind < 0.4:
+                word = rng.choice(stop_words)
+            elif kind < 0.45:
+                word = str(rng.randrange(10000))
+            else:
+                word = rng.choice(VOCABULARY)
+            if rng.random() < 0.1:
+                word = word.capitalize()
+            parts.append(word + rng.choice(" " * 8 + ",.;\n"))
+        texts.append("".join(parts))
+    return texts
+
+def old_count(text):
+    freq = Counter()
+    old_computeWordFrequencies(old_tokenize(text), freq)
+    return freq
+
+def new_count(text):
+    freq = Counter()
+    computeWordFrequencies(count_tokens(text), freq)
+    return freq
+
+# Megabytes of text per second through a tokenizer, over every text.
+def throughput(function, texts):
+    start = time.perf_counter()
+    for text in texts:
+        function(text)
+    return sum(len(text) for text in texts) / (time.perf_counter() - start) / 1e6
+
+# Tokenizing and word counting throughput of the old tokenizer and the current
+# one, after checking that both give the same tokens and counts on every page.
+def main(texts):
+    for text in texts:
+        assert tokenize(text) == old_tokenize(text), "tokenize differs from the old tokenizer"
+        assert new_count(text) == old_count(text), "count_tokens differs from the old word counts"
+    report(f"old tokenize, {len(texts):,} pages", throughput(old_tokenize, texts), "MB/s")
+    report(f"tokenize, {len(texts):,} pages", throughput(tokenize, texts), "MB/s")
+    report("old tokenize + word counts", throughput(old_count, texts), "MB/s")
+    report("count_tokens + word counts", throughput(new_count, texts), "MB/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Tokenizer throughput, old against current.")
+    parser.add_argument("--pages_dir", help="directory of saved pages, generated pages if not given")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--words", type=int, default=2000, help="words per generated page")
+    args = parser.parse_args()
+    main(saved_texts(args.pages_dir) if args.pages_dir else generated_texts(args.pages, args.words))
@@ -0,0 +1,101 @@
+import os
+import random
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from itertools import accumulate
+
+from benchmarks import scratch_dir, report
+from scraper_data import ScraperData, PageCounts, MERGE_PAGES
+
+# Tokens the report lists.
+REPORT_TOKENS = 50
+
+
+# Batches of MERGE_PAGES pages as the threads merge them. Tokens are drawn
+# from a Zipf distribution over the vocabulary, and a junk fraction of them
+# are numbers and ids seen once, which is what makes all_tokens grow
+# without bound.
+def batches(pages, words, vocabulary, junk, seed=0):
+    rng = random.Random(seed)
+    ranks = range(vocabulary)
+    weights = list(accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+    junk_words = int(words * junk)
+    for start in range(0, pages, MERGE_PAGES):
+        counts = PageCounts()
+        for _ in range(MERGE_PAGES):
+            # New strings every time, as tokens of a parsed page are.
+            counts.tokens.update(f"word{rank}" for rank in rng.choices(ranks, cum_weights=weights, k=words - junk_words))
+            counts.tokens.update(str(rng.getrandbits(40)) for _ in range(junk_words))
+        counts.pages = MERGE_PAGES
+        yield counts
+
+# Size in bytes of the files under a directory.
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(directory) for name in names)
+
+# Merge every batch of make_work() into a ScraperData counting tokens
+# exactly, or in a TopCounts of capacity tokens when sketch is (epsilon,
+# delta). Returns (tokens per second, bytes of memory the counts took, bytes
+# of checkpoint, the top tokens). The memory is traced in a second run, with
+# the batches made as they are merged, so only what the counts keep is in it.
+def count(make_work, capacity, sketch):
+    def run(work):
+        data = ScraperData()
+        if sketch is not None:
+            data.approximate_tokens(capacity, *sketch)
+        for counts in work:
+            data.merge(counts)
+        data.write_checkpoint()
+        return data
+
+    work = list(make_work())
+    tokens = sum(sum(counts.tokens.values()) for counts in work)
+    with scratch_dir() as directory:
+        start = time.perf_counter()
+        data = run(work)
+        elapsed = time.perf_counter() - start
+        top = data.get_top_tokens(REPORT_TOKENS)
+        checkpoint = directory_size(directory)
+        data.close_checkpoint()
+    del work
+    with scratch_dir():
+        tracemalloc.start()
+        data = run(make_work())
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        data.close_checkpoint()
+    return tokens / elapsed, memory, checkpoint, top
+
+# Speed, memory, checkpoint size and report accuracy of exact token counts
+# against TOKENCOUNTS approximate, as the crawl grows. The approximate top
+# tokens are compared with the exact ones: how many of the top 50 match and
+# the largest overcount among them.
+def main(sizes, words, vocabulary, junk, capacity, epsilon, delta):
+    for pages in sizes:
+        make_work = lambda: batches(pages, words, vocabulary, junk)
+        exact_rate, exact_memory, exact_checkpoint, exact_top = count(make_work, capacity, None)
+        rate, memory, checkpoint, top = count(make_work, capacity, (epsilon, delta))
+        exact = dict(exact_top)
+        overcount = max((estimate - exact[token]) / exact[token] for token, estimate in top if token in exact)
+        report(f"exact, {pages:,} pages", exact_rate, "tokens/s")
+        report("exact, memory", exact_memory / 2 ** 20, "MiB")
+        report("exact, checkpoint", exact_checkpoint / 2 ** 20, "MiB")
+        report(f"approximate, {pages:,} pages", rate, "tokens/s")
+        report("approximate, memory", memory / 2 ** 20, "MiB")
+        report("approximate, checkpoint", checkpoint / 2 ** 20, "MiB")
+        report("approximate, top 50 matching", len(exact.keys() & dict(top).keys()), "tokens")
+        report("approximate, top 50 overcount", overcount * 100, "%")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Exact token counts against the count-min sketch and top tokens.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="pages counted")
+    parser.add_argument("--words", type=int, default=300, help="tokens per page")
+    parser.add_argument("--vocabulary", type=int, default=200000)
+    parser.add_argument("--junk", type=float, default=0.1, help="fraction of tokens seen once")
+    parser.add_argument("--capacity", type=int, default=1000, help="TOPTOKENS")
+    parser.add_argument("--epsilon", type=float, default=0.0001, help="SKETCHERROR")
+    parser.add_argument("--delta", type=float, default=0.001, help="SKETCHFAILURE")
+    args = parser.parse_args()
+    main(args.sizes, args.words, args.vocabulary, args.junk, args.capacity, args.epsilon, args.delta)
@@ -0,0 +1,100 @@
+import random
+import time
+from argparse import ArgumentParser
+
+from benchmarks import scratch_dir, best_of, report
+from benchmarks.cache_server import Site
+from scraper_data import CHECKPOINT_PAGES
+from trap_detector import TrapDetector
+
+
+# Urls of the traps a crawl runs into, each an endless supply of pages: a
+# calendar with a page per day, a listing paged by number, session ids in the
+# query and relative links that keep nesting the same path.
+def trap_urls(count, rng):
+    urls = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            urls.append(f"https://www.ics.uci.edu/calendar/{2000 + i // 365}/{i % 12 + 1}/{i % 28 + 1}/")
+        elif kind == 1:
+            urls.append(f"https://wiki.ics.uci.edu/doku.php/start?page={i}&sort=asc")
+        elif kind == 2:
+            urls.append(f"https://www.cs.uci.edu/news?jsessionid={rng.getrandbits(64):x}")
+        else:
+            urls.append("https://www.stat.uci.edu" + "/people/faculty" * (i % 10 + 1) + f"/{i}")
+    return urls
+
+# A crawl's fetches: every page of a site, shuffled with trap_count trap urls.
+def crawl(site, trap_count, seed=0):
+    rng = random.Random(seed)
+    pages = site.urls()
+    traps = trap_urls(trap_count, rng)
+    urls = pages + traps
+    rng.shuffle(urls)
+    return urls, set(pages)
+
+# (pages admitted, trap urls admitted, admits per second) of a detector over a crawl.
+def admit_all(detector, urls, pages):
+    start = time.perf_counter()
+    admitted = [url for url in urls if detector.admit(url)]
+    elapsed = time.perf_counter() - start
+    kept = sum(1 for url in admitted if url in pages)
+    return kept, len(admitted) - kept, len(urls) / elapsed
+
+# Milliseconds per checkpoint of a detector already holding max_entries hosts
+# and templates, rounds checkpoints of CHECKPOINT_PAGES new pages each, the
+# full counters written once first.
+def checkpoint_ms(detector, template_limit, max_entries, rounds=20):
+    detector.open_checkpoint("checkpoint")
+    with detector.lock:
+        detector.host_deltas.update(detector.hosts)
+        detector.template_deltas.update(detector.templates)
+    detector.write_checkpoint()
+    elapsed = 0.0
+    for round in range(rounds):
+        for page in range(CHECKPOINT_PAGES):
+            detector.admit(f"https://h{max_entries + round}.ics.uci.edu/page{page}")
+        start = time.perf_counter()
+        detector.write_checkpoint()
+        elapsed += time.perf_counter() - start
+    return elapsed / rounds * 1000
+
+# Fetches spent on traps with and without the detector, which must keep every
+# page of the site, how fast it admits urls, how its memory stays bounded as
+# the number of hosts grows and how long its checkpoint takes to write and read.
+def main(hosts, pages_per_host, traps, template_limit, max_entries):
+    site = Site(hosts, pages_per_host)
+    urls, pages = crawl(site, traps)
+    report("trap fetches, no detector", traps, "urls")
+    kept, trapped, rate = admit_all(TrapDetector(template_limit=template_limit), urls, pages)
+    assert kept == len(pages), f"the detector dropped {len(pages) - kept} pages of the site"
+    report(f"trap fetches, TRAPTEMPLATELIMIT={template_limit}", trapped, "urls")
+    report("TrapDetector.admit", rate, "urls/s")
+
+    many_hosts = [f"https://h{i}.ics.uci.edu/page{i % 7}" for i in range(max_entries * 5)]
+    bounded = TrapDetector(template_limit=template_limit, max_entries=max_entries)
+    for url in many_hosts:
+        bounded.admit(url)
+    assert len(bounded.hosts) <= max_entries and len(bounded.templates) <= max_entries
+    report(f"entries after {len(many_hosts):,} hosts", len(bounded.hosts) + len(bounded.templates), "entries")
+
+    with scratch_dir():
+        report("checkpoint write", checkpoint_ms(bounded, template_limit, max_entries), "ms/checkpoint")
+        recovered = TrapDetector(template_limit=template_limit, max_entries=max_entries)
+        recovered.open_checkpoint("checkpoint")
+        report("checkpoint read", best_of(recovered.read_checkpoint, 1) * 1000, "ms")
+        assert (recovered.hosts, recovered.templates) == (bounded.hosts, bounded.templates), \
+            "the checkpoint recovered other counts"
+        bounded.close_checkpoint()
+        recovered.close_checkpoint()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Fetches the trap detector saves, its speed and its memory bound.")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages_per_host", type=int, default=500)
+    parser.add_argument("--traps", type=int, default=100000, help="trap urls mixed into the crawl")
+    parser.add_argument("--template_limit", type=int, default=500, help="TRAPTEMPLATELIMIT")
+    parser.add_argument("--max_entries", type=int, default=100000, help="TRAPMEMORY")
+    args = parser.parse_args()
+    main(args.hosts, args.pages_per_host, args.traps, args.template_limit, args.max_entries)
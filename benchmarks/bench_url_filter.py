@@ -0,0 +1,113 @@
+import random
+import re
+import time
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from benchmarks import report
+from benchmarks.cache_server import Site
+from url_filter import UrlFilter
+
+
+# The url checks before UrlFilter, from scraper.py and scraper_helper.py: the
+# rules rebuilt on every call and the extension regex matched from scratch.
+def old_is_trap(parsed):
+    max_rec_archives = {"format=": 0, "format=mat": 0, "format=nonmat": 0, "att=": 0}
+    disallowed_queries = {"download", "login", "edit", "do=download", "do=login", "do=edit, action=download", "action=login", "action=edit", "do=backlink"}
+    allowed_schemes = {"http", "https"}
+    if parsed.path.startswith("/~eppstein/pix") or parsed.path.startswith("/~eppstein/pubs/pubs.sh") or parsed[:6] == "mailto" or parsed.scheme not in allowed_schemes:
+        return True
+    query_params = parsed.query.split('&')
+    for param in query_params:
+        for query in disallowed_queries:
+            if query in param:
+                return True
+        if parsed.netloc.endswith("archive.ics.uci.edu") and param in max_rec_archives:
+            max_rec_archives[param] += 1
+            if max_rec_archives[param] > 1000:
+                return True
+    return False
+
+def old_wrong_ending(parsed):
+    allowed_domains = [".informatics.uci.edu", ".stat.uci.edu", ".ics.uci.edu", ".cs.uci.edu"]
+    for domain in allowed_domains:
+        if parsed.netloc.endswith(domain):
+            return False
+    return True
+
+def old_is_valid(url):
+    try:
+        parsed = urlparse(url)._replace(fragment='')
+        if old_is_trap(parsed) or old_wrong_ending(parsed):
+            return False
+        elif re.match(
+            r".*\.(css|js|bmp|gif|jpe?g|ico"
+            + r"|png|tiff?|mid|mp2|mp3|mp4"
+            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+            + r"|epub|dll|cnf|tgz|sha1"
+            + r"|thmx|mso|arff|rtf|jar|csv"
+            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|img|mpg|ppsx)$", parsed.path.lower()):
+            return False
+        return True
+    except TypeError:
+        print("TypeError for ", parsed)
+        raise
+
+# Link lists of pages of a site, each page linking to the site's navigation,
+# some of its pages and a few urls the filter drops: other domains, files,
+# downloads and logins, trap paths.
+def link_lists(pages, links, seed=0):
+    rng = random.Random(seed)
+    site = Site(hosts=20, pages_per_host=500)
+    urls = site.urls()
+    navigation = [f"https://www.ics.uci.edu/{section}/" for section in ("about", "people", "research", "grad", "ugrad")]
+    dropped = [
+        "https://www.google.com/search?q=uci", "mailto:someone@ics.uci.edu", "ftp://ftp.ics.uci.edu/pub/",
+        "https://www.ics.uci.edu/~eppstein/pix/album/1.html", "https://wiki.ics.uci.edu/doku.php/start?do=login",
+        "https://www.stat.uci.edu/files/report.PDF", "https://www.cs.uci.edu/slides/lecture1.pptx",
+        "https://archive.ics.uci.edu/dataset/1?action=download", "https://ics.uci.edu/",
+    ]
+    lists = []
+    for _ in range(pages):
+        page = list(navigation)
+        for _ in range(links - len(navigation)):
+            kind = rng.random()
+            if kind < 0.1:
+                page.append(rng.choice(dropped) if rng.random() < 0.5 else f"{rng.choice(dropped)}#{rng.randrange(1000)}")
+            else:
+                page.append(f"{rng.choice(urls)}?id={rng.randrange(100)}" if kind < 0.3 else rng.choice(urls))
+        lists.append(page)
+    return lists
+
+def old_filter_links(urls):
+    return [url for url in urls if old_is_valid(url)]
+
+# Urls per second through filter_links, a page's link list at a time.
+def throughput(filter_links, lists):
+    start = time.perf_counter()
+    for urls in lists:
+        filter_links(urls)
+    return sum(len(urls) for urls in lists) / (time.perf_counter() - start)
+
+# Urls per second of the old is_valid and of a fresh UrlFilter, on every url
+# once (nothing cached) and on the link lists of a crawl, where most links
+# repeat. Both have to keep the same urls.
+def main(pages, links):
+    lists = link_lists(pages, links)
+    unique = [[url] for url in dict.fromkeys(url for urls in lists for url in urls)]
+    url_filter = UrlFilter()
+    for [url] in unique:
+        assert url_filter.is_valid(url) == old_is_valid(url), f"UrlFilter and the old is_valid differ on {url}"
+    report(f"old is_valid, {len(unique):,} distinct urls", throughput(old_filter_links, unique), "urls/s")
+    report("UrlFilter.is_valid, uncached", throughput(UrlFilter().filter_links, unique), "urls/s")
+    report(f"old is_valid, {pages:,} pages of links", throughput(old_filter_links, lists), "urls/s")
+    report(f"UrlFilter.filter_links, {pages:,} pages", throughput(UrlFilter().filter_links, lists), "urls/s")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Url filtering throughput, the old is_valid against UrlFilter.")
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--links", type=int, default=60, help="links per page")
+    args = parser.parse_args()
+    main(args.pages, args.links)
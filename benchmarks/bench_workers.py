@@ -0,0 +1,80 @@
+import logging
+import multiprocessing
+import time
+from argparse import ArgumentParser
+
+from benchmarks import bench_config, scratch_dir, report
+from benchmarks.cache_server import CacheServer, Site
+
+# Workers crawled with: the threaded Worker with one download at a time and
+# with --in_flight of them (PREFETCH), and the AsyncWorker with --in_flight
+# of them (ASYNCINFLIGHT).
+MODES = ("threaded", "prefetch", "async")
+
+
+# Mark every host of the site as having no robots.txt and already read
+# sitemaps, so the crawl only talks to the local cache server.
+def warm_caches(config, site):
+    from crawler.robots import get_robots_cache
+    from crawler.sitemaps import get_sitemap_cache
+    robots_cache = get_robots_cache(config)
+    sitemap_cache = get_sitemap_cache(config, robots_cache)
+    for host in site.hosts:
+        key = f"https://{host}"
+        robots_cache.entries[key] = (time.time(), 404, [])
+        robots_cache.parsers[key] = robots_cache._build_parser(404, [])
+        sitemap_cache.checked[key] = time.time()
+
+# Crawl the site from a fresh process, returns (pages, seconds, p50 and p99
+# of a page in milliseconds).
+def crawl(mode, address, site, threads, in_flight, politeness):
+    logging.disable(logging.INFO)
+    import scraper
+    from crawler import Crawler
+    from crawler.worker import Worker
+    from crawler.async_worker import AsyncWorker
+    from utils.telemetry import telemetry
+    with scratch_dir():
+        config = bench_config(
+            cache_server=address, seed_urls=site.seed_urls(), threads_count=threads, time_delay=politeness,
+            prefetch=in_flight if mode == "prefetch" else 1, async_in_flight=in_flight,
+            head_check=False, page_store_size=0, stats_interval=0, metrics_port=0)
+        scraper.configure(config, restart=True)
+        warm_caches(config, site)
+        crawler = Crawler(config, True, worker_factory=AsyncWorker if mode == "async" else Worker)
+        start = time.perf_counter()
+        crawler.start()
+        elapsed = time.perf_counter() - start
+        crawler.close()
+        scraper.shutdown()
+    page = telemetry.histogram("worker.page")
+    return telemetry.counters["pages"], elapsed, page.percentile(50) * 1000, page.percentile(99) * 1000
+
+# Pages per second of the threaded Worker, one download at a time and with
+# PREFETCH of them, and of the AsyncWorker, crawling the same site from a
+# local cache server. Every page has to be downloaded exactly once.
+def main(hosts, pages_per_host, latency, threads, in_flight, politeness):
+    site = Site(hosts, pages_per_host)
+    # Each crawl gets a new interpreter, the caches and ScraperData are per process.
+    context = multiprocessing.get_context("spawn")
+    for mode in MODES:
+        with CacheServer(site, latency) as server, context.Pool(1) as pool:
+            pages, elapsed, p50, p99 = pool.apply(
+                crawl, (mode, server.address, site, threads, in_flight, politeness))
+            missed = set(site.urls()) - set(server.requests)
+            repeated = [url for url, count in server.requests.items() if count > 1]
+            assert not missed and not repeated, f"{mode}: {len(missed)} pages missed, {len(repeated)} fetched twice"
+        report(f"{mode}, pages/s", pages / elapsed, "pages/s")
+        report(f"{mode}, page p50", p50, "ms")
+        report(f"{mode}, page p99", p99, "ms")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Crawl throughput of the worker kinds against a local cache server.")
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--pages_per_host", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the cache server takes per request")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--in_flight", type=int, default=20, help="PREFETCH and ASYNCINFLIGHT")
+    parser.add_argument("--politeness", type=float, default=0.05)
+    args = parser.parse_args()
+    main(args.hosts, args.pages_per_host, args.latency, args.threads, args.in_flight, args.politeness)
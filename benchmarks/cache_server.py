@@ -0,0 +1,160 @@
+import pickle
+import random
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlsplit, parse_qs
+
+import cbor
+
+# Words the synthetic pages are written with. Every page draws its own, so no
+# two pages are near duplicates of each other.
+VOCABULARY = [f"word{i}" for i in range(5000)]
+
+
+class RawResponse(object):
+    # What the cache server pickles into the "response" of its answers, the
+    # part of it the scraper reads.
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+
+
+class Site(object):
+    # A crawlable site of pages_per_host pages on each of hosts subdomains of
+    # ics.uci.edu. Every page links to the next one on its host, to the first
+    # page of the next host and to a few random pages, so the whole site is
+    # reachable from the first page.
+    def __init__(self, hosts=20, pages_per_host=50, links=10, words=400, seed=0):
+        self.hosts = [f"h{host}.ics.uci.edu" for host in range(hosts)]
+        self.pages_per_host = pages_per_host
+        self.links = links
+        self.words = words
+        self.seed = seed
+
+    def url(self, host, page):
+        return f"https://{self.hosts[host]}/page{page}"
+
+    def urls(self):
+        return [self.url(host, page) for host in range(len(self.hosts)) for page in range(self.pages_per_host)]
+
+    def seed_urls(self):
+        return [self.url(0, 0)]
+
+    # HTML of a url of the site, None if there is no such page.
+    def page(self, url):
+        parsed = urlsplit(url)
+        if parsed.netloc not in self.hosts or not parsed.path.startswith("/page"):
+            return None
+        host = self.hosts.index(parsed.netloc)
+        try:
+            page = int(parsed.path[len("/page"):])
+        except ValueError:
+            return None
+        if not 0 <= page < self.pages_per_host:
+            return None
+        rng = random.Random(f"{self.seed} {url}")
+        hrefs = [self.url(host, (page + 1) % self.pages_per_host), self.url((host + 1) % len(self.hosts), 0)]
+        hrefs += [self.url(rng.randrange(len(self.hosts)), rng.randrange(self.pages_per_host))
+                  for _ in range(self.links)]
+        paragraphs = []
+        for start in range(0, self.words, 50):
+            paragraphs.append(" ".join(rng.choice(VOCABULARY) for _ in range(min(50, self.words - start))))
+        body = "".join(f"<p>{text}</p>" for text in paragraphs)
+        body += "".join(f'<a href="{href}">{href}</a>' for href in hrefs)
+        return f"<html><head><title>{url}</title></head><body>{body}</body></html>".encode("utf-8")
+
+
+class CacheServer(object):
+    # Local stand-in for the course cache server, answering
+    # GET /?q=<url>&u=<user agent> the same way, a cbor map with the url, the
+    # status and the pickled response, after latency seconds, or slow_latency
+    # seconds for a slow_fraction of the urls. Runs on a thread of its own, on
+    # 127.0.0.1 and a free port.
+    def __init__(self, site, latency=0.0, slow_fraction=0.0, slow_latency=0.0):
+        self.site = site
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.lock = Lock()
+        # key: url, value: GET requests for it
+        self.requests = Counter()
+        self.heads = 0
+        # key: host, value: GET requests for it being answered
+        self.active = Counter()
+        # Most GET requests answered at once, for any one host and in all.
+        self.max_host_active = 0
+        self.max_active = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), CacheHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.cache_server = self
+        self.address = self.httpd.server_address
+
+    def __enter__(self):
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Seconds the answer for a url takes, the same for a url every time.
+    def latency_of(self, url):
+        if self.slow_fraction and random.Random(f"slow {url}").random() < self.slow_fraction:
+            return self.slow_latency
+        return self.latency
+
+    # cbor body of the answer for a url, after its latency.
+    def answer(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            self.requests[url] += 1
+            self.active[host] += 1
+            self.max_host_active = max(self.max_host_active, self.active[host])
+            self.max_active = max(self.max_active, sum(self.active.values()))
+        try:
+            delay = self.latency_of(url)
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self.lock:
+                self.active[host] -= 1
+        content = self.site.page(url)
+        if content is None:
+            return cbor.dumps({"url": url, "status": 404, "error": f"No such page: {url}."})
+        return cbor.dumps({"url": url, "status": 200, "response": pickle.dumps(RawResponse(url, content))})
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real server. The headers and the body are written
+    # separately, without TCP_NODELAY a reused connection waits out the
+    # client's delayed ACK on every response.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_HEAD(self):
+        cache_server = self.server.cache_server
+        with cache_server.lock:
+            cache_server.heads += 1
+        self._wait()
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        url = parse_qs(urlsplit(self.path).query).get("q", [""])[0]
+        body = self.server.cache_server.answer(url)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _wait(self):
+        if self.server.cache_server.latency:
+            time.sleep(self.server.cache_server.latency)
+
+    # Requests are not logged to stderr.
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,240 @@
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from itertools import islice
+from threading import Lock
+
+# First bytes of every segment file.
+MAGIC = b"SCRAPER1"
+# A segment is a series of blocks, one per flush. A block starts with the
+# number of records in it and the length in bytes of their keys, followed by
+# the keys (utf-8, separated by SEPARATOR) and then the values (unsigned
+# 64-bit, little-endian), so a block is decoded with one split and one copy.
+BLOCK = struct.Struct("<II")
+SEPARATOR = "\0"
+# Records a compacted log is written out in per block.
+BLOCK_RECORDS = 1 << 16
+# The current segment is closed, and a new one started, past this size.
+SEGMENT_BYTES = 16 << 20
+# A log is compacted once it holds this many records per live key, and at
+# least COMPACT_MIN records, so compacting costs O(1) per record appended.
+COMPACT_FACTOR = 4
+COMPACT_MIN = 100000
+# name.sequence.log for appended records, name.sequence.base for a compacted log.
+SEGMENT_NAME = re.compile(r"(.+)\.(\d{8})\.(log|base)$")
+
+
+def encode_block(keys, values):
+    key_text = SEPARATOR.join(keys)
+    if key_text.count(SEPARATOR) != len(keys) - 1:
+        raise ValueError("Checkpoint keys can not contain NUL characters.")
+    key_bytes = key_text.encode("utf-8")
+    value_array = array("Q", values)
+    if sys.byteorder == "big":
+        value_array.byteswap()
+    return BLOCK.pack(len(keys), len(key_bytes)) + key_bytes + value_array.tobytes()
+
+
+# The blocks of a segment file as (keys, values), read through a memory map.
+# A block cut short by a crash ends the segment.
+def read_segment(path):
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size <= len(MAGIC):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if view[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a checkpoint segment.")
+            offset = len(MAGIC)
+            while offset + BLOCK.size <= size:
+                count, key_length = BLOCK.unpack_from(view, offset)
+                start = offset + BLOCK.size
+                middle = start + key_length
+                end = middle + 8 * count
+                if end > size or count == 0:
+                    break
+                values = array("Q")
+                values.frombytes(view[middle:end])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                yield view[start:middle].decode("utf-8").split(SEPARATOR), values
+                offset = end
+
+
+class CheckpointLog(object):
+    # An append-only log of (key, value) records in segment files of a
+    # directory, keys are strings and values unsigned 64-bit integers.
+    # Records are buffered and written out by flush(). A log whose
+    # records add up, such as token counts, can be compacted into a base
+    # segment holding the totals, and everything before it is deleted.
+    # Reopening a log always starts a new segment, so a record torn by a
+    # crash is never followed by new ones in the same file.
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.lock = Lock()
+        # Records not written out yet: blocks encoded by the caller, then the
+        # keys and values appended since the last of them.
+        self.blocks = []
+        self.keys = []
+        self.values = []
+        self.file = None
+        self.size = 0
+        segments = self.segments()
+        self.next_sequence = segments[-1][0] + 1 if segments else 0
+        # Records since the last base, counted by read() and flush().
+        self.records = 0
+
+    # (sequence, kind, path) of every segment of the log, oldest first.
+    def segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        segments = []
+        for file_name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(file_name)
+            if match is not None and match.group(1) == self.name:
+                segments.append((int(match.group(2)), match.group(3), os.path.join(self.directory, file_name)))
+        return sorted(segments)
+
+    def exists(self):
+        return bool(self.segments())
+
+    def append(self, key, value):
+        with self.lock:
+            self.keys.append(key)
+            self.values.append(value)
+
+    def extend(self, items):
+        with self.lock:
+            for key, value in items:
+                self.keys.append(key)
+                self.values.append(value)
+
+    # Append a block of records from encode_block(), encoded before the
+    # caller took whatever lock orders its appends with its totals.
+    def append_block(self, block):
+        with self.lock:
+            self._end_block()
+            self.blocks.append(block)
+
+    # Write the buffered records to the current segment.
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    # Replace the whole log with a base segment of items, which has to cover
+    # every record appended so far, or with started, from start_compaction(),
+    # every record appended before it.
+    def compact(self, items, started=None):
+        items = iter(items)
+        blocks = iter(lambda: list(islice(items, BLOCK_RECORDS)), [])
+        self.compact_blocks((([key for key, _ in block], [value for _, value in block]) for block in blocks), started)
+
+    # compact() for records already split into blocks of (keys, values), as
+    # read() yields them.
+    def compact_blocks(self, blocks, started=None):
+        sequence, records = self.start_compaction() if started is None else started
+        path = self._path(sequence, "base")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(MAGIC)
+            for keys, values in blocks:
+                if keys:
+                    file.write(encode_block(keys, values))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+        # A crash from here on leaves older segments behind, read() skips them.
+        with self.lock:
+            for older, _, older_path in self.segments():
+                if older < sequence:
+                    os.remove(older_path)
+            self.records = max(self.records - records, 0)
+
+    # Cut the log for a compaction: what was appended so far is written out
+    # and the base gets the next sequence, so records appended while it is
+    # written go into segments after it. Called under whatever lock keeps
+    # the totals the base is made of in step with the appends, the base
+    # itself is written without it. Returns (sequence, records cut).
+    def start_compaction(self):
+        with self.lock:
+            self._flush()
+            self._close()
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            return sequence, self.records
+
+    def needs_compaction(self, live_keys):
+        return self.records >= COMPACT_MIN and self.records > COMPACT_FACTOR * live_keys
+
+    # Every block of records of the log as (keys, values), in order,
+    # starting at the last base.
+    def read(self):
+        for _, keys, values in self.read_blocks():
+            yield keys, values
+
+    # read(), each block with whether it is from the base, whose keys are
+    # each there once, as (base, keys, values).
+    def read_blocks(self):
+        segments = self.segments()
+        bases = [index for index, (_, kind, _) in enumerate(segments) if kind == "base"]
+        self.records = 0
+        for sequence, kind, path in segments[bases[-1] if bases else 0:]:
+            for keys, values in read_segment(path):
+                if kind == "log":
+                    self.records += len(keys)
+                yield kind == "base", keys, values
+
+    # Delete the log, for a crawl started over from the seeds.
+    def clear(self):
+        with self.lock:
+            self.blocks = []
+            self.keys = []
+            self.values = []
+            self._close()
+            for _, _, path in self.segments():
+                os.remove(path)
+            self.records = 0
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self._close()
+
+    def _path(self, sequence, kind):
+        return os.path.join(self.directory, f"{self.name}.{sequence:08d}.{kind}")
+
+    # The caller holds self.lock. The keys and values appended so far become
+    # a block after the blocks before them.
+    def _end_block(self):
+        if self.keys:
+            self.blocks.append(encode_block(self.keys, self.values))
+            self.keys = []
+            self.values = []
+
+    # The caller holds self.lock.
+    def _flush(self):
+        self._end_block()
+        if not self.blocks:
+            return
+        if self.file is None or self.size >= SEGMENT_BYTES:
+            self._close()
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self._path(self.next_sequence, "log"), "wb")
+            self.file.write(MAGIC)
+            self.next_sequence += 1
+            self.size = len(MAGIC)
+        data = b"".join(self.blocks)
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+        self.records += sum(BLOCK.unpack_from(block)[0] for block in self.blocks)
+        self.blocks = []
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
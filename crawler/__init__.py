@@ -1,20 +1,26 @@
 from utils import get_logger
+from utils.telemetry import telemetry, TelemetryReporter
 from crawler.frontier import Frontier
+from crawler.robots import get_robots_cache
 from crawler.worker import Worker
 
 
 class Crawler(object):
-    def __init__(self, config, restart, domains, frontier_factory=Frontier, worker_factory=Worker):
+    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
-        self.domains = domains
+        # Queue depths and lock waits of the frontier go with the stage timings.
+        telemetry.gauge("queue_depth", self.frontier.queue_depths)
+        telemetry.gauge("lock_wait_ms", lambda: {
+            name: stats["wait_ms"] for name, stats in self.frontier.lock_stats().items() if stats["contended"]})
+        self.reporter = TelemetryReporter(config)
 
     def start_async(self):
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier, self.domains[worker_id])
+            self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
@@ -26,3 +32,11 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+
+    # Persist the frontier and the robots.txt files fetched since the robots
+    # cache was last saved once crawling is over.
+    def close(self):
+        self.reporter.close()
+        self.logger.info(f"Telemetry: {telemetry.summary(telemetry.started_at, 0)[0]}")
+        get_robots_cache(self.config).save()
+        self.frontier.close()
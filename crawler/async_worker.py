@@ -0,0 +1,99 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from crawler.worker import Worker
+from utils.download import download_async
+from utils.telemetry import telemetry
+import scraper
+
+
+class AsyncWorker(Worker):
+    # Drop-in replacement for Worker, pass it as Crawler(worker_factory=AsyncWorker).
+    # Instead of a pool of PREFETCH download threads, the thread runs an event
+    # loop that keeps up to config.async_in_flight downloads open against the
+    # cache server. Politeness is kept per hostname by the frontier's
+    # scheduler, so many subdomains of the same domain are fetched at the same time.
+    def __init__(self, worker_id, config, frontier):
+        super().__init__(worker_id, config, frontier)
+        self.max_in_flight = config.async_in_flight
+
+    def run(self):
+        asyncio.run(self.crawl())
+
+    async def crawl(self):
+        loop = asyncio.get_running_loop()
+        # robots.txt and sitemap lookups and frontier updates are still blocking,
+        # give them enough threads.
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_in_flight))
+        in_flight = set()
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while True:
+                # Top up the in-flight downloads from the frontier.
+                while len(in_flight) < self.max_in_flight:
+                    tbd_url = self.frontier.get_tbd_url(self.worker_id)
+                    if not tbd_url:
+                        break
+                    in_flight.add(asyncio.create_task(self.process(tbd_url, session)))
+
+                if not in_flight:
+                    if self.all_empty():
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    # Other workers may still add urls, check back when a host is ready.
+                    await asyncio.sleep(self.idle_delay())
+                    continue
+
+                # With room for more, also wake up for hosts that become ready.
+                timeout = self.idle_delay() if len(in_flight) < self.max_in_flight else None
+                _, in_flight = await asyncio.wait(
+                    in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    # Download, scrape and complete a single url.
+    async def process(self, tbd_url, session):
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        # The host is ours until the download starts, the scheduler then keeps
+        # the next one from starting before the robots.txt Crawl-delay is over.
+        with telemetry.timer("worker.crawl_delay"):
+            delay = await loop.run_in_executor(None, self.politeness_delay, tbd_url)
+        self.frontier.started(self.worker_id, tbd_url, delay)
+        try:
+            # Check if URL is allowed by robots.txt before downloading.
+            with telemetry.timer("worker.robots"):
+                allowed = await loop.run_in_executor(None, self.is_allowed_robots, tbd_url)
+            if allowed:
+                with telemetry.timer("worker.download"):
+                    resp = await download_async(tbd_url, self.config, session, self.logger)
+                telemetry.count(f"status_{resp.status}")
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+
+                # Extract URLs from the downloaded content and add them to the frontier.
+                # Parsing runs off the event loop, in a parser process when PARSERPROCESSES is set.
+                with telemetry.timer("worker.scrape"):
+                    scraped_urls = await loop.run_in_executor(None, scraper.scraper, tbd_url, resp)
+                # The frontier takes its locks and can wait on the journal's
+                # group commit, off the event loop too.
+                with telemetry.timer("frontier.add_urls"):
+                    await loop.run_in_executor(None, self.frontier.add_urls, scraped_urls)
+                with telemetry.timer("frontier.complete"):
+                    await loop.run_in_executor(None, self.frontier.mark_url_complete, tbd_url)
+            else:
+                telemetry.count("robots_disallowed")
+                self.logger.info(f"{tbd_url} is not allowed by robots.txt")
+
+            # Add URLs from the sitemap to the frontier.
+            with telemetry.timer("worker.sitemaps"):
+                await loop.run_in_executor(None, self.add_sitemap_urls, tbd_url)
+        except Exception as e:
+            telemetry.count("errors")
+            self.logger.error(f"Error processing {tbd_url}: {e}")
+        finally:
+            self.frontier.finished(self.worker_id, tbd_url)
+            telemetry.count("pages")
+            telemetry.record("worker.page", time.perf_counter() - started_at)
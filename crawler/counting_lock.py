@@ -0,0 +1,42 @@
+import time
+from threading import Lock, RLock
+
+
+class CountingLock(object):
+    # A Lock (or RLock with reentrant=True) that counts how often it was
+    # taken, how often a thread had to wait for it and for how long, so lock
+    # contention can be read off stats(). Works as the lock of a Condition
+    # when it is not reentrant.
+    def __init__(self, name, reentrant=False):
+        self.name = name
+        self._lock = RLock() if reentrant else Lock()
+        self.acquired = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.acquired += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        # Only updated while the lock is held, so the counters need no lock of their own.
+        self.acquired += 1
+        self.contended += 1
+        self.wait_time += time.perf_counter() - start
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *args):
+        self.release()
+
+    def stats(self):
+        return {"acquired": self.acquired, "contended": self.contended,
+                "wait_ms": round(self.wait_time * 1000, 3)}
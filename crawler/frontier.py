@@ -1,60 +1,96 @@
 import os
+import glob
 import shelve
+import shutil
 
-from threading import Thread, RLock, Condition
-from queue import Queue, Empty
+from threading import Thread, RLock
+from collections import defaultdict
+from itertools import islice
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urlhash, normalize, HASH_VERSION
+from utils.canonical import set_tracking_params, TRACKING_PARAMS
+from utils.telemetry import telemetry
+from crawler.journal import FrontierJournal
+from crawler.seen_set import SeenSet
+from crawler.resume_index import ResumeIndex
+from crawler.frontier_queue import make_queue, HOST_WEIGHT
+from crawler.shard import FrontierShard
+from crawler.scheduler import HostScheduler
 from scraper import is_valid
 
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
 
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.shelf_lock = RLock()
-        self.lock = RLock()
-        self.inf_lock = RLock()
-        self.stat_lock = RLock()
-        self.ics_lock = RLock()
-        self.cs_lock = RLock()
-        self.is_multithreaded = False if self.config.threads_count == 1 else True
-        
-        if self.is_multithreaded:
-            self.domains = {
-                ".informatics.uci.edu": [],
-                ".stat.uci.edu": [],
-                ".ics.uci.edu": [],
-                ".cs.uci.edu": [],
-            }
-
-            # Condition variables for each domain.
-            self.conditions = {  
-                ".informatics.uci.edu": Condition(self.lock),
-                ".stat.uci.edu": Condition(self.lock),
-                ".ics.uci.edu": Condition(self.lock),
-                ".cs.uci.edu": Condition(self.lock),
-            }
+        # Query parameters stripped by normalize.
+        set_tracking_params(self.config.tracking_params or TRACKING_PARAMS)
+
+        # Urls to be downloaded, a shard per domain with its own lock and a
+        # queue per host, FIFO or by priority (config QUEUE). Its persistence
+        # partition is the domain's file in the resume index.
+        self.shards = {
+            domain: FrontierShard(domain, lambda: make_queue(self.config), self.config.host_in_flight)
+            for domain in (".informatics.uci.edu", ".stat.uci.edu", ".ics.uci.edu", ".cs.uci.edu")}
+        # Hands the hosts with urls to download to the workers. With priority
+        # queues, the ready host with the best next url and the fewest pages
+        # downloaded goes first.
+        if self.config.frontier_queue == "priority":
+            self.scheduler = HostScheduler(self.config.threads_count, self._head_score, HOST_WEIGHT)
         else:
-            self.to_be_downloaded = list()
+            self.scheduler = HostScheduler(self.config.threads_count)
 
-        if not os.path.exists(self.config.save_file) and not restart:
+        save_files = self._save_files()
+        if not save_files and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif save_files and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+            for path in save_files:
+                os.remove(path)
+        self.journal_file = f"{self.config.save_file}.log"
+        self.seen_file = f"{self.config.save_file}.seen"
+        # Version of get_urlhash the saved crawl was hashed with.
+        self.hash_version_file = f"{self.config.save_file}.hashversion"
+        for path in (self.journal_file, self.seen_file, f"{self.seen_file}.bloom", self.hash_version_file):
+            if restart and os.path.exists(path):
+                os.remove(path)
+        # Pending urls by domain, so a restart only reads what is left to download.
+        self.index = ResumeIndex(f"{self.config.save_file}.pending")
+        if restart and os.path.exists(self.index.directory):
+            shutil.rmtree(self.index.directory)
+        # True while the rest of the pending urls are loaded in the background.
+        self.loading = False
+        # The save file is opened on first use, see save below.
+        self._save = None
+        self.save_lock = RLock()
+        # Hashes of every url seen so far, checked instead of the save file.
+        seen_is_new = not os.path.exists(self.seen_file)
+        self.seen = SeenSet(self.seen_file, bloom_bits=self.config.seen_bloom_bits)
+        # Changes go through the journal, which replays the last run's log.
+        self.journal = FrontierJournal(
+            self.journal_file, lambda: self.save, self.config, self.logger,
+            on_commit=lambda urlhashes: self.seen.commit(urlhashes), on_checkpoint=self._write_index)
+        if not restart and self._saved_hash_version() != HASH_VERSION:
+            self._rehash()
+            seen_is_new = False
+        with open(self.hash_version_file, 'w') as file:
+            file.write(str(HASH_VERSION))
+        if seen_is_new and not restart:
+            # Save file from before the seen set existed, its keys are the url hashes.
+            self.seen.commit(list(self.save.keys()))
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
+        elif self.index.exists():
+            # Start on the pending urls right away, the rest streams in.
+            self._resume_from_index()
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
@@ -62,6 +98,66 @@ class Frontier(object):
                 for url in self.config.seed_urls:
                     self.add_url(url)
 
+    # Load existing save file, or create one if it does not exist. Opening a
+    # large one takes seconds, and resuming from the index does not need it.
+    @property
+    def save(self):
+        with self.save_lock:
+            if self._save is None:
+                self._save = shelve.open(self.config.save_file)
+            return self._save
+
+    # Files the save file is kept in, the shelve's dbm may add .dat, .dir and
+    # .bak (dbm.dumb) or .db to its name.
+    def _save_files(self):
+        return [path for path in glob.glob(f"{glob.escape(self.config.save_file)}*")
+                if path == self.config.save_file or path.rsplit(".", 1)[-1] in ("dat", "dir", "bak", "db")]
+
+    def _saved_hash_version(self):
+        try:
+            with open(self.hash_version_file) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return None
+
+    # Redo every url hash of a crawl saved with an older get_urlhash, so the
+    # seen set and the save file agree with the new one. Urls that now
+    # normalize to the same url are merged, completed if either one was.
+    def _rehash(self):
+        with self.journal.lock:
+            saved = dict(self.save.items())
+            for urlhash, value in self.journal.changes.items():
+                if value[1] or urlhash not in saved:
+                    saved[urlhash] = value
+            rehashed = dict()
+            for url, completed in saved.values():
+                url = normalize(url)
+                urlhash = get_urlhash(url)
+                rehashed[urlhash] = (url, completed or rehashed.get(urlhash, (url, False))[1])
+            self.logger.info(
+                f"Rehashing {len(saved)} saved urls into {len(rehashed)} "
+                f"with url hash version {HASH_VERSION}.")
+
+            # Start the save file, seen set and resume index over, deleting
+            # keys one by one from a dbm.dumb save file is quadratic.
+            self._save.close()
+            self._save = None
+            for path in self._save_files():
+                os.remove(path)
+            for urlhash, value in rehashed.items():
+                self.save[urlhash] = value
+            self.journal.changes.clear()
+            self.journal.checkpoint(notify=False)
+
+            self.seen.close()
+            for path in (self.seen_file, f"{self.seen_file}.bloom"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.seen = SeenSet(self.seen_file, bloom_bits=self.config.seen_bloom_bits)
+            self.seen.commit(list(rehashed))
+            if os.path.exists(self.index.directory):
+                shutil.rmtree(self.index.directory)
+
     def get_domain(self, url):
         domain = '#' + urlparse(url)._replace(fragment='').netloc
         if domain.endswith(".informatics.uci.edu") or domain.endswith("#informatics.uci.edu"):
@@ -76,61 +172,232 @@ class Frontier(object):
     
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
+        # Only used when there is no resume index yet, it reads every saved url.
+        with self.journal.lock:
+            saved = dict(self.save.items())
+            for urlhash, value in self.journal.changes.items():
+                if value[1] or urlhash not in saved:
+                    saved[urlhash] = value
+        total_count = len(saved)
         tbd_count = 0
-        for url, completed in self.save.values():
+        pending = defaultdict(list)
+        for urlhash, (url, completed) in saved.items():
             if not completed and is_valid(url):
-                if self.is_multithreaded:
-                    domain = self.get_domain(url)
-                    with self.conditions[domain]:
-                        self.domains[domain].append(url)
-                        self.conditions[domain].notify()
-                else:
-                    self.to_be_downloaded.append(url)
-                tbd_count += 1
+                domain = self.get_domain(url)
+                if domain is not None:
+                    pending[domain].append((urlhash, url))
+                    tbd_count += 1
+        for partition, urls in pending.items():
+            self._push(self.shards[partition], [url for _, url in urls])
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
-    def has_urls(self, domain):
-        return len(self.domains[domain]) > 0
+        # Write the resume index so the next start does not need this scan.
+        with self.journal.lock:
+            self.index.rewrite(pending, set(), self.journal.epoch)
+            self.journal.checkpoint(notify=False)
 
-    def get_tbd_url(self, domain):
-        try:
-            if self.is_multithreaded:
-                if self.domains[domain]:
-                        with self.conditions[domain]:
-                            return self.domains[domain].pop(0)
-                return None
+    def _resume_from_index(self):
+        if self.index.manifest()["epoch"] == self.journal.epoch:
+            # The log was already written into the index before the last run stopped.
+            self.journal.checkpoint(notify=False)
+
+        # Urls logged since the index was written are not in it yet.
+        completed = set()
+        logged = defaultdict(list)
+        for urlhash, (url, done) in list(self.journal.changes.items()):
+            if done:
+                completed.add(urlhash)
+            elif is_valid(url) and self.get_domain(url) is not None:
+                logged[self.get_shard(url)].append(url)
+        for shard, urls in logged.items():
+            self._push(shard, urls)
+        tbd_count = sum(len(urls) for urls in logged.values())
+
+        # Load the first urls of every domain now, so workers have something
+        # to start on, and stream in the rest from a background thread. The
+        # index can't be rewritten while it is being read.
+        counts = {partition: count for partition, count in self.index.counts().items() if partition in self.shards}
+        readers = [(partition, self.index.read(partition)) for partition in counts]
+        for partition, reader in readers:
+            tbd_count += self._load_pending(partition, islice(reader, 1000), completed)
+        self.logger.info(
+            f"Loaded {tbd_count} urls to be downloaded, the rest of the "
+            f"{sum(counts.values())} in the resume index are loading in the background.")
+        self.journal.hold = True
+        self.loading = True
+        self.loader = Thread(target=self._load_index, args=(readers, completed), daemon=True)
+        self.loader.start()
+
+    def _load_index(self, readers, completed):
+        loaded = 0
+        for partition, reader in readers:
+            loaded += self._load_pending(partition, reader, completed)
+        # Open the save file here, rather than in the first checkpoint.
+        self.save
+        with self.journal.lock:
+            self.journal.hold = False
+        self.loading = False
+        self.logger.info(f"Finished loading {loaded} more urls to be downloaded.")
+
+    # Push a partition's pending urls to its shard, a thousand at a time.
+    def _load_pending(self, partition, urls, completed):
+        shard = self.shards[partition]
+        loaded = 0
+        batch = []
+        for urlhash, url in urls:
+            if urlhash not in completed and is_valid(url):
+                batch.append(url)
+                if len(batch) >= 1000:
+                    self._push(shard, batch)
+                    loaded += len(batch)
+                    batch = []
+        self._push(shard, batch)
+        return loaded + len(batch)
+
+    # Writes the resume index at each journal checkpoint.
+    def _write_index(self, changes, epoch):
+        added = defaultdict(list)
+        completed = set()
+        for urlhash, (url, done) in changes.items():
+            if done:
+                completed.add(urlhash)
             else:
-                return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
-                
-    
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            if self.is_multithreaded:
                 domain = self.get_domain(url)
                 if domain is not None:
-                    with self.conditions[domain]:
-                        self.save[urlhash] = (url, False)
-                        self.save.sync()
-                        self.domains[domain].append(url)
-                        self.conditions[domain].notify()
+                    added[domain].append((urlhash, url))
+        self.index.rewrite(added, completed, epoch)
+
+    # Shard of a url's domain, the url has to be in one of the crawled domains.
+    def get_shard(self, url):
+        return self.shards[self.get_domain(url)]
+
+    # Score of a scheduled host's next url, a host with none left goes first
+    # so the worker that takes it drops it right away.
+    def _head_score(self, host, name):
+        score = self.shards[name].head_score(host)
+        return float("-inf") if score is None else score
+
+    # Queue urls of one shard and schedule the hosts that had none queued.
+    def _push(self, shard, urls):
+        if not urls:
+            return
+        by_host = defaultdict(list)
+        for url in urls:
+            by_host[urlsplit(url).netloc].append(url)
+        # Counted first, so the frontier never looks empty while they are pushed.
+        self.scheduler.added(len(urls))
+        hosts = shard.push(by_host)
+        self.scheduler.schedule([(host, shard.name) for host in hosts])
+
+    def has_urls(self, domain):
+        return len(self.shards[domain]) > 0
+
+    # Whether every url has been downloaded, none is queued or being downloaded.
+    def is_empty(self):
+        return self.scheduler.is_empty()
+
+    # Seconds until the next host is ready, None if no url is queued.
+    def next_ready(self):
+        return self.scheduler.next_ready()
+
+    # Next url for a worker, from a host whose politeness delay is over. None
+    # if no host is ready. The worker then calls started() and, once the url
+    # is done, finished().
+    def get_tbd_url(self, worker_id):
+        with telemetry.timer("frontier.get_tbd_url"):
+            return self._take_url(worker_id)
+
+    def _take_url(self, worker_id):
+        while True:
+            taken = self.scheduler.take(worker_id)
+            if taken is None:
+                return None
+            host, name = taken
+            tbd_url = self.shards[name].pop(host)
+            if tbd_url is not None:
+                return tbd_url
+            # Nothing left to download from the host.
+            if self.shards[name].release(host):
+                self.scheduler.resume(worker_id, host, name)
+
+    # The download of a url from get_tbd_url is starting. Its host can be
+    # downloaded from again after delay seconds, by up to HOSTINFLIGHT
+    # downloads at a time.
+    def started(self, worker_id, url, delay):
+        host = urlsplit(url).netloc
+        shard = self.get_shard(url)
+        self.scheduler.started(host, delay)
+        if shard.start(host):
+            self.scheduler.resume(worker_id, host, shard.name)
+
+    # A worker is done with a url it started: its links are added and it is
+    # marked complete, or it failed.
+    def finished(self, worker_id, url):
+        host = urlsplit(url).netloc
+        shard = self.get_shard(url)
+        if shard.finish(host):
+            self.scheduler.resume(worker_id, host, shard.name)
+        self.scheduler.added(-1)
+
+    def add_url(self, url):
+        self.add_urls([url])
+
+    # Add the links of a page. Urls that are not valid or outside the crawled
+    # domains are dropped. The rest are normalized and hashed before any lock
+    # is taken, then the seen set, the journal and each shard are locked once
+    # for the whole batch, rather than once per url.
+    def add_urls(self, urls):
+        urls = [normalize(url) for url in urls]
+        urls = [url for url in urls if is_valid(url) and self.get_domain(url) is not None]
+        urlhashes = [get_urlhash(url) for url in urls]
+        added = self.seen.add_many(urlhashes)
+        new = []
+        new_urls = defaultdict(list)
+        seen_urls = defaultdict(lambda: defaultdict(list))
+        for url, urlhash, is_new in zip(urls, urlhashes, added):
+            shard = self.get_shard(url)
+            if is_new:
+                new.append((urlhash, url))
+                new_urls[shard].append(url)
             else:
-                self.to_be_downloaded.append(url)
-    
+                seen_urls[shard][urlsplit(url).netloc].append(url)
+        if new:
+            self.journal.add_many(new)
+        for shard, shard_urls in new_urls.items():
+            self._push(shard, shard_urls)
+        for shard, by_host in seen_urls.items():
+            shard.touch(by_host)
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
+        if urlhash not in self.seen:
             # This should not happen.
             self.logger.error(
                 f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+        self.journal.complete(urlhash, url)
+
+    # Urls queued in each shard, and urls queued or being downloaded in all.
+    def queue_depths(self):
+        depths = {name: len(shard) for name, shard in self.shards.items()}
+        depths["outstanding"] = self.scheduler.outstanding
+        return depths
+
+    # Acquisitions, contended acquisitions and total wait in milliseconds of
+    # every frontier lock, by lock name.
+    def lock_stats(self):
+        locks = [shard.lock for shard in self.shards.values()]
+        locks += [self.seen.lock, self.journal.lock]
+        stats = {lock.name: lock.stats() for lock in locks}
+        stats.update(self.scheduler.lock_stats())
+        return stats
+
+    # Write out everything still buffered by the journal and close the save file.
+    def close(self):
+        self.logger.info(f"Lock contention: {self.lock_stats()}")
+        self.journal.close()
+        self.seen.close()
+        if self._save is not None:
+            self._save.close()
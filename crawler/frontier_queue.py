@@ -0,0 +1,120 @@
+import heapq
+import math
+import re
+
+from collections import deque
+from itertools import count
+from urllib.parse import urlsplit
+
+# Weights of the priority score, a lower score is downloaded first.
+# HOST_WEIGHT is the weight of the host freshness term the scheduler adds.
+DEPTH_WEIGHT = 1.0
+INLINK_WEIGHT = 2.0
+HOST_WEIGHT = 0.5
+TRAP_WEIGHT = 8.0
+
+# Url shapes that usually come from crawler traps: calendars, dated archives,
+# sorting and paging parameters, session ids.
+TRAP_PATTERN = re.compile(
+    r"(\d{4}[-/]\d{1,2}([-/]\d{1,2})?|calendar|ical|[?&](sort|order|filter|page|sessionid|sid|share|replytocom)=)",
+    re.IGNORECASE)
+
+
+class FifoQueue(object):
+    # Urls in the order they were found, with O(1) push and pop.
+    def __init__(self):
+        self.urls = deque()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def push(self, url):
+        self.urls.append(url)
+
+    # Raises IndexError when empty, like list.pop.
+    def pop(self):
+        return self.urls.popleft()
+
+    # Another link to a queued url, the order does not depend on it.
+    def touch(self, url):
+        pass
+
+
+class PriorityQueue(object):
+    # Heap of urls ordered by a score, with O(log n) push, pop and touch. The
+    # score adds up, each with its weight above:
+    #   depth:  number of path segments and query parameters of the url,
+    #   in-links: links to the url found while it waited (lowers the score),
+    #   trap likelihood: 0 to 1, from the url's length, repeated path
+    #           segments and trap-like patterns.
+    # Ties pop in the order the urls were pushed. A touched url is pushed
+    # again with its new score, and its old entry is skipped when popped.
+    # Queues hold the urls of one host, the scheduler orders the hosts by the
+    # score of their next url and by how fresh the host is.
+    def __init__(self):
+        self.heap = []
+        self.order = count()
+        # key: url, value: its live heap entry [score, order, url, in-links]
+        self.entries = dict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, url, inlinks=0):
+        entry = [self.score(url, inlinks), next(self.order), url, inlinks]
+        self.entries[url] = entry
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        while self.heap:
+            _, _, url, _ = heapq.heappop(self.heap)
+            if url is not None:
+                del self.entries[url]
+                return url
+        raise IndexError("pop from an empty queue")
+
+    # Score of the url pop() returns next, None when empty.
+    def head_score(self):
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def touch(self, url):
+        entry = self.entries.get(url)
+        if entry is not None:
+            # Leave the old entry in the heap, pop() skips it.
+            entry[2] = None
+            self.push(url, entry[3] + 1)
+
+    def score(self, url, inlinks=0):
+        parsed = urlsplit(url)
+        segments = [segment for segment in parsed.path.split('/') if segment]
+        depth = len(segments) + (parsed.query.count('&') + 1 if parsed.query else 0)
+        return (DEPTH_WEIGHT * depth
+                - INLINK_WEIGHT * math.log2(1 + inlinks)
+                + TRAP_WEIGHT * trap_likelihood(url, segments))
+
+
+# Rough chance (0 to 1) that a url is part of a crawler trap.
+def trap_likelihood(url, segments=None):
+    if segments is None:
+        segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    likelihood = 0.0
+    if len(url) > 200:
+        likelihood += 0.4
+    if len(segments) != len(set(segments)):
+        likelihood += 0.4
+    if TRAP_PATTERN.search(url):
+        likelihood += 0.3
+    return min(likelihood, 1.0)
+
+
+QUEUES = {
+    "fifo": FifoQueue,
+    "priority": PriorityQueue,
+}
+
+# New empty queue of the kind set by config.frontier_queue.
+def make_queue(config):
+    return QUEUES[config.frontier_queue]()
@@ -0,0 +1,214 @@
+import json
+import os
+import time
+import uuid
+
+from threading import Thread, Event
+
+from utils.telemetry import telemetry
+from crawler.counting_lock import CountingLock
+
+# Record types in the journal. Every log starts with an EPOCH record naming it.
+ADDED = "A"
+COMPLETED = "C"
+EPOCH = "E"
+
+
+class FrontierJournal(object):
+    # Write-behind persistence for the frontier shelve. Adds and completions
+    # are appended to an append-only log and group committed: the pending
+    # records are written out together once config.journal_group_size of them
+    # have built up, or config.journal_group_ms milliseconds after the first
+    # one, whichever comes first. Every config.journal_checkpoint records the
+    # log is folded into the shelve (the snapshot) with a single sync and
+    # truncated. On startup the log is read back into self.changes, which the
+    # frontier replays on top of the snapshot.
+    #
+    # Crash safety is set with config.journal_sync:
+    #   flush: a commit is handed to the OS, so it survives the crawler
+    #          crashing but not the machine going down.
+    #   fsync: a commit is on disk once it returns.
+    # Either way, at most the last uncommitted group (journal_group_size
+    # records or journal_group_ms of changes) can be lost. A group size of 1
+    # commits every change on its own.
+    #
+    # on_commit, if given, is called with the url hashes of the adds in each
+    # commit (and in the replayed log), once they are safely in the log.
+    # on_checkpoint, if given, is called with the changes and the epoch of the
+    # log right before they are folded into the shelve. Checkpoints are put
+    # off while self.hold is set. open_save returns the shelve, it is only
+    # called when a checkpoint needs it. Messages go to the frontier's logger.
+    def __init__(self, log_file, open_save, config, logger, on_commit=None, on_checkpoint=None):
+        self.logger = logger
+        self.log_file = log_file
+        self.open_save = open_save
+        self.group_size = max(config.journal_group_size, 1)
+        self.group_interval = config.journal_group_ms / 1000
+        self.fsync = config.journal_sync == "fsync"
+        self.checkpoint_size = config.journal_checkpoint
+        self.on_commit = on_commit
+        self.on_checkpoint = on_checkpoint
+        self.hold = False
+        self.lock = CountingLock("journal", reentrant=True)
+        # key: urlhash, value: (url, completed) for changes not in the shelve yet
+        self.changes = dict()
+        # Encoded records waiting for the next group commit, and the url hashes they add.
+        self.pending = []
+        self.pending_added = []
+        self.first_pending_at = None
+        # Number of records in the log file, and the log's name.
+        self.logged = 0
+        self.epoch = None
+
+        self._replay()
+        if self.epoch is None:
+            self._start_log()
+        else:
+            self.file = open(self.log_file, 'a', encoding='utf-8')
+        self.stopped = Event()
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def add(self, urlhash, url):
+        self._record(ADDED, urlhash, url)
+
+    # add() for a list of (urlhash, url). The records are encoded before the
+    # lock is taken, and the lock is taken once.
+    def add_many(self, records):
+        lines = [json.dumps([ADDED, urlhash, url]) + "\n" for urlhash, url in records]
+        with self.lock:
+            for urlhash, url in records:
+                self._apply(ADDED, urlhash, url)
+                self.pending_added.append(urlhash)
+            self.pending.extend(lines)
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            if len(self.pending) >= self.group_size:
+                self._commit()
+
+    def complete(self, urlhash, url):
+        self._record(COMPLETED, urlhash, url)
+
+    # Fold the changes into the shelve now. With notify=False on_checkpoint is
+    # skipped, for changes the frontier has already written elsewhere.
+    def checkpoint(self, notify=True):
+        with self.lock:
+            self._commit()
+            self._checkpoint(notify)
+
+    # Commit everything, fold it into the shelve and stop the flusher.
+    def close(self):
+        self.stopped.set()
+        self.flusher.join()
+        with self.lock:
+            self._commit()
+            if not self.hold:
+                self._checkpoint()
+            self.file.close()
+
+    def _record(self, kind, urlhash, url):
+        with self.lock:
+            self._apply(kind, urlhash, url)
+            self.pending.append(json.dumps([kind, urlhash, url]) + "\n")
+            if kind == ADDED:
+                self.pending_added.append(urlhash)
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            if len(self.pending) >= self.group_size:
+                self._commit()
+
+    def _apply(self, kind, urlhash, url):
+        if kind == COMPLETED:
+            self.changes[urlhash] = (url, True)
+        else:
+            self.changes.setdefault(urlhash, (url, False))
+
+    # Write the changes into the shelve, an add never overrides a url that is already there.
+    def _fold(self):
+        with telemetry.timer("journal.fold"):
+            save = self.open_save()
+            for urlhash, value in self.changes.items():
+                if value[1] or urlhash not in save:
+                    save[urlhash] = value
+            save.sync()
+        self.changes.clear()
+
+    # Write the pending records to the log, the caller holds self.lock.
+    def _commit(self):
+        if not self.pending:
+            return
+        with telemetry.timer("journal.commit"):
+            self.file.write(''.join(self.pending))
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        self.logged += len(self.pending)
+        self.pending = []
+        self.first_pending_at = None
+        if self.on_commit is not None:
+            self.on_commit(self.pending_added)
+        self.pending_added = []
+        if self.logged >= self.checkpoint_size and not self.hold:
+            self._checkpoint()
+
+    # Fold the logged changes into the shelve and start a new log, the caller
+    # holds self.lock. A crash in between only means replaying the same
+    # changes again, which is harmless.
+    def _checkpoint(self, notify=True):
+        if notify and self.on_checkpoint is not None:
+            self.on_checkpoint(self.changes, self.epoch)
+        self._fold()
+        self.file.close()
+        self._start_log()
+
+    # Empty the log and give it a new epoch.
+    def _start_log(self):
+        self.epoch = uuid.uuid4().hex
+        self.file = open(self.log_file, 'w', encoding='utf-8')
+        self.file.write(json.dumps([EPOCH, self.epoch]) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.logged = 0
+
+    # Commits the pending group once it is journal_group_ms old.
+    def _flush_loop(self):
+        while not self.stopped.wait(self.group_interval):
+            with self.lock:
+                if (self.first_pending_at is not None
+                        and time.monotonic() - self.first_pending_at >= self.group_interval):
+                    self._commit()
+
+    # Read the log left by the previous run back into self.changes.
+    def _replay(self):
+        if not os.path.exists(self.log_file):
+            return
+        added = []
+        good_size = 0
+        with open(self.log_file, 'rb') as file:
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Unterminated record.")
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn write at the end of the log, from a crash mid-commit.
+                    break
+                good_size += len(line)
+                if record[0] == EPOCH:
+                    self.epoch = record[1]
+                    continue
+                kind, urlhash, url = record
+                self._apply(kind, urlhash, url)
+                if kind == ADDED:
+                    added.append(urlhash)
+                self.logged += 1
+        # Cut off the torn write so new records are not appended after it.
+        if good_size < os.path.getsize(self.log_file):
+            os.truncate(self.log_file, good_size)
+        if self.on_commit is not None:
+            self.on_commit(added)
+        if self.epoch is None and self.changes:
+            # A log from before epochs were written, fold it in right away.
+            self._fold()
+        self.logger.info(f"Replayed {self.logged} journal records from {self.log_file}.")
@@ -0,0 +1,82 @@
+import json
+import os
+
+# Partition for urls outside of the crawled domains.
+OTHER = "other"
+
+
+class ResumeIndex(object):
+    # The urls still to be downloaded, written next to the save file at every
+    # journal checkpoint so a restart does not have to scan the whole save
+    # file. Urls are kept in one file per domain as "urlhash url" lines, and
+    # the MANIFEST records the files, their url counts and the epoch of the
+    # journal log that was last folded in.
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, "MANIFEST")
+
+    def exists(self):
+        return os.path.exists(self.manifest_file)
+
+    def manifest(self):
+        if not self.exists():
+            return {"epoch": None, "partitions": dict()}
+        with open(self.manifest_file, encoding='utf-8') as file:
+            return json.load(file)
+
+    # key: partition, value: number of pending urls in it
+    def counts(self):
+        return {partition: info["count"] for partition, info in self.manifest()["partitions"].items()}
+
+    # Yield (urlhash, url) for the pending urls of a partition.
+    def read(self, partition):
+        info = self.manifest()["partitions"].get(partition)
+        if info is None:
+            return
+        with open(os.path.join(self.directory, info["file"]), encoding='utf-8') as file:
+            for line in file:
+                urlhash, _, url = line.rstrip('\n').partition(' ')
+                if url:
+                    yield urlhash, url
+
+    # Write the next snapshot: the urls of the current one minus the completed
+    # hashes, plus the newly added urls (key: partition, value: [(urlhash, url)]).
+    # The files of a snapshot are named after its generation, so the current
+    # ones are never overwritten: the single rename of the manifest switches
+    # over to the new files and epoch together, and a crash before it leaves
+    # the current snapshot as it was. The files it no longer lists are then
+    # deleted.
+    def rewrite(self, added, completed, epoch):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.manifest()
+        generation = manifest.get("generation", 0) + 1
+        partitions = dict()
+        for partition in set(manifest["partitions"]) | set(added):
+            file_name = f"{(partition or OTHER).strip('.')}.{generation}.txt"
+            count = 0
+            with open(os.path.join(self.directory, file_name), 'w', encoding='utf-8') as file:
+                for urlhash, url in self.read(partition):
+                    if urlhash not in completed:
+                        file.write(f"{urlhash} {url}\n")
+                        count += 1
+                for urlhash, url in added.get(partition, ()):
+                    if urlhash not in completed:
+                        file.write(f"{urlhash} {url}\n")
+                        count += 1
+            partitions[partition] = {"file": file_name, "count": count}
+
+        with open(f"{self.manifest_file}.tmp", 'w', encoding='utf-8') as file:
+            json.dump({"epoch": epoch, "generation": generation, "partitions": partitions}, file)
+        os.replace(f"{self.manifest_file}.tmp", self.manifest_file)
+        self._remove_unlisted({info["file"] for info in partitions.values()})
+
+    # Delete the partition files of older snapshots, and of a rewrite cut
+    # short by a crash. A file still open elsewhere is left for the next
+    # rewrite.
+    def _remove_unlisted(self, listed):
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".txt") and file_name not in listed:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    continue
@@ -0,0 +1,133 @@
+import os
+import pickle
+import time
+import urllib.error
+import urllib.request
+import urllib.robotparser
+
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+
+
+class RobotsCache(object):
+    # Parsed robots.txt files shared by all workers, keyed by scheme://netloc.
+    # Entries expire after config.robots_ttl seconds, or config.robots_error_ttl
+    # for hosts whose robots.txt could not be read (4xx, 5xx, network errors),
+    # and the least recently used one is dropped once config.robots_cache_size
+    # hosts are cached. The cache is saved to config.robots_file so a restart
+    # does not fetch every robots.txt again.
+    def __init__(self, config):
+        self.logger = get_logger("ROBOTS")
+        self.ttl = config.robots_ttl
+        self.error_ttl = config.robots_error_ttl
+        self.max_entries = config.robots_cache_size
+        self.save_file = config.robots_file
+        self.lock = Lock()
+        # key: scheme://netloc, value: (fetched_at, status, lines)
+        self.entries = OrderedDict()
+        # key: scheme://netloc, value: RobotFileParser built from the entry
+        self.parsers = dict()
+        self.unsaved = 0
+        self._load()
+
+    # Get the robots.txt parser for a url, fetching it if it is missing or expired.
+    def parser(self, url):
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self.entries.move_to_end(key)
+                return self.parsers[key]
+
+        # Fetch without holding the lock so other hosts are not held up.
+        status, lines = self._fetch(key)
+        rp = self._build_parser(status, lines)
+        with self.lock:
+            self.entries[key] = (time.time(), status, lines)
+            self.entries.move_to_end(key)
+            self.parsers[key] = rp
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                self.parsers.pop(old_key, None)
+            self.unsaved += 1
+            if self.unsaved >= 50:
+                self._save()
+        return rp
+
+    def can_fetch(self, url, useragent='*'):
+        return self.parser(url).can_fetch(useragent, url)
+
+    # Crawl-delay in seconds requested by the host's robots.txt, or None.
+    def crawl_delay(self, url, useragent='*'):
+        return self.parser(url).crawl_delay(useragent)
+
+    def _expired(self, entry):
+        fetched_at, status, _ = entry
+        ttl = self.ttl if status == 200 else self.error_ttl
+        return time.time() - fetched_at > ttl
+
+    # Download robots.txt for a scheme://netloc, returns (status, lines).
+    # Status 0 stands for a network error.
+    def _fetch(self, key):
+        try:
+            with urllib.request.urlopen(f"{key}/robots.txt", timeout=10) as f:
+                return 200, f.read().decode("utf-8", errors="ignore").splitlines()
+        except urllib.error.HTTPError as e:
+            return e.code, []
+        except Exception as e:
+            self.logger.error(f"Error with robots.txt occurred for {key}: {e}")
+            return 0, []
+
+    # Same rules as RobotFileParser.read, except that network errors allow everything.
+    def _build_parser(self, status, lines):
+        rp = urllib.robotparser.RobotFileParser()
+        if status in (401, 403) or status >= 500:
+            rp.disallow_all = True
+        elif status != 200:
+            rp.allow_all = True
+        else:
+            rp.parse(lines)
+        return rp
+
+    def _load(self):
+        if not os.path.exists(self.save_file):
+            return
+        try:
+            with open(self.save_file, 'rb') as file:
+                saved = pickle.load(file)
+        except (EOFError, pickle.UnpicklingError) as e:
+            self.logger.error(f"Could not read robots cache {self.save_file}: {e}")
+            return
+        for key, entry in saved:
+            if not self._expired(entry):
+                self.entries[key] = entry
+                self.parsers[key] = self._build_parser(entry[1], entry[2])
+        self.logger.info(f"Loaded {len(self.entries)} robots.txt files from {self.save_file}.")
+
+    # Write the cache to disk, the caller holds self.lock.
+    def _save(self):
+        temp_file = f"{self.save_file}.tmp"
+        with open(temp_file, 'wb') as file:
+            pickle.dump(list(self.entries.items()), file)
+        os.replace(temp_file, self.save_file)
+        self.unsaved = 0
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+
+_robots_cache = None
+_robots_cache_lock = Lock()
+
+# Robots cache shared by every worker, created on first use.
+def get_robots_cache(config):
+    global _robots_cache
+    with _robots_cache_lock:
+        if _robots_cache is None:
+            _robots_cache = RobotsCache(config)
+    return _robots_cache
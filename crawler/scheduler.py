@@ -0,0 +1,122 @@
+import math
+import time
+from collections import defaultdict
+from heapq import heappush, heappop
+
+from crawler.counting_lock import CountingLock
+
+
+class HostScheduler(object):
+    # Hands hosts, not domains, to any number of workers. Every host with urls
+    # to download is owned by one worker at a time and sits in that worker's
+    # heaps, so politeness is kept per host whichever worker fetches it. A
+    # host waits in a heap keyed by the time it may be fetched from again,
+    # and once that time is past it moves to a heap of ready hosts keyed by
+    # score(host, shard name), the score of the url it would download next
+    # (lower first), plus host_weight * log2(1 + downloads started from it),
+    # so the best urls of every host go first and hosts that were crawled a
+    # lot wait behind fresh ones. Without a score, ready hosts go in the order
+    # they became ready. A worker takes the best ready host of its own, or
+    # steals one from the other workers when it has none. A new host goes to
+    # the worker with the fewest hosts.
+    def __init__(self, workers, score=None, host_weight=0.0):
+        self.score = score
+        self.host_weight = host_weight
+        # Per worker, heap of (ready at, host, shard name) of hosts waiting out
+        # their delay, heap of (priority, ready at, host, shard name) of hosts
+        # that are ready, and the lock guarding both.
+        self.heaps = [[] for _ in range(workers)]
+        self.ready = [[] for _ in range(workers)]
+        self.locks = [CountingLock(f"worker-{worker_id}") for worker_id in range(workers)]
+        # key: host, value: monotonic time it may be fetched from again. Kept
+        # for hosts that ran out of urls, in case they get new ones.
+        self.ready_at = dict()
+        # key: host, value: downloads started from it
+        self.downloads = defaultdict(int)
+        # Urls queued or being downloaded, the crawl is over when it drops to 0.
+        self.outstanding = 0
+        self.lock = CountingLock("outstanding")
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps) + sum(len(heap) for heap in self.ready)
+
+    # Count urls added to the frontier (negative for urls that are done).
+    def added(self, count):
+        with self.lock:
+            self.outstanding += count
+
+    def is_empty(self):
+        return self.outstanding == 0
+
+    # Schedule hosts that got urls to download, on the least loaded workers.
+    def schedule(self, hosts):
+        now = time.monotonic()
+        for host, shard in hosts:
+            worker_id = min(range(len(self.heaps)), key=self._load)
+            self._push(worker_id, max(now, self.ready_at.get(host, now)), host, shard)
+
+    # A download from a host started, it may start another one after delay seconds.
+    def started(self, host, delay):
+        self.ready_at[host] = time.monotonic() + delay
+        self.downloads[host] += 1
+
+    # Put a host the worker took back into its heap, ready when its delay is over.
+    def resume(self, worker_id, host, shard):
+        now = time.monotonic()
+        self._push(worker_id, max(now, self.ready_at.get(host, now)), host, shard)
+
+    # The best host whose politeness delay is over, as (host, shard name), or
+    # None if no worker has one. The host is the caller's until it resumes it.
+    def take(self, worker_id):
+        now = time.monotonic()
+        taken = self._pop_ready(worker_id, now)
+        if taken is None:
+            # Steal from the workers with the most hosts first.
+            others = sorted((other for other in range(len(self.heaps)) if other != worker_id),
+                            key=self._load, reverse=True)
+            for other in others:
+                taken = self._pop_ready(other, now)
+                if taken is not None:
+                    break
+        return taken
+
+    # Seconds until the next host of any worker is ready, None if there is none.
+    def next_ready(self):
+        if any(self.ready):
+            return 0
+        tops = [heap[0][0] for heap in self.heaps if heap]
+        if not tops:
+            return None
+        return max(min(tops) - time.monotonic(), 0)
+
+    def lock_stats(self):
+        return {lock.name: lock.stats() for lock in self.locks + [self.lock]}
+
+    def _push(self, worker_id, ready_at, host, shard):
+        with self.locks[worker_id]:
+            heappush(self.heaps[worker_id], (ready_at, host, shard))
+
+    def _load(self, worker_id):
+        return len(self.heaps[worker_id]) + len(self.ready[worker_id])
+
+    # Lower goes first: the host's score plus its freshness term.
+    def _priority(self, host, shard):
+        if self.score is None:
+            return 0.0
+        return self.score(host, shard) + self.host_weight * math.log2(1 + self.downloads[host])
+
+    # Move the worker's hosts whose delay is over to its ready heap, scored
+    # now, and take the best one.
+    def _pop_ready(self, worker_id, now):
+        heap = self.heaps[worker_id]
+        ready = self.ready[worker_id]
+        if not ready and (not heap or heap[0][0] > now):
+            return None
+        with self.locks[worker_id]:
+            while heap and heap[0][0] <= now:
+                ready_at, host, shard = heappop(heap)
+                heappush(ready, (self._priority(host, shard), ready_at, host, shard))
+            if ready:
+                _, _, host, shard = heappop(ready)
+                return host, shard
+        return None
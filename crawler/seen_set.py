@@ -0,0 +1,198 @@
+import mmap
+import os
+import struct
+
+from crawler.counting_lock import CountingLock
+
+MAGIC = b"SEENSET1"
+# magic, number of slots, number of stored digests
+HEADER = struct.Struct("<8sQQ")
+SLOT_SIZE = 8
+# Grow the table once it is this full.
+MAX_LOAD = 0.7
+
+
+# 8 byte digest of a url hash, 0 marks an empty slot so it is never used.
+def digest(urlhash):
+    return int(urlhash[:16], 16) or 1
+
+
+class BloomFilter(object):
+    # Bit array kept in a memory-mapped file, checked before the table so most
+    # urls that were never seen do not touch the table at all.
+    def __init__(self, path, bits, hashes=4):
+        self.path = path
+        self.size = max(bits // 8, 1)
+        self.bits = self.size * 8
+        self.hashes = hashes
+        self.created = not os.path.exists(path) or os.path.getsize(path) != self.size
+        with open(path, 'r+b' if not self.created else 'w+b') as file:
+            file.truncate(self.size)
+            self.map = mmap.mmap(file.fileno(), self.size)
+
+    # Bit positions for a digest, by double hashing on its two halves.
+    def _positions(self, value):
+        first = value & 0xFFFFFFFF
+        second = (value >> 32) | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.map[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        for position in self._positions(value):
+            if not self.map[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+
+
+class SeenSet(object):
+    # Every url hash the frontier has seen, as 8 byte digests in an
+    # open-addressing (linear probing) table that lives in a memory-mapped
+    # file, so reopening it with millions of urls takes no time and each url
+    # costs about 12 bytes instead of a shelve entry.
+    #
+    # Digests are first added as pending, and are only written into the table
+    # by commit() once the frontier journal has logged them, so the file is
+    # never ahead of the journal after a crash.
+    def __init__(self, path, capacity=1 << 20, bloom_bits=0):
+        self.path = path
+        self.lock = CountingLock("seen")
+        self.pending = set()
+        if os.path.exists(path):
+            self._open()
+        else:
+            self._create(path, capacity)
+            self._open()
+        self.bloom = None
+        if bloom_bits > 0:
+            self.bloom = BloomFilter(f"{path}.bloom", bloom_bits)
+            if self.bloom.created:
+                for value in self.slots:
+                    if value:
+                        self.bloom.add(value)
+
+    def __len__(self):
+        return self.count + len(self.pending)
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return self._contains(digest(urlhash))
+
+    # Add a url hash as pending, returns False if it was already seen.
+    def add(self, urlhash):
+        value = digest(urlhash)
+        with self.lock:
+            if self._contains(value):
+                return False
+            self.pending.add(value)
+            return True
+
+    # add() for a batch of url hashes under one lock, returns a bool per hash.
+    def add_many(self, urlhashes):
+        values = [digest(urlhash) for urlhash in urlhashes]
+        added = []
+        with self.lock:
+            for value in values:
+                if self._contains(value):
+                    added.append(False)
+                else:
+                    self.pending.add(value)
+                    added.append(True)
+        return added
+
+    # Write url hashes that are now safe in the journal into the table.
+    def commit(self, urlhashes):
+        with self.lock:
+            for urlhash in urlhashes:
+                value = digest(urlhash)
+                self.pending.discard(value)
+                self._insert(value)
+            self._write_count()
+
+    def close(self):
+        with self.lock:
+            self._write_count()
+            self.slots.release()
+            self.map.flush()
+            self.map.close()
+            if self.bloom is not None:
+                self.bloom.close()
+
+    def _contains(self, value):
+        if value in self.pending:
+            return True
+        if self.bloom is not None and value not in self.bloom:
+            return False
+        mask = self.capacity - 1
+        slot = value & mask
+        while True:
+            stored = self.slots[slot]
+            if stored == value:
+                return True
+            if stored == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def _insert(self, value):
+        mask = self.capacity - 1
+        slot = value & mask
+        while True:
+            stored = self.slots[slot]
+            if stored == value:
+                return
+            if stored == 0:
+                break
+            slot = (slot + 1) & mask
+        self.slots[slot] = value
+        self.count += 1
+        if self.bloom is not None:
+            self.bloom.add(value)
+        if self.count > self.capacity * MAX_LOAD:
+            self._grow()
+
+    @staticmethod
+    def _create(path, capacity):
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, capacity, 0))
+            file.truncate(HEADER.size + capacity * SLOT_SIZE)
+
+    def _open(self):
+        with open(self.path, 'r+b') as file:
+            self.map = mmap.mmap(file.fileno(), 0)
+        magic, self.capacity, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a seen-set file.")
+        self.slots = memoryview(self.map)[HEADER.size:].cast('Q')
+
+    def _write_count(self):
+        HEADER.pack_into(self.map, 0, MAGIC, self.capacity, self.count)
+
+    # Rehash into a table twice the size, swapped in with an atomic rename.
+    def _grow(self):
+        temp_path = f"{self.path}.tmp"
+        self._create(temp_path, self.capacity * 2)
+        with open(temp_path, 'r+b') as file:
+            grown_map = mmap.mmap(file.fileno(), 0)
+        grown = memoryview(grown_map)[HEADER.size:].cast('Q')
+        mask = self.capacity * 2 - 1
+        for value in self.slots:
+            if value:
+                slot = value & mask
+                while grown[slot]:
+                    slot = (slot + 1) & mask
+                grown[slot] = value
+        HEADER.pack_into(grown_map, 0, MAGIC, self.capacity * 2, self.count)
+        grown.release()
+        grown_map.flush()
+        grown_map.close()
+
+        self.slots.release()
+        self.map.close()
+        os.replace(temp_path, self.path)
+        self._open()
@@ -0,0 +1,111 @@
+from crawler.counting_lock import CountingLock
+
+
+class FrontierShard(object):
+    # The urls to be downloaded of one domain, in a queue per host, with a
+    # lock of its own so pages of different domains never wait on each other.
+    # Urls are pushed in batches, a page's links for this domain take the
+    # lock once. A host is scheduled from the time it gets urls until its
+    # queue runs empty and none of its downloads is left, see HostScheduler.
+    def __init__(self, name, make_queue, host_in_flight=1):
+        self.name = name
+        self.make_queue = make_queue
+        self.host_in_flight = host_in_flight
+        self.lock = CountingLock(name)
+        # key: host, value: queue of its urls to be downloaded
+        self.queues = dict()
+        # Hosts that are in a worker's heap, taken by a worker, or parked.
+        self.scheduled = set()
+        # Scheduled hosts out of every heap until one of their downloads
+        # finishes, because host_in_flight of them are running or because
+        # they have no url left to start.
+        self.parked = set()
+        # key: host, value: downloads from it in flight
+        self.active = dict()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    # Push urls grouped by host, returns the hosts that have to be scheduled.
+    def push(self, urls_by_host):
+        hosts = []
+        with self.lock:
+            for host, urls in urls_by_host.items():
+                queue = self.queues.get(host)
+                if queue is None:
+                    queue = self.queues[host] = self.make_queue()
+                for url in urls:
+                    queue.push(url)
+                self.count += len(urls)
+                if host not in self.scheduled:
+                    self.scheduled.add(host)
+                    hosts.append(host)
+                elif host in self.parked and self.active.get(host, 0) < self.host_in_flight:
+                    self.parked.discard(host)
+                    hosts.append(host)
+        return hosts
+
+    # Count another link to urls that may still be waiting to be downloaded.
+    def touch(self, urls_by_host):
+        with self.lock:
+            for host, urls in urls_by_host.items():
+                queue = self.queues.get(host)
+                if queue is not None:
+                    for url in urls:
+                        queue.touch(url)
+
+    # Next url of a scheduled host, None if it has none left.
+    def pop(self, host):
+        with self.lock:
+            queue = self.queues.get(host)
+            if not queue:
+                return None
+            self.count -= 1
+            return queue.pop()
+
+    # Score of the next url of a host, for queues ordered by one. None if the
+    # host has no url queued.
+    def head_score(self, host):
+        with self.lock:
+            queue = self.queues.get(host)
+            return queue.head_score() if queue else None
+
+    # A download from a host the caller took started. Returns True if the host
+    # can go back into a heap for the next one, False if it is parked.
+    def start(self, host):
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            return self._requeue(host)
+
+    # A download from a host finished. Returns True if the host was parked and
+    # now goes back into the caller's heap.
+    def finish(self, host):
+        with self.lock:
+            self.active[host] -= 1
+            if not self.active[host]:
+                del self.active[host]
+            if host not in self.parked:
+                return False
+            return self._requeue(host)
+
+    # Give back a host the caller took without starting a download. Returns
+    # True if it goes back into a heap.
+    def release(self, host):
+        with self.lock:
+            return self._requeue(host)
+
+    # Back into a heap if the host has urls and room for another download,
+    # else parked while downloads are left, else dropped. The caller holds
+    # self.lock and the host is out of every heap.
+    def _requeue(self, host):
+        if self.queues.get(host) and self.active.get(host, 0) < self.host_in_flight:
+            self.parked.discard(host)
+            return True
+        if host in self.active:
+            self.parked.add(host)
+            return False
+        self.parked.discard(host)
+        self.scheduled.discard(host)
+        self.queues.pop(host, None)
+        return False
@@ -0,0 +1,121 @@
+import gzip
+import time
+import xml.etree.ElementTree as ET
+
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.download import get_session
+import scraper
+
+# Most sitemap files read for one host, sitemap indexes can point at many.
+MAX_SITEMAPS_PER_HOST = 100
+
+
+class SitemapCache(object):
+    # Finds the urls listed in a host's sitemaps, at most once per
+    # config.sitemap_ttl seconds per host. Sitemaps come from /sitemap.xml and
+    # the Sitemap: lines of the host's robots.txt, sitemap indexes are
+    # followed, and every file is parsed as a stream so memory stays constant
+    # no matter how large it is.
+    def __init__(self, config, robots_cache):
+        self.logger = get_logger("SITEMAPS")
+        self.config = config
+        self.robots_cache = robots_cache
+        self.ttl = config.sitemap_ttl
+        self.batch_size = config.sitemap_batch_size
+        self.lock = Lock()
+        # key: scheme://netloc, value: time the host's sitemaps were last read
+        self.checked = dict()
+
+    # Yield lists of up to batch_size urls from the sitemaps of the url's host,
+    # only the ones the scraper's url filter lets through. Yields nothing if
+    # the host was already read within the TTL.
+    def discover(self, url):
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        with self.lock:
+            checked_at = self.checked.get(key)
+            if checked_at is not None and time.time() - checked_at < self.ttl:
+                return
+            self.checked[key] = time.time()
+
+        to_read = [f"{key}/sitemap.xml"]
+        try:
+            site_maps = self.robots_cache.parser(url).site_maps() or []
+            to_read.extend(sitemap_url for sitemap_url in site_maps if self.can_follow(sitemap_url, parsed.netloc))
+        except Exception as e:
+            self.logger.error(f"Error reading Sitemap lines from robots.txt of {key}: {e}")
+
+        read = set()
+        batch = []
+        while to_read and len(read) < MAX_SITEMAPS_PER_HOST:
+            sitemap_url = to_read.pop()
+            if sitemap_url in read:
+                continue
+            read.add(sitemap_url)
+            for is_index, loc in self.read_sitemap(sitemap_url):
+                if is_index:
+                    if self.can_follow(loc, parsed.netloc):
+                        to_read.append(loc)
+                    continue
+                batch.append(loc)
+                if len(batch) >= self.batch_size:
+                    batch = scraper.url_filter.filter_links(batch)
+                    if batch:
+                        yield batch
+                    batch = []
+        batch = scraper.url_filter.filter_links(batch)
+        if batch:
+            yield batch
+
+    # Whether a sitemap listed for a host is read: it has to be on that host
+    # or on one of the domains the url filter allows, so a robots.txt or an
+    # index pointing elsewhere does not take the crawl off the domains.
+    def can_follow(self, sitemap_url, netloc):
+        parsed = urlparse(sitemap_url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        return parsed.netloc == netloc or parsed.netloc.endswith(scraper.url_filter.allowed_domains)
+
+    # Stream one sitemap file, yielding (is_index, loc) for each <loc> in it.
+    # is_index is True when the file is a sitemap index pointing at more sitemaps.
+    def read_sitemap(self, sitemap_url):
+        try:
+            with get_session(self.config).get(sitemap_url, stream=True, timeout=30) as response:
+                if response.status_code != 200:
+                    return
+                response.raw.decode_content = True
+                source = response.raw
+                if urlparse(sitemap_url).path.endswith(".gz"):
+                    source = gzip.GzipFile(fileobj=source)
+
+                root = None
+                is_index = False
+                for event, element in ET.iterparse(source, events=("start", "end")):
+                    tag = element.tag.rsplit('}', 1)[-1]
+                    if root is None:
+                        root = element
+                        is_index = tag == "sitemapindex"
+                    elif event == "end" and tag == "loc" and element.text:
+                        yield is_index, element.text.strip()
+                    elif event == "end" and tag in ("url", "sitemap"):
+                        # Drop every finished entry so the tree never grows.
+                        root.clear()
+        except ET.ParseError as e:
+            self.logger.info(f"{sitemap_url} is not a valid sitemap: {e}")
+        except Exception as e:
+            self.logger.error(f"Error retrieving {sitemap_url}: {e}")
+
+
+_sitemap_cache = None
+_sitemap_cache_lock = Lock()
+
+# Sitemap cache shared by every worker, created on first use.
+def get_sitemap_cache(config, robots_cache):
+    global _sitemap_cache
+    with _sitemap_cache_lock:
+        if _sitemap_cache is None:
+            _sitemap_cache = SitemapCache(config, robots_cache)
+    return _sitemap_cache
@@ -1,170 +1,154 @@
-from threading import Thread, Timer
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.telemetry import telemetry
+from crawler.robots import get_robots_cache
+from crawler.sitemaps import get_sitemap_cache
 import scraper
+import time
 from time import sleep
-import re
-from urllib.parse import urlparse
-import urllib.robotparser
-import requests
-from bs4 import BeautifulSoup
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier, domain):
+    def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
+        self.worker_id = worker_id
         self.config = config
         self.frontier = frontier
-        self.domain = domain
         self.rp = None
-        self.download_thread = None
-        self.download_timer = None
-        self.is_multithreaded = False if self.config.threads_count == 1 else True
+        self.robots_cache = get_robots_cache(config)
+        self.sitemap_cache = get_sitemap_cache(config, self.robots_cache)
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
         super().__init__(daemon=True)
     
-    # Start a download thread if not already running.
-    def start_download_thread(self):
-        if self.download_thread is None or not self.download_thread.is_alive():
-            self.download_thread = Thread(target=self.backup_process)
-            self.download_thread.start()
-
-    # Wait for the domain's frontier to have URLs if in multithreaded mode.
-    def domain_wait(self):
-        if self.is_multithreaded:
-            if len(self.frontier.domains[self.domain]) <= 0:
-                with self.frontier.conditions[self.domain]:
-                    self.frontier.conditions[self.domain].wait()
-        else:
-            return
-
-    # Check if all frontiers for domains are empty if in multithreaded mode.
+    # Check if every url has been downloaded, by any worker.
     def all_empty(self):
-        if self.is_multithreaded:
-            for _, links in self.frontier.domains.items():
-                if len(links) > 0:
-                    return False
-        else:
-            return True
+        if self.frontier.loading:
+            # The rest of the resume index is still being loaded into the frontier.
+            return False
+        return self.frontier.is_empty()
 
+    # Hands out urls to a pool of PREFETCH download threads, and only takes a
+    # new one once a download finished. The pool is shut down, waiting for
+    # every download, before the worker stops.
     def run(self):
-        while True:
-            self.domain_wait()
-            tbd_url = self.frontier.get_tbd_url(self.domain)
-            
-            if not tbd_url and self.all_empty():
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                break
-            
+        with ThreadPoolExecutor(max_workers=self.config.prefetch) as executor:
+            in_flight = set()
+            while True:
+                # Top up the downloads in flight from hosts that are ready.
+                while len(in_flight) < self.config.prefetch:
+                    tbd_url = self.frontier.get_tbd_url(self.worker_id)
+                    if not tbd_url:
+                        break
+                    in_flight.add(executor.submit(self.process, tbd_url))
+
+                if not in_flight:
+                    if self.all_empty():
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    # Every host left is waiting out its politeness delay or
+                    # being fetched by another worker.
+                    sleep(self.idle_delay())
+                    continue
+
+                # With room for more, also wake up for the next host that is ready.
+                timeout = self.idle_delay() if len(in_flight) < self.config.prefetch else None
+                _, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+    # Download, scrape and complete a single url, on a download thread. Each
+    # stage is timed into the crawl's telemetry.
+    def process(self, tbd_url):
+        started_at = time.perf_counter()
+        # The host is ours until the download starts, the scheduler then keeps
+        # the next one from starting before the politeness delay is over.
+        with telemetry.timer("worker.crawl_delay"):
+            delay = self.politeness_delay(tbd_url)
+        self.frontier.started(self.worker_id, tbd_url, delay)
+        try:
             # Check if URL is allowed by robots.txt before downloading.
-            if self.is_allowed_robots(tbd_url):
-                if self.is_multithreaded:
-                    # Set timer to start backup thread if download exceeds time.
-                    self.download_timer = Timer(0.2, self.start_download_thread)
-                    self.download_timer.start() 
+            with telemetry.timer("worker.robots"):
+                allowed = self.is_allowed_robots(tbd_url)
+            if allowed:
+                with telemetry.timer("worker.download"):
                     resp = download(tbd_url, self.config, self.logger)
-                    self.download_timer.cancel()
-                    self.logger.info(
-                        f"Downloaded {tbd_url}, status <{resp.status}>, "
-                        f"using cache {self.config.cache_server}.")
-                else:
-                    # Download the URL and log the status.
-                    resp = download(tbd_url, self.config, self.logger)
-                    self.logger.info(
-                        f"Downloaded {tbd_url}, status <{resp.status}>, "
-                        f"using cache {self.config.cache_server}.")
+                telemetry.count(f"status_{resp.status}")
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
 
                 # Extract URLs from the downloaded content and add them to the frontier.
-                scraped_urls = scraper.scraper(tbd_url, resp)
-                for scrape_url in scraped_urls:
-                    self.frontier.shelf_lock.acquire()
-                    self.frontier.add_url(scrape_url)
-                    self.frontier.shelf_lock.release()
+                with telemetry.timer("worker.scrape"):
+                    scraped_urls = scraper.scraper(tbd_url, resp)
+                with telemetry.timer("frontier.add_urls"):
+                    self.frontier.add_urls(scraped_urls)
 
                 # Mark the current URL as complete in the frontier.
-                self.frontier.shelf_lock.acquire()
-                self.frontier.mark_url_complete(tbd_url)
-                self.frontier.shelf_lock.release()
-                
+                with telemetry.timer("frontier.complete"):
+                    self.frontier.mark_url_complete(tbd_url)
             else:
+                telemetry.count("robots_disallowed")
                 self.logger.info(f"{tbd_url} is not allowed by robots.txt")
-            
-            sleep(self.config.time_delay)
 
             # Add URLs from the sitemap to the frontier.
-            sitemap_urls = self.get_sitemap_urls(tbd_url)
-            for url in sitemap_urls:
-                self.frontier.shelf_lock.acquire()
-                self.frontier.add_url(url)
-                self.frontier.shelf_lock.release()
+            with telemetry.timer("worker.sitemaps"):
+                self.add_sitemap_urls(tbd_url)
+        except Exception as e:
+            telemetry.count("errors")
+            self.logger.error(f"Error processing {tbd_url}: {e}")
+        finally:
+            # Counted as done even when it failed, so the crawl can end.
+            self.frontier.finished(self.worker_id, tbd_url)
+            telemetry.count("pages")
+            telemetry.record("worker.page", time.perf_counter() - started_at)
 
-    # Retrieve URLs from the sitemap of a given URL.
+    # Seconds to sleep when no host is ready, until the next one is.
+    def idle_delay(self):
+        delay = self.frontier.next_ready()
+        if delay is None:
+            return self.config.time_delay
+        return min(delay, self.config.time_delay)
+
+    # Retrieve batches of URLs from the sitemaps of a given URL's host. Hosts
+    # are only read once per SITEMAPTTL, so this is usually empty.
     def get_sitemap_urls(self, url):
-        parsed = urlparse(url)._replace(fragment='')
-        sitemap_url = f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"
-        try:
-            response = requests.get(sitemap_url)
-            if response.status_code == 200:
-                sitemap_content = response.text
-                sitemap_urls = self.parse_sitemap(sitemap_content)
-                return sitemap_urls
-            else:
-                pass
-        except Exception as e:
-            self.logger.error(f"Error retrieving sitemap.xml from {url}: {e}")
-        return []
-    
-    # Parse the content of a sitemap and extract URLs.
-    def parse_sitemap(self, sitemap_content):
-        urls = []
-        try:
-            soup = BeautifulSoup(sitemap_content, 'lxml')
-            for loc in soup.find_all('loc'):
-                urls.append(loc.text.strip())
-        except Exception as e:
-            self.logger.error(f"Error parsing sitemap: {e}")
-        return urls
+        return self.sitemap_cache.discover(url)
 
-    # Parse robots.txt for a given URL.
+    # Add URLs from the sitemaps of a given URL's host to the frontier.
+    def add_sitemap_urls(self, url):
+        for sitemap_urls in self.get_sitemap_urls(url):
+            self.frontier.add_urls(sitemap_urls)
+
+    # Get the parsed robots.txt for a given URL from the shared robots cache.
     def robots(self, url):
         try:
-            parsed = urlparse(url)._replace(fragment='')
-            robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-            self.rp = urllib.robotparser.RobotFileParser()
-            self.rp.set_url(robots_url)
-            self.rp.read()
+            rp = self.robots_cache.parser(url)
         except Exception as e:
             self.logger.error(f"Error with robots.txt occurred: {e}")
-            self.rp = None
+            rp = None
+        self.rp = rp
+        return rp
 
     # Check if a URL is allowed to be fetched according to robots.txt.
     def is_allowed_robots(self, url):
         try:
-            self.robots(url)
-            if not self.rp.can_fetch('*', url):
+            # Use the returned parser, self.rp can be replaced by a concurrent check.
+            rp = self.robots(url)
+            if not rp.can_fetch('*', url):
                 return False
             return True 
         except Exception as e:
             return True
     
-    # Backup process to handle download and scraping in a separate thread.
-    def backup_process(self):
-        if len(self.frontier.domains[self.domain]) <= 0:
-            return
-        
-        tbd_url = self.frontier.get_tbd_url(self.domain)
-        resp = download(tbd_url, self.config, self.logger)
-        self.logger.info(
-            f"Downloaded {tbd_url}, status <{resp.status}>, "
-            f"using cache {self.config.cache_server}.")
-        
-        scraped_urls = scraper.scraper(tbd_url, resp)
-        for scraped_url in scraped_urls:
-            self.frontier.shelf_lock.acquire()
-            self.frontier.add_url(scraped_url)
-            self.frontier.shelf_lock.release()
-        self.frontier.shelf_lock.acquire()
-        self.frontier.mark_url_complete(tbd_url)
-        self.frontier.shelf_lock.release()
\ No newline at end of file
+    # Seconds to wait before the next request to the URL's host, honoring the
+    # Crawl-delay in its robots.txt when that is longer than the politeness delay.
+    def politeness_delay(self, url):
+        try:
+            crawl_delay = self.robots_cache.crawl_delay(url)
+        except Exception:
+            crawl_delay = None
+        if crawl_delay is None:
+            return self.config.time_delay
+        return max(self.config.time_delay, float(crawl_delay))
@@ -0,0 +1,62 @@
+from lxml import etree
+
+# Elements whose text is not part of the visible page text.
+HIDDEN_TEXT_TAGS = frozenset({"script", "style", "template"})
+
+
+class ParsedDocument():
+    def __init__(self, text, tag_count, hrefs):
+        # Visible text of the page, what BeautifulSoup's get_text() returns.
+        self.text = text
+        # Number of elements in the page.
+        self.tag_count = tag_count
+        # href of every <a> that has one, in page order.
+        self.hrefs = hrefs
+
+
+# Parser target that collects everything a ParsedDocument needs while lxml
+# streams through the page, without ever building a tree.
+class _DocumentTarget():
+    def __init__(self):
+        self.chunks = []
+        self.tag_count = 0
+        self.hrefs = []
+        self.hidden_depth = 0
+
+    def start(self, tag, attrib):
+        self.tag_count += 1
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.hrefs.append(href)
+
+    def end(self, tag):
+        if tag in HIDDEN_TEXT_TAGS and self.hidden_depth:
+            self.hidden_depth -= 1
+
+    def data(self, data):
+        if not self.hidden_depth:
+            self.chunks.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return ParsedDocument(''.join(self.chunks), self.tag_count, self.hrefs)
+
+
+# Parse a page in one pass over its raw bytes, collecting the text, the tag
+# count and the links together.
+def parse_document(content):
+    if isinstance(content, bytes):
+        # Most pages are UTF-8, anything else is left to lxml's own detection.
+        try:
+            content = content.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    target = _DocumentTarget()
+    parser = etree.HTMLParser(target=target, recover=True)
+    parser.feed(content)
+    return parser.close()
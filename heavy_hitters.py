@@ -0,0 +1,153 @@
+import math
+from array import array
+from heapq import heapify, heappush, heapreplace, nlargest
+from itertools import compress, repeat
+from operator import add, gt, itemgetter
+from zlib import crc32
+
+# Seed of the second crc32 hash of a key.
+SECOND_SEED = 0x9E3779B9
+
+
+class CountMinSketch():
+    # Counts of any number of keys in a fixed table of depth rows of width
+    # counters. With width = e / epsilon and depth = ln(1 / delta), a count is
+    # never under the true one, and over it by at most epsilon times the total
+    # of all counts with probability 1 - delta.
+    def __init__(self, epsilon=0.0001, delta=0.001):
+        if not 0 < epsilon < 1 or not 0 < delta < 1:
+            raise ValueError(f"Need 0 < epsilon, delta < 1, got epsilon={epsilon}, delta={delta}.")
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = array("Q", bytes(8 * self.width * self.depth))
+
+    def __len__(self):
+        return len(self.table)
+
+    # The counter of the key in each row, from two crc32 hashes of it
+    # combined as h1 + row * h2.
+    def cells(self, key):
+        data = key.encode("utf-8")
+        first = crc32(data)
+        second = crc32(data, SECOND_SEED) | 1
+        width = self.width
+        return [row * width + (first + row * second) % width for row in range(self.depth)]
+
+    # Add count to a key, returns its new estimate. Conservative update: a
+    # counter is only raised as far as the new estimate, which keeps the
+    # bound and makes the overcount smaller.
+    def add(self, key, count=1):
+        table = self.table
+        cells = self.cells(key)
+        estimate = min([table[cell] for cell in cells]) + count
+        for cell in cells:
+            if table[cell] < estimate:
+                table[cell] = estimate
+        return estimate
+
+    def estimate(self, key):
+        table = self.table
+        return min([table[cell] for cell in self.cells(key)])
+
+    # Add the counters of a sketch of the same size, such as a checkpointed
+    # one. Estimates of the sum are still never under the true counts.
+    def merge(self, table):
+        if len(table) != len(self.table):
+            raise ValueError(f"Sketch of {len(table)} counters, expected {len(self.table)}.")
+        self.table = array("Q", map(add, self.table, table))
+
+
+class TopKeys():
+    # The capacity keys with the highest counts, out of keys whose counts only
+    # go up. offer() is called with a key's new count whenever it changes, and
+    # the key replaces the lowest one kept once its count is higher. When the
+    # counts are exact, so are the keys kept.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # key: kept key, value: its count
+        self.counts = dict()
+        # (count, key) of every kept key. A count is only updated when it
+        # gets to the top, so the top is the lowest once it is up to date.
+        self.heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def offer(self, key, count):
+        counts = self.counts
+        if key in counts:
+            counts[key] = count
+            return
+        heap = self.heap
+        if len(counts) < self.capacity:
+            counts[key] = count
+            heappush(heap, (count, key))
+            return
+        while True:
+            lowest, lowest_key = heap[0]
+            current = counts[lowest_key]
+            if current == lowest:
+                break
+            heapreplace(heap, (current, lowest_key))
+        if count > lowest:
+            del counts[lowest_key]
+            counts[key] = count
+            heapreplace(heap, (count, key))
+
+    # offer() every key of keys with its count, counts holding them in the
+    # same order. Once capacity keys are kept, only keys counted over the top
+    # of the heap, which is at or under the lowest count, are looked at. The
+    # kept keys are among them, as their counts only go up.
+    def offer_all(self, keys, counts):
+        pairs = zip(keys, counts)
+        if len(self.counts) >= self.capacity:
+            pairs = compress(pairs, map(gt, counts, repeat(self.heap[0][0])))
+        offer = self.offer
+        for key, count in pairs:
+            offer(key, count)
+
+    # The n kept keys with the highest counts, as (key, count).
+    def top(self, n):
+        return nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    # Replace the kept keys with the highest of items, (key, count) pairs.
+    def load(self, items):
+        self.counts = dict(nlargest(self.capacity, items, key=itemgetter(1)))
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapify(self.heap)
+
+
+class TopCounts():
+    # The capacity keys with the highest counts, in memory that does not grow
+    # with the number of keys. Every count goes into a count-min sketch, and
+    # the keys are kept in a TopKeys by their estimate. A key that is not kept
+    # replaces the lowest kept one once its estimate is higher, as in
+    # space-saving, but its estimate covers every count it got, kept or not.
+    def __init__(self, capacity=1000, epsilon=0.0001, delta=0.001):
+        self.sketch = CountMinSketch(epsilon, delta)
+        self.keys = TopKeys(capacity)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, count=1):
+        self.keys.offer(key, self.sketch.add(key, count))
+
+    # Add the counts of a mapping, such as a Counter.
+    def update(self, counts):
+        add = self.add
+        for key, count in counts.items():
+            add(key, count)
+
+    # The n kept keys with the highest estimates, as (key, estimate).
+    def top(self, n):
+        return self.keys.top(n)
+
+    # Add the counts of another TopCounts of the same size, from its sketch's
+    # counters and its kept keys, and keep the highest keys of both.
+    def merge(self, table, keys):
+        self.sketch.merge(table)
+        keys = set(keys)
+        keys.update(self.keys.counts)
+        estimate = self.sketch.estimate
+        self.keys.load((key, estimate(key)) for key in keys)
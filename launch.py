@@ -3,33 +3,39 @@ from argparse import ArgumentParser
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
-from report_generator import report_generator
+from crawler.worker import Worker
+from crawler.async_worker import AsyncWorker
+from report_generator import report_generator, start_live_reports
 import time
 import scraper
 
-def main(config_file, restart):
+def main(config_file, restart, async_workers=False):
     finished = False
-    connectionerror = False
 
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
     config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart, [".informatics.uci.edu", ".stat.uci.edu", ".ics.uci.edu", ".cs.uci.edu",])
+    scraper.configure(config, restart)
+    start_live_reports(config.report_interval)
+    worker_factory = AsyncWorker if async_workers else Worker
+    crawler = Crawler(config, restart, worker_factory=worker_factory)
+
+    # Pick up the report data and trap stats of the crawl being resumed,
+    # before any page is counted or checkpointed.
+    if not restart:
+        scraper.read_checkpoint()
+        scraper.read_trap_stats()
     
     while not finished:
         try:
-            if connectionerror:
-                scraper.read_unique_links()
-                scraper.read_simhash()
-                scraper.read_all_tokens()
-                scraper.read_subdomains()
-
             crawler.start()
             finished = report_generator()
         except ConnectionError:
             print("Connection Error")
             time.sleep(60)
+    crawler.close()
+    scraper.shutdown()
 
 if __name__ == "__main__":
     start = True
@@ -38,8 +44,9 @@ if __name__ == "__main__":
             parser = ArgumentParser()
             parser.add_argument("--restart", action="store_true", default=False)
             parser.add_argument("--config_file", type=str, default="config.ini")
+            parser.add_argument("--async_workers", action="store_true", default=False)
             args = parser.parse_args()
-            main(args.config_file, args.restart)
+            main(args.config_file, args.restart, args.async_workers)
             start = False
         except:
             time.sleep(30)
\ No newline at end of file
@@ -1,28 +1,65 @@
+import os
+import signal
+import threading
+import time
 from scraper import ScraperData
-import heapq
+from utils import get_logger
 
+# One report written at a time, from the crawl's end, the timer or a signal.
+report_lock = threading.Lock()
+
+# Write report.txt from the statistics ScraperData keeps up to date, so it
+# takes the same time whenever it is asked for, during the crawl or after it.
 def report_generator():
-    # Retrieve information about the longest page
-    longest_page_url, longest_page_words = ScraperData.get_longest_info()
-    # Sort subdomains alphabetically
-    sorted_subdoms = sorted(ScraperData.subdomains.items(), key=lambda x: (x[0], x[1]))
-    # Get the top 50 tokens
-    top_fifty = heapq.nlargest(50, ScraperData.all_tokens.items(), key=lambda item: item[1])
-
-    with open('report.txt', 'w') as f:
-        f.write(f"Number of Unique Links: {len(ScraperData.get_unique_links_keys())}\n") 
-        f.write("\n")
-
-        f.write(f"Longest Page: {longest_page_url}, {longest_page_words}\n")
-        f.write("\n")
-
-        f.write(f"ics.uci.edu Subdomains\n")
-        for i in sorted_subdoms:
-            f.write(f"{i[0]}, {i[1]}\n")
-        f.write("\n")
-
-        f.write(f"Top 50 Words\n")
-        for ind, item in enumerate(top_fifty):
-            f.write(f"{ind+1}. {item[0]} : {item[1]}\n")
-    
+    with report_lock:
+        # Merge the pages the threads have not merged yet.
+        ScraperData.flush()
+        # Retrieve information about the longest page
+        longest_page_url, longest_page_words = ScraperData.get_longest_info()
+        # Subdomains, kept in alphabetical order
+        sorted_subdoms = ScraperData.get_subdomains()
+        # Get the top 50 tokens
+        top_fifty = ScraperData.get_top_tokens(50)
+
+        # Written aside and moved over report.txt, which is never seen half written.
+        with open('report.txt.tmp', 'w') as f:
+            f.write(f"Number of Unique Links: {len(ScraperData.get_unique_links_keys())}\n")
+            f.write("\n")
+
+            f.write(f"Longest Page: {longest_page_url}, {longest_page_words}\n")
+            f.write("\n")
+
+            f.write(f"ics.uci.edu Subdomains\n")
+            for i in sorted_subdoms:
+                f.write(f"{i[0]}, {i[1]}\n")
+            f.write("\n")
+
+            f.write(f"Top 50 Words\n")
+            for ind, item in enumerate(top_fifty):
+                f.write(f"{ind+1}. {item[0]} : {item[1]}\n")
+        os.replace('report.txt.tmp', 'report.txt')
+
     return True
+
+# Write report.txt while the crawl runs, every interval seconds (0 for never)
+# and whenever the process gets SIGUSR1.
+def start_live_reports(interval):
+    logger = get_logger("Report")
+
+    def write_report():
+        try:
+            report_generator()
+        except Exception as e:
+            logger.error(f"Error writing the report: {e}")
+
+    if hasattr(signal, "SIGUSR1"):
+        # The handler runs on the main thread, which may be in the middle of
+        # a merge, so the report is written on a thread of its own.
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=write_report, daemon=True).start())
+
+    if interval > 0:
+        def run():
+            while True:
+                time.sleep(interval)
+                write_report()
+        threading.Thread(target=run, daemon=True).start()
@@ -1,14 +1,121 @@
-import re
+import os
+import time
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-from tokenizer import tokenize, computeWordFrequencies
-from scraper_data import ScraperData
-from scraper_helper import is_calendar_url, low_information, get_absolute_url, wrong_ending, is_trap
-from simhash import create_simhash
+from document_parser import parse_document
+from tokenizer import count_tokens
+from scraper_data import ScraperData, PageCounts
+from scraper_helper import is_calendar_url, low_information, get_absolute_url
+from url_filter import UrlFilter
+from trap_detector import TrapDetector
+from utils import get_logger, get_urlhash
+from utils.page_store import get_page_store, content_digest, encode_counts
+from utils.telemetry import telemetry
+from simhash import create_simhash, FINGERPRINT_BITS
 
 # Initialize global ScraperData instance
 ScraperData = ScraperData()
 
+# Rules for which urls to crawl, replaced with the config.ini ones by configure().
+url_filter = UrlFilter()
+
+# Per-host fetch statistics for spotting crawler traps, set up from config.ini by configure().
+trap_detector = TrapDetector()
+
+# Validators, content digests and outlinks of fetched pages, set up by configure() unless PAGESTORESIZE is 0.
+page_store = None
+
+# Parser processes, only set up by configure() when PARSERPROCESSES is above 0.
+parser_pool = None
+
+# Set up the scraper for a crawl, restart is set when it starts over from the
+# seeds. With config.parser_processes above 0, pages are parsed, tokenized and
+# simhashed in that many processes instead of on the worker threads, so the
+# CPU work is not held back by the GIL.
+def configure(config, restart=False):
+    global parser_pool, trap_detector, page_store
+    set_url_filter(UrlFilter.from_config(config))
+    trap_detector.close_checkpoint()
+    trap_detector = TrapDetector.from_config(config)
+    # Kept across restarts, a stored page is counted again from what it was counted with.
+    page_store = get_page_store(config)
+    if config.token_counts == "approximate":
+        ScraperData.approximate_tokens(config.top_tokens, config.sketch_error, config.sketch_failure)
+    ScraperData.open_checkpoint(config.checkpoint_dir)
+    trap_detector.open_checkpoint(config.checkpoint_dir)
+    if restart:
+        ScraperData.clear_checkpoint()
+        trap_detector.clear_checkpoint()
+    if config.parser_processes > 0 and parser_pool is None:
+        # Spawn rather than fork, the crawler has threads running by the time
+        # the first page is parsed. Each process gets the same url filter.
+        parser_pool = ProcessPoolExecutor(
+            max_workers=config.parser_processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=set_url_filter, initargs=(url_filter,))
+
+def set_url_filter(new_filter):
+    global url_filter
+    url_filter = new_filter
+
+# Stop the parser processes, checkpoint ScraperData and the trap stats and
+# close the page store.
+def shutdown():
+    global parser_pool, page_store
+    ScraperData.flush()
+    ScraperData.write_checkpoint(compact=True)
+    ScraperData.close_checkpoint()
+    trap_detector.write_checkpoint()
+    trap_detector.close_checkpoint()
+    if parser_pool is not None:
+        parser_pool.shutdown()
+        parser_pool = None
+    if page_store is not None:
+        page_store.close()
+        page_store = None
+
+
+# Everything the scraper needs from a page, worked out without touching ScraperData.
+class ParsedPage():
+    def __init__(self, links, word_counts=None, simhash=None, tag_count=0, timings=()):
+        # Valid absolute urls the page links to.
+        self.links = links
+        # key: token, value: count of the token on the page
+        self.word_counts = word_counts
+        self.simhash = simhash
+        self.tag_count = tag_count
+        # (stage, seconds) of each step of the parse, recorded by the caller,
+        # which may be in another process.
+        self.timings = timings
+
+# Parse a page and work out its links, and unless links_only is set its token
+# counts, fingerprint and tag count. Runs in a parser process when there is one.
+def parse_page(base_url, content, fingerprint_bits=FINGERPRINT_BITS, links_only=False):
+    start = time.perf_counter()
+    document = parse_document(content)
+    links = url_filter.filter_links(get_absolute_url(base_url, href) for href in document.hrefs)
+    parsed = time.perf_counter()
+    if links_only:
+        return ParsedPage(links, timings=(("parse.document", parsed - start),))
+    word_counts = count_tokens(document.text)
+    tokenized = time.perf_counter()
+    simhash = create_simhash(word_counts, fingerprint_bits)
+    timings = (("parse.document", parsed - start), ("parse.tokenize", tokenized - parsed),
+               ("parse.simhash", time.perf_counter() - tokenized))
+    return ParsedPage(links, word_counts, simhash, document.tag_count, timings)
+
+def run_parse_page(*args):
+    with telemetry.timer("scraper.parse"):
+        if parser_pool is None:
+            page = parse_page(*args)
+        else:
+            # The calling thread waits here without holding the GIL.
+            page = parser_pool.submit(parse_page, *args).result()
+    for stage, seconds in page.timings:
+        telemetry.record(stage, seconds)
+    return page
+
 def scraper(url, resp):
     try:
         return extract_next_links(url, resp)
@@ -33,61 +140,38 @@ def extract_next_links(url, resp):
     links = []
 
     # Ensures only unique links and non-calendar links are traversed and if the website is dead or there is an error.
-    if url in ScraperData.get_unique_links() or is_calendar_url(url):
+    if ScraperData.has_unique_link(url) or is_calendar_url(url):
         return links
     
     parsed = urlparse(url)._replace(fragment='')
 
+    # What the last fetch of this page found, if it was stored.
+    urlhash = get_urlhash(url)
+    with telemetry.timer("scraper.page_store"):
+        stored = page_store.get(urlhash) if page_store is not None else None
+
+    # Not modified since the last fetch, count it and follow its links from the store.
+    if resp.status == 304 and stored is not None:
+        page = stored_page(stored)
+        if page is None:
+            # Stored without its counts, only the links can be reused.
+            return [link for link in stored.links if not trap_detector.is_trap(link)]
+        links = count_page(url, parsed, page)
+
     # Check for valid and non-dead websites (status 200).
-    if (resp.status == 200) and (resp.raw_response.content is not None) and (resp.error is None):
-        # Parse the page content and tokenize the text
-        soup = BeautifulSoup(resp.raw_response.content, "lxml")
-        tokens = tokenize(soup.get_text())
-  
-        # Creates a hash for all tokens in the document.
-        simhash = create_simhash(tokens)
-
-        # Checks for similar website that have been crawled.
-        if ScraperData.similar(simhash):
-            return []
-
-        # Update simhash and file count, write to file if necessary
-        ScraperData.write_simhash(simhash)
-        ScraperData.incr_file_count()
-        if ScraperData.file_count == 100:
-            ScraperData.write_all_tokens()
-            ScraperData.write_subdomains()
-
-        # Get the token and html count.
-        token_count = computeWordFrequencies(tokens, ScraperData.all_tokens)
-        html_count = len(soup.find_all())
-
-        if low_information(token_count, html_count):
-            # Update and write low-info data
-            ScraperData.update_low_info(url, token_count)
-            ScraperData.write_low_info(url)
-        elif "sitemap" not in url and "xml" not in url:
-            # Update and write unique links, and subdomains for ics.uci.edu URLs
-            ScraperData.update_unique_links(url, token_count)
-            ScraperData.write_unique_url(url)
-            if parsed.netloc.endswith(".ics.uci.edu") and parsed.netloc != "www.ics.uci.edu" and parsed.netloc != "ics.uci.edu":
-                ScraperData.update_subdomains(parsed.netloc)
-        
-        # Extract links from the page
-        base_url = resp.url
-        for link in soup.find_all('a', href=True):
-            absolute_url = get_absolute_url(base_url, link)
-            if is_valid(absolute_url):
-                links.append(absolute_url)
+    elif (resp.status == 200) and (resp.raw_response.content is not None) and (resp.error is None):
+        # Byte-identical to the last fetch, skip parsing and reuse what it found.
+        digest = content_digest(resp.raw_response.content)
+        page = stored_page(stored) if stored is not None and stored.digest == digest else None
+        if page is None:
+            # Parse the page once for its links, token counts, simhash and tag count.
+            page = run_parse_page(resp.url, resp.raw_response.content, ScraperData.fingerprint_bits)
+            store_page(urlhash, resp, digest, page)
+        links = count_page(url, parsed, page)
                 
     # Check for redirects (status 3xx).
     elif 300 <= resp.status < 400:
-        soup = BeautifulSoup(resp.raw_response.content, "lxml")
-        base_url = resp.url
-        for link in soup.find_all('a', href=True):
-            absolute_url = get_absolute_url(base_url, link)
-            if is_valid(absolute_url):
-                links.append(absolute_url)
+        links = run_parse_page(resp.url, resp.raw_response.content, ScraperData.fingerprint_bits, True).links
 
     # Invalid status (status 404).
     elif resp.status == 404:
@@ -95,50 +179,124 @@ def extract_next_links(url, resp):
 
     return links
 
+# Count a parsed page in ScraperData, returns the links to follow.
+def count_page(url, parsed, page):
+    # Checks for similar website that have been crawled.
+    with telemetry.timer("scraper.similar"):
+        similar = ScraperData.similar(page.simhash)
+    if similar:
+        telemetry.count("near_duplicates")
+        return []
+
+    ScraperData.write_simhash(page.simhash)
+
+    # Get the token and html count.
+    token_count = ScraperData.add_tokens(page.word_counts)
+    html_count = page.tag_count
+
+    if low_information(token_count, html_count):
+        # Update low-info data
+        ScraperData.update_low_info(url, token_count)
+    elif "sitemap" not in url and "xml" not in url:
+        # Update unique links, and subdomains for ics.uci.edu URLs
+        ScraperData.update_unique_links(url, token_count)
+        if parsed.netloc.endswith(".ics.uci.edu") and parsed.netloc != "www.ics.uci.edu" and parsed.netloc != "ics.uci.edu":
+            ScraperData.update_subdomains(parsed.netloc)
+
+    # Count the page once all of it is buffered, every CHECKPOINT_PAGES
+    # pages ScraperData writes a checkpoint, and the trap stats go with it.
+    with telemetry.timer("scraper.merge"):
+        checkpointed = ScraperData.incr_file_count()
+    if checkpointed:
+        with telemetry.timer("scraper.trap_stats"):
+            trap_detector.write_checkpoint()
+
+    # Links extracted from the page, minus the ones that already ran out of fetch budget
+    return [link for link in page.links if not trap_detector.is_trap(link)]
+
+# Remember a parsed page's validators, digest, links and counts in the page store.
+def store_page(urlhash, resp, digest, page):
+    if page_store is None:
+        return
+    # The headers of the origin server, when the cache server passes them on.
+    headers = getattr(resp.raw_response, "headers", None) or {}
+    counts = encode_counts(ScraperData.fingerprint_bits, page.simhash, page.tag_count, page.word_counts)
+    with telemetry.timer("scraper.page_store"):
+        page_store.put(urlhash, headers.get("ETag"), headers.get("Last-Modified"), digest, page.links, counts)
+
+# The ParsedPage a stored page was counted with, None if its counts were not
+# kept or its simhash has a different width than ScraperData's.
+def stored_page(stored):
+    if stored.counts is None:
+        return None
+    fingerprint_bits, simhash, tag_count, word_counts = stored.counts
+    if fingerprint_bits != ScraperData.fingerprint_bits:
+        return None
+    return ParsedPage(stored.links, word_counts, simhash, tag_count)
+
+# Count a url about to be downloaded against its host's budgets, returns
+# False if it looks like a crawler trap and should not be downloaded.
+def allow_fetch(url):
+    return trap_detector.admit(url)
+
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
     try:
-        parsed = urlparse(url)._replace(fragment='')
-
-        # Conditions for invalid URLs.
-        if is_trap(parsed) or wrong_ending(parsed):
-            return False
-        elif re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|img|mpg|ppsx)$", parsed.path.lower()):
-            return False
-            
-        return True
+        # Scheme, allowed domains, traps and file extensions, see url_filter.py.
+        return url_filter.is_valid(url)
     except TypeError:
-        print("TypeError for ", parsed)
+        print("TypeError for ", url)
         raise
 
 
-# Read text files for data recovery if the server crashes.
+# Recover ScraperData from its checkpoint if the server crashes, or from the
+# text files crawls used to write before there was one.
+def read_checkpoint():
+    if ScraperData.read_checkpoint():
+        return
+    legacy = (("unique_links.txt", read_unique_links), ("hash_vals.txt", read_simhash),
+              ("all_tokens.txt", read_all_tokens), ("subdomains.txt", read_subdomains))
+    for file_name, read in legacy:
+        if os.path.exists(file_name):
+            read()
+    # Carry the data over into the checkpoint.
+    ScraperData.flush()
+    ScraperData.write_checkpoint(full=True)
+
+# Recover the trap detector's counters from the checkpoint.
+def read_trap_stats():
+    trap_detector.read_checkpoint()
+
+# Read the text files of an older crawl.
 def read_unique_links():
     for line in open("unique_links.txt"):
         url, count = line.rstrip('\n').split(", ")
-        ScraperData.update_unique_links(url, count)
+        ScraperData.update_unique_links(url, int(count))
 
+# The simhashes of an older crawl are 32-bit md5 fingerprints, which are never
+# within a few bits of the current ones, and can not be worked out again
+# without the pages. They are left out: pages crawled before are not checked
+# for near duplicates.
 def read_simhash():
-    for line in open("hash_vals.txt"):
-        hash = int(line.rstrip('\n'))
-        ScraperData.update_simhash_values(hash)
+    with open("hash_vals.txt") as file:
+        skipped = sum(1 for line in file if line.strip())
+    if skipped:
+        get_logger("SCRAPER").warning(
+            f"Skipped {skipped} simhashes of hash_vals.txt, made by an older version of the crawler. "
+            f"Pages crawled before are not checked for near duplicates.")
 
 def read_all_tokens():
+    counts = Counter()
     for line in open("all_tokens.txt"):
         token, freq = line.rstrip('\n').split(", ")
-        ScraperData.all_tokens[token] = int(freq)
+        counts[token] = int(freq)
+    ScraperData.add_tokens(counts)
 
 def read_subdomains():
+    counts = PageCounts()
     for line in open("subdomains.txt"):
         subdom, freq = line.rstrip('\n').split(", ")
-        ScraperData.subdomains[subdom] = int(freq)
+        counts.subdomains[subdom] = int(freq)
+    ScraperData.merge(counts)
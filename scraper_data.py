@@ -1,86 +1,400 @@
-from collections import defaultdict
-from simhash import hamming_distance
+import heapq
+import threading
+from bisect import insort
+from array import array
+from collections import defaultdict, Counter
+from itertools import repeat
+from operator import add, itemgetter
+from simhash import SimhashIndex, max_bit_distance, FINGERPRINT_BITS
+from checkpoint import CheckpointLog, BLOCK_RECORDS, encode_block
+from heavy_hitters import TopCounts, TopKeys
+from utils.telemetry import telemetry
 
-class ScraperData():
+# Normalized hamming distance below which two pages count as near duplicates.
+SIMILARITY_THRESHOLD = 0.05
+# Checkpoint log of each part of the data. all_tokens and subdomains log
+# count increments, the others log each url or fingerprint once. With tokens
+# counted approximately, token_sketch and top_tokens hold the whole of
+# ScraperData.top_tokens instead of all_tokens.
+CHECKPOINT_LOGS = ("all_tokens", "subdomains", "unique_links", "low_info", "hash_vals",
+                   "token_sketch", "top_tokens")
+# Pages a thread counts on its own before merging them into the totals.
+MERGE_PAGES = 10
+# Merged pages between two checkpoints.
+CHECKPOINT_PAGES = 100
+# Tokens with the highest counts kept up to date for the report, when
+# counting exactly.
+REPORT_TOKENS = 50
+
+# Add the counts of checkpoint log blocks into counts. The sums are worked
+# out lazily as update consumes them, so a key repeated in a block adds up.
+# dict.update, since Counter.update would count the pairs themselves.
+def add_up(counts, blocks):
+    for keys, values in blocks:
+        dict.update(counts, zip(keys, map(add, values, map(counts.get, keys, repeat(0)))))
+
+# Replace counts with the totals of a checkpoint log. The base is copied in
+# as it is, only the records appended since it are added up.
+def read_totals(counts, log):
+    counts.clear()
+    for base, keys, values in log.read_blocks():
+        if base:
+            dict.update(counts, zip(keys, values))
+        else:
+            add_up(counts, ((keys, values),))
+
+# Add the counts of the mapping other into counts.
+def add_counts(counts, other):
+    add_up(counts, ((other.keys(), other.values()),))
+
+# add_counts(), returning the new totals of the keys of other, in its order.
+def add_totals(counts, other):
+    totals = list(map(add, other.values(), map(counts.get, other.keys(), repeat(0))))
+    dict.update(counts, zip(other.keys(), totals))
+    return totals
+
+
+# The checkpoint log blocks of a batch of counts, by log, for the parts of it
+# that are not empty, the token counts only when they are counted exactly.
+# Subdomain counts are logged at checkpoints instead.
+def log_blocks(counts, exact):
+    blocks = dict()
+    for name, items in (("all_tokens", counts.tokens if exact else None), ("unique_links", counts.unique_links),
+                        ("low_info", counts.low_info)):
+        if items:
+            blocks[name] = encode_block(items.keys(), items.values())
+    if counts.simhashes:
+        blocks["hash_vals"] = encode_block([""] * len(counts.simhashes), counts.simhashes)
+    return blocks
+
+
+class PageCounts():
+    # What a batch of pages adds to ScraperData, kept apart from it so a
+    # thread, or a parser process once pickled, can count pages without
+    # taking any shared lock, and merged into the totals in one go.
     def __init__(self):
+        self.pages = 0
+        # key: token, value: count of the token on the pages
+        self.tokens = Counter()
+        # key: ics.uci.edu subdomain, value: unique pages found in it
+        self.subdomains = Counter()
+        # key: url, value: total number of tokens on the url
+        self.unique_links = dict()
+        self.low_info = dict()
+        # Fingerprints of the pages, in the order they were seen.
+        self.simhashes = []
+
+    def __bool__(self):
+        return bool(self.pages or self.tokens or self.subdomains or self.unique_links
+                    or self.low_info or self.simhashes)
+
+
+class ScraperData():
+    def __init__(self, fingerprint_bits=FINGERPRINT_BITS, checkpoint_dir="checkpoint"):
         # key: tokens, value: count of each token
         self.all_tokens = defaultdict(int)
+        # The REPORT_TOKENS tokens of all_tokens with the highest counts.
+        self.top_exact = TopKeys(REPORT_TOKENS)
+        # The tokens with the highest counts, in fixed memory, instead of
+        # all_tokens once approximate_tokens() is called.
+        self.top_tokens = None
         # key: unique urls, value: total number of tokens on each url
         self.unique_links = dict()
+        # (url, tokens) of the unique url with the most tokens so far.
+        self.longest = ("", 0)
         # key: ics.uci.edu subdomains, value: number of unique pages detected in each subdomain
         self.subdomains = defaultdict(int)
-        # all simhash vlaues
-        self.simhash_values = set()
+        # The keys of subdomains, in order.
+        self.subdomain_names = []
+        # all simhash vlaues, indexed for near-duplicate lookups
+        self.fingerprint_bits = fingerprint_bits
+        self.simhash_values = SimhashIndex(
+            bits=fingerprint_bits, k=max_bit_distance(SIMILARITY_THRESHOLD, fingerprint_bits))
         # key: low info url, value: total number of tokens on each url
         self.low_info = dict()
         self.file_count = 0
+        # Subdomain counts added since the last checkpoint. Token counts are
+        # logged as each batch is merged, summing them here first would be
+        # another pass over every token of the batch.
+        self.subdomain_deltas = Counter()
+        self.logs = dict()
+        self.open_checkpoint(checkpoint_dir)
+        # Guards the totals above while a batch is merged into them.
+        self.lock = threading.RLock()
+        # Guards simhash_values, looked up and added to by every page.
+        self.simhash_lock = threading.Lock()
+        # Per thread, its (lock, PageCounts) buffer. Only that thread and
+        # flush() use the lock, so it is hardly ever waited for.
+        self.local = threading.local()
+        self.buffers = []
+
+    # Checkpoint to the logs in directory from now on.
+    def open_checkpoint(self, directory):
+        for log in self.logs.values():
+            log.close()
+        self.checkpoint_dir = directory
+        self.logs = {name: CheckpointLog(directory, name) for name in CHECKPOINT_LOGS}
+        # Whether the token counts of this checkpoint were added to top_tokens.
+        self.top_tokens_loaded = False
+
+    # Count tokens in a TopCounts of capacity tokens, with a count-min sketch
+    # of the given error bounds, from now on. Called before anything is
+    # counted or read from the checkpoint.
+    def approximate_tokens(self, capacity, epsilon, delta):
+        self.top_tokens = TopCounts(capacity, epsilon, delta)
 
+    # Add the token counts of the checkpoint to top_tokens, from a checkpoint
+    # of a crawl that counted exactly too. The sketch can not be appended to,
+    # so this is done once, before it is first written.
+    def load_top_tokens(self):
+        self.top_tokens_loaded = True
+        if self.logs["token_sketch"].exists():
+            table = array("Q")
+            for _, values in self.logs["token_sketch"].read():
+                table.extend(values)
+            keys = [key for keys, _ in self.logs["top_tokens"].read() for key in keys]
+            self.top_tokens.merge(table, keys)
+        else:
+            for keys, values in self.logs["all_tokens"].read():
+                for key, value in zip(keys, values):
+                    self.top_tokens.add(key, value)
+
+    # The n tokens with the highest counts, as (token, count). Under the lock,
+    # merge() updates the counts this reads from other threads.
+    def get_top_tokens(self, n):
+        with self.lock:
+            if self.top_tokens is not None:
+                return self.top_tokens.top(n)
+            if n <= REPORT_TOKENS:
+                return self.top_exact.top(n)
+            return heapq.nlargest(n, self.all_tokens.items(), key=itemgetter(1))
+
+    # The calling thread's buffer, registered on first use so flush() finds it.
+    def buffer(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = [threading.Lock(), PageCounts()]
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    # Count a page done by the calling thread, after everything it adds has
+    # been counted. Every MERGE_PAGES pages the thread's buffer is merged into
+    # the totals. Returns True if that merge wrote a checkpoint.
     def incr_file_count(self):
-        self.file_count += 1
+        buffer = self.buffer()
+        with buffer[0]:
+            counts = buffer[1]
+            counts.pages += 1
+            if counts.pages < MERGE_PAGES:
+                return False
+            buffer[1] = PageCounts()
+        return self.merge(counts)
+
+    # Add a batch of counts to the totals and the checkpoint logs, from any
+    # thread, or from another process as a pickled PageCounts. Every
+    # CHECKPOINT_PAGES pages merged a checkpoint is written, returns True if
+    # this merge wrote one. The log blocks are encoded and the fingerprints
+    # indexed before the lock is taken, only the totals and the order of the
+    # log blocks need it.
+    def merge(self, counts):
+        blocks = log_blocks(counts, self.top_tokens is None)
+        # Already in the index when they went through similar() in this
+        # process, adding them again does nothing.
+        if counts.simhashes:
+            with self.simhash_lock:
+                for value in counts.simhashes:
+                    self.simhash_values.add(value)
+        longest = max(counts.unique_links.items(), key=itemgetter(1), default=("", 0))
+        with self.lock:
+            if self.top_tokens is None:
+                totals = add_totals(self.all_tokens, counts.tokens)
+                self.top_exact.offer_all(counts.tokens.keys(), totals)
+            else:
+                self.top_tokens.update(counts.tokens)
+            for subdomain in counts.subdomains:
+                if subdomain not in self.subdomains:
+                    insort(self.subdomain_names, subdomain)
+            add_counts(self.subdomains, counts.subdomains)
+            add_counts(self.subdomain_deltas, counts.subdomains)
+            self.unique_links.update(counts.unique_links)
+            if longest[1] > self.longest[1]:
+                self.longest = longest
+            self.low_info.update(counts.low_info)
+            for name, block in blocks.items():
+                self.logs[name].append_block(block)
+            self.file_count += counts.pages
+            if self.file_count < CHECKPOINT_PAGES:
+                return False
+            # Reset here, so only this merge writes the checkpoint.
+            self.file_count = 0
+        self.write_checkpoint()
+        return True
 
-    # Getter and setter methods.
+    # Merge what every thread counted so far, before the totals are read.
+    def flush(self):
+        with self.lock:
+            for buffer in self.buffers:
+                with buffer[0]:
+                    counts = buffer[1]
+                    buffer[1] = PageCounts()
+                if counts:
+                    self.merge(counts)
+
+    # Getter and setter methods. The setters count into the calling thread's
+    # buffer, the getters only see what has been merged.
     def get_unique_links_keys(self):
         return self.unique_links.keys()
     def get_unique_links(self):
         return self.unique_links.items()
+    # Whether a url was counted as a unique link, by any thread. The calling
+    # thread's buffer is checked too, other threads' are not merged yet.
+    def has_unique_link(self, url):
+        if url in self.unique_links:
+            return True
+        buffer = self.buffer()
+        with buffer[0]:
+            return url in buffer[1].unique_links
     def get_unique_links_value(self, url):
         return self.unique_links[url]
     def update_unique_links(self, url, count):
-        self.unique_links[url] = count
+        buffer = self.buffer()
+        with buffer[0]:
+            buffer[1].unique_links[url] = count
+
+    # (subdomain, unique pages) of every ics.uci.edu subdomain, by name.
+    def get_subdomains(self):
+        with self.lock:
+            return [(name, self.subdomains[name]) for name in self.subdomain_names]
 
     def update_subdomains(self, subdomain):
-        self.subdomains[subdomain] += 1
+        buffer = self.buffer()
+        with buffer[0]:
+            buffer[1].subdomains[subdomain] += 1
+
+    # Count a page's tokens, a Counter, returns how many it has.
+    def add_tokens(self, word_counts):
+        buffer = self.buffer()
+        with buffer[0]:
+            add_counts(buffer[1].tokens, word_counts)
+        return sum(word_counts.values())
 
     def get_simhash_values(self):
         return self.simhash_values
     def update_simhash_values(self, value):
-        self.simhash_values.add(value)
+        with self.simhash_lock:
+            self.simhash_values.add(value)
 
     def update_low_info(self, url, count):
-        self.low_info[url] = count
+        buffer = self.buffer()
+        with buffer[0]:
+            buffer[1].low_info[url] = count
     def get_low_info_value(self, url):
         return self.low_info[url]
 
-    # Write data contents to file for crash recovery.
-    def write_unique_url(self, url):
-        with open("unique_links.txt", 'a') as file:
-            file.write(f"{url}, {self.get_unique_links_value(url)}\n")
-    
+    # Log a page's fingerprint with the rest of its counts.
     def write_simhash(self, hash):
-        with open("hash_vals.txt", 'a') as file:
-            file.write(f"{hash}\n")
-    
-    def write_all_tokens(self):
-        with open("all_tokens.txt", 'w') as file:
-            for token, freq in self.all_tokens.items():
-                file.write(f"{token}, {freq}\n")
-        self.file_count = 0
-    
-    def write_subdomains(self):
-        with open("subdomains.txt", 'w') as file:
-            for subdom, freq in self.subdomains.items():
-                file.write(f"{subdom}, {freq}\n")
-    
-    def write_low_info(self, url):
-        with open("low_info.txt", 'a') as file:
-            file.write(f"{url}, {self.get_low_info_value(url)}\n")
+        buffer = self.buffer()
+        with buffer[0]:
+            buffer[1].simhashes.append(hash)
+
+    # Write everything since the last checkpoint to the logs. Token and
+    # subdomain counts are logged as increments, so this costs the same
+    # whatever the size of the vocabulary, and their logs are compacted into
+    # the totals once they grow a few times longer than those, or whatever
+    # their length with compact set, as when the crawl stops, so the next
+    # start reads the totals only. With full set, every log is replaced by
+    # what is in memory instead. Approximate token counts take the same,
+    # fixed room every time, and are written whole. Only the logs are cut
+    # and the totals they are compacted into copied under the lock, other
+    # threads go on merging while they are written.
+    def write_checkpoint(self, full=False, compact=False):
+        with telemetry.timer("scraper_data.checkpoint"):
+            with self.lock:
+                self.logs["subdomains"].extend(self.subdomain_deltas.items())
+                self.subdomain_deltas.clear()
+                totals = [("subdomains", self.subdomains)]
+                if self.top_tokens is None:
+                    totals.append(("all_tokens", self.all_tokens))
+                if full:
+                    totals += [("unique_links", self.unique_links), ("low_info", self.low_info)]
+                # (log, compaction started, items of the base)
+                compactions = [(self.logs[name], self.logs[name].start_compaction(), dict(counts).items())
+                               for name, counts in totals
+                               if full or compact or self.logs[name].needs_compaction(len(counts))]
+                if full:
+                    with self.simhash_lock:
+                        hash_vals = list(self.simhash_values)
+                    log = self.logs["hash_vals"]
+                    compactions.append((log, log.start_compaction(), (("", value) for value in hash_vals)))
+                if self.top_tokens is not None:
+                    if not self.top_tokens_loaded:
+                        self.load_top_tokens()
+                    table = self.top_tokens.sketch.table[:]
+                    sketch = self.logs["token_sketch"].start_compaction()
+                    log = self.logs["top_tokens"]
+                    compactions.append((log, log.start_compaction(), dict(self.top_tokens.keys.counts).items()))
+            for log in self.logs.values():
+                log.flush()
+            if self.top_tokens is not None:
+                blocks = (table[start:start + BLOCK_RECORDS] for start in range(0, len(table), BLOCK_RECORDS))
+                self.logs["token_sketch"].compact_blocks((([""] * len(block), block) for block in blocks), sketch)
+            for log, started, items in compactions:
+                log.compact(items, started)
+
+    # Replace the data with what was checkpointed, after writing out what was
+    # not yet, threads' buffers included. Returns False if there is no checkpoint.
+    def read_checkpoint(self):
+        with self.lock:
+            if not any(log.exists() for log in self.logs.values()):
+                return False
+            self.flush()
+            self.write_checkpoint()
+            # The sketch in memory has every count, whether checkpointed or not.
+            if self.top_tokens is None:
+                read_totals(self.all_tokens, self.logs["all_tokens"])
+                self.top_exact.load(self.all_tokens.items())
+            read_totals(self.subdomains, self.logs["subdomains"])
+            self.subdomain_names = sorted(self.subdomains)
+            self.unique_links = dict()
+            for keys, values in self.logs["unique_links"].read():
+                self.unique_links.update(zip(keys, values))
+            self.longest = ("", 0)
+            if self.unique_links:
+                self.longest = max(self.unique_links.items(), key=itemgetter(1))
+            self.low_info = dict()
+            for keys, values in self.logs["low_info"].read():
+                self.low_info.update(zip(keys, values))
+            simhash_values = SimhashIndex(
+                bits=self.fingerprint_bits, k=max_bit_distance(SIMILARITY_THRESHOLD, self.fingerprint_bits))
+            for _, values in self.logs["hash_vals"].read():
+                for value in values:
+                    simhash_values.add(value)
+            with self.simhash_lock:
+                self.simhash_values = simhash_values
+            return True
+
+    # Delete the checkpoint, for a crawl started over from the seeds.
+    def clear_checkpoint(self):
+        for log in self.logs.values():
+            log.clear()
+
+    def close_checkpoint(self):
+        for log in self.logs.values():
+            log.close()
 
-    # Simhash similarity checker.
+    # Simhash similarity checker. Unlike the counts this needs every page seen
+    # so far, by any thread, so it is checked and added under one lock.
     def similar(self, simhash):
-        # Check similarity of a new simhash with existing simhash values.
-        for i in self.get_simhash_values():
-            similarity = hamming_distance(simhash, i)
-            if similarity < 0.05: # Threshold for similarity.
+        with self.simhash_lock:
+            # Check similarity of a new simhash with existing simhash values.
+            if self.get_simhash_values().near(simhash) is not None:
                 return True
-        # If not similar, add the new simhash value to the set.
-        self.update_simhash_values(simhash)
-        return False
+            # If not similar, add the new simhash value to the set.
+            self.simhash_values.add(simhash)
+            return False
     
     # Get information about the longest page
     def get_longest_info(self):
-        if len(self.unique_links.keys()) == 0:
-            return ("", 0)
-        max_key = max(self.unique_links, key=self.unique_links.get)
-        max_value = self.unique_links[max_key]
-        return (max_key, max_value)
+        return self.longest
     
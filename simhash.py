@@ -1,38 +1,120 @@
-import hashlib
-from collections import defaultdict
-from tokenizer import computeWordFrequencies
-
-def create_simhash(features):
-    # Initialize an array to hold the weights for each bit position.
-    simhash = [0] * 32
-    
-    # Compute word frequencies.
-    frequencies = defaultdict(int)
-    computeWordFrequencies(features, frequencies)
-
-    for feature in features:
-        # Get the hash value.
-        hashed_feature = hashlib.md5(feature.encode()).hexdigest()
-        # Get weights to the feature based on token frequency.
-        weight = frequencies.get(feature, 0)
-
-        # Convert the hashed feature to a binary string.
-        binary_hash = bin(int(hashed_feature, 16))[2:].zfill(128)
-        
-        # Update the simhash value based on the hashed feature and its weight.
-        for j in range(0, 32):
-            if binary_hash[j] == '1':
-                simhash[j] += weight
-            else:
-                simhash[j] -= weight
+import math
+import numpy as np
+from hashlib import blake2b
+from collections import Counter
+from itertools import combinations
+from tokenizer import stop_word
+
+# Width of the fingerprints produced by create_simhash, at most 64 bits.
+FINGERPRINT_BITS = 64
+
+def create_simhash(features, bits=FINGERPRINT_BITS):
+    # Compute word frequencies, which weight each unique token. features is a
+    # list of tokens or a Counter of them (from count_tokens). Stop words are
+    # checked once per unique token rather than once per occurrence.
+    frequencies = {token: count for token, count in Counter(features).items() if not stop_word(token)}
+    if not frequencies:
+        return 0
+
+    # Hash each unique token once into 8 bytes. blake2b is keyed on nothing
+    # process specific, unlike hash(), so fingerprints stay stable across runs.
+    digests = b''.join(blake2b(token.encode(), digest_size=8).digest() for token in frequencies)
+    hashes = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8)
+    weights = np.fromiter(frequencies.values(), dtype=np.int64, count=len(frequencies))
+
+    # Row i holds the bits of token i's hash, lowest bit first.
+    bit_matrix = np.unpackbits(hashes, axis=1, bitorder='little')[:, :bits]
 
-    # Convert the simhash array to a binary string.
-    simhash_binary = ''.join(['1' if val > 0 else '0' for val in simhash])
-    
-    # Convert the binary string to an integer.
-    simhash_value = int(simhash_binary, 2)
+    # Per bit position: weight of tokens with the bit set minus weight of those without.
+    totals = 2 * (weights @ bit_matrix) - weights.sum()
+
+    # Set the fingerprint bits whose total is positive.
+    simhash_value = 0
+    for position in np.flatnonzero(totals > 0):
+        simhash_value |= 1 << int(position)
     return simhash_value
 
 # Compute the Hamming distance between two simhash values.
-def hamming_distance(simhash1, simhash2):
-    return bin(simhash1 ^ simhash2).count('1') / 32.0
\ No newline at end of file
+def hamming_distance(simhash1, simhash2, bits=FINGERPRINT_BITS):
+    return bin(simhash1 ^ simhash2).count('1') / float(bits)
+
+# Largest number of differing bits that still counts as similar, given the
+# normalized threshold used by ScraperData.similar (distance < threshold).
+def max_bit_distance(threshold, bits=FINGERPRINT_BITS):
+    return max(math.ceil(threshold * bits) - 1, 0)
+
+
+# Permuted-table index over simhash fingerprints (Manku et al., WWW '07).
+# The fingerprint is split into `blocks` bit blocks. Two fingerprints that are
+# at most k bits apart differ in at most k blocks, so they agree exactly on
+# some choice of (blocks - k) blocks. One table is kept per such choice, keyed
+# by the fingerprint masked down to those blocks, and a lookup only compares
+# against the fingerprints sharing a key instead of every fingerprint seen.
+# More blocks means longer keys (smaller buckets) but more tables in memory.
+class SimhashIndex():
+    def __init__(self, bits=FINGERPRINT_BITS, k=3, blocks=None):
+        blocks = blocks if blocks is not None else k + 2
+        if not k < blocks <= bits:
+            raise ValueError(f"Need k < blocks <= bits, got k={k}, blocks={blocks}, bits={bits}.")
+        self.bits = bits
+        self.k = k
+        self.fingerprint_mask = (1 << bits) - 1
+
+        # Bit masks of each block, spreading the remainder over the first blocks.
+        block_masks = []
+        start = 0
+        for i in range(blocks):
+            width = bits // blocks + (1 if i < bits % blocks else 0)
+            block_masks.append(((1 << width) - 1) << start)
+            start += width
+
+        # One table per combination of blocks that has to match exactly.
+        self.masks = [sum(combo) for combo in combinations(block_masks, blocks - k)]
+        # key: masked fingerprint, value: a fingerprint, or a list of them once the key is shared
+        self.tables = [dict() for _ in self.masks]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # Every fingerprint is stored in each table, so walking the first is enough.
+        for bucket in self.tables[0].values():
+            if isinstance(bucket, list):
+                yield from bucket
+            else:
+                yield bucket
+
+    def __contains__(self, fingerprint):
+        fingerprint &= self.fingerprint_mask
+        bucket = self.tables[0].get(fingerprint & self.masks[0])
+        if isinstance(bucket, list):
+            return fingerprint in bucket
+        return bucket == fingerprint
+
+    # Returns a stored fingerprint at most k bits away from the given one, or None.
+    def near(self, fingerprint):
+        fingerprint &= self.fingerprint_mask
+        for mask, table in zip(self.masks, self.tables):
+            bucket = table.get(fingerprint & mask)
+            if bucket is None:
+                continue
+            for candidate in (bucket if isinstance(bucket, list) else (bucket,)):
+                if bin(fingerprint ^ candidate).count('1') <= self.k:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        fingerprint &= self.fingerprint_mask
+        if fingerprint in self:
+            return
+        for mask, table in zip(self.masks, self.tables):
+            key = fingerprint & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = fingerprint
+            elif isinstance(bucket, list):
+                bucket.append(fingerprint)
+            else:
+                table[key] = [bucket, fingerprint]
+        self.count += 1
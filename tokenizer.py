@@ -1,9 +1,9 @@
 import sys
 import re
+from collections import Counter
 
-# Checking if the word is an English stop word
-def stop_word(word):
-    stop_words = {
+# English stop words, built once.
+STOP_WORDS = frozenset({
     'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 'and', 'any', 'are', "aren't", 'as',
     'at', 'be', 'because', 'been', 'before', 'being', 'below', 'between', 'both', 'but', 'by', "can't", 'cannot',
     'could', "couldn't", 'did', "didn't", 'do', 'does', "doesn't", 'doing', "don't", 'down', 'during', 'each',
@@ -17,29 +17,56 @@ def stop_word(word):
     'those', 'through', 'to', 'too', 'under', 'until', 'up', 'very', 'was', "wasn't", 'we', "we'd", "we'll",
     "we're", "we've", 'were', "weren't", 'what', "what's", 'when', "when's", 'where', "where's", 'which', 'while',
     'who', "who's", 'whom', 'why', "why's", 'with', "won't", 'would', "wouldn't", 'you', "you'd", "you'll",
-    "you're", "you've", 'your', 'yours', 'yourself', 'yourselves'}
+    "you're", "you've", 'your', 'yours', 'yourself', 'yourselves'})
 
-    return word in stop_words
+# Valid characters "A-Z, a-z, 0-9, '" (and the ’ apostrophe), a token is a run of them.
+TOKEN_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'\u2019")
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9'\u2019]+")
+
+# Checking if the word is an English stop word
+def stop_word(word):
+    return word in STOP_WORDS
+
+# Yields the words of a text one at a time, so a huge page never builds a
+# full token list. Stop words (checked before lowercasing) are skipped, and so
+# is a word that runs into the very end of the text.
+def iter_tokens(website):
+    end = len(website)
+    for match in TOKEN_PATTERN.finditer(website):
+        tok = match.group()
+        if match.end() != end and tok not in STOP_WORDS:
+            yield tok.lower()
 
 # Tokenizes a text file into words.
 def tokenize(website):
-    toks = []
-    tok = ''
-    for char in website:
-        # Valid characters "A-Z, a-z, 0-9, '"
-        if ("a" <= char <= "z" or "A" <= char <= "Z" or 
-            "0" <= char <= "9" or 
-            char == "'" or char == "’"):
-            tok += char
-        else:
-            if tok != '':
-                if not stop_word(tok):
-                    toks.append(tok.lower())
-                tok = ''
-    return toks
+    return list(iter_tokens(website))
+
+# Frequency of each non stop word token in a text, in a single pass. Raw
+# matches are counted first, so stop words and lowercasing are only checked
+# once per distinct word.
+def count_tokens(website):
+    raw = Counter(map(re.Match.group, TOKEN_PATTERN.finditer(website)))
+    # Like tokenize, a word that runs into the very end of the text is dropped.
+    start = len(website)
+    while start > 0 and website[start - 1] in TOKEN_CHARS:
+        start -= 1
+    if start < len(website):
+        raw[website[start:]] -= 1
+    counts = Counter()
+    for tok, tok_count in raw.items():
+        if tok_count > 0 and tok not in STOP_WORDS:
+            tok = tok.lower()
+            if tok not in STOP_WORDS:
+                counts[tok] += tok_count
+    return counts
 
-# Computes the frequency of each token in a list of tokens.
+# Computes the frequency of each token in a list of tokens, or adds in the
+# counts from count_tokens.
 def computeWordFrequencies(toks, freq):
+    if isinstance(toks, Counter):
+        for token, token_count in toks.items():
+            freq[token] += token_count
+        return sum(toks.values())
     count = 0
     for token in toks:
         if not stop_word(token):
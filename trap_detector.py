@@ -0,0 +1,173 @@
+import re
+from collections import Counter, OrderedDict
+from threading import Lock
+from urllib.parse import urlsplit
+
+from checkpoint import CheckpointLog
+
+# Checkpoint logs of the counters, next to the ScraperData ones. Both log
+# count increments, templates keyed by "host template".
+CHECKPOINT_LOGS = ("trap_hosts", "trap_templates")
+
+# Runs of digits in a path segment, collapsed so /2019/01/02 and /2020/03/04 share a template.
+DIGITS = re.compile(r"\d+")
+# Long hex strings, usually ids or hashes.
+HEX_ID = re.compile(r"[0-9a-fA-F]{16,}")
+# Session ids in the path or the query.
+SESSION_ID = re.compile(r"(^|[;?&])(jsessionid|phpsessid|sessionid|sid)=", re.IGNORECASE)
+
+
+# Template of a url: its path with numbers and ids collapsed and its query
+# reduced to the sorted parameter names, so every page of a calendar or a
+# paged listing maps to the same template.
+def url_template(path, query):
+    template = HEX_ID.sub("{id}", DIGITS.sub("{n}", path))
+    if query:
+        names = sorted({param.partition('=')[0] for param in query.split('&')})
+        template += "?" + "&".join(names)
+    return template
+
+
+class TrapDetector(object):
+    # Keeps per-host statistics of the pages fetched so far and stops fetching
+    # urls that look like a crawler trap:
+    #   - template_limit pages of the same host and url template were fetched,
+    #   - host_budget pages of the same host were fetched (0 turns it off),
+    #   - a path segment repeated repeat_limit times or more,
+    #   - a session id in the url.
+    # Both counters are LRU-bounded to max_entries, so memory stays bounded
+    # however many hosts and templates the crawl runs into. They are
+    # checkpointed like ScraperData, as the increments since the last
+    # checkpoint, compacted into the totals from time to time.
+    def __init__(self, template_limit=500, host_budget=0, repeat_limit=3, max_entries=100000):
+        self.template_limit = template_limit
+        self.host_budget = host_budget
+        self.repeat_limit = repeat_limit
+        self.max_entries = max_entries
+        self.lock = Lock()
+        # key: (host, template), value: pages fetched
+        self.templates = OrderedDict()
+        # key: host, value: pages fetched
+        self.hosts = OrderedDict()
+        # Pages counted since the last checkpoint, per host and per template,
+        # once open_checkpoint() was called.
+        self.host_deltas = Counter()
+        self.template_deltas = Counter()
+        self.logs = dict()
+        # Held while a checkpoint is written, so a compaction covers every
+        # increment logged before it.
+        self.checkpoint_lock = Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.trap_template_limit, config.trap_host_budget,
+                   config.trap_repeat_limit, config.trap_max_entries)
+
+    # Whether a url looks like a trap, without counting it.
+    def is_trap(self, url):
+        host, template, trap = self._inspect(url)
+        if trap:
+            return True
+        with self.lock:
+            return self._over_budget(host, template)
+
+    # Count a page about to be fetched, returns False (and counts nothing) if it is a trap.
+    def admit(self, url):
+        host, template, trap = self._inspect(url)
+        if trap:
+            return False
+        with self.lock:
+            if self._over_budget(host, template):
+                return False
+            self._add(self.templates, (host, template), 1)
+            self._add(self.hosts, host, 1)
+            if self.logs:
+                self.template_deltas[(host, template)] += 1
+                self.host_deltas[host] += 1
+        return True
+
+    def _inspect(self, url):
+        parts = urlsplit(url)
+        if SESSION_ID.search(parts.path) or SESSION_ID.search("?" + parts.query):
+            return None, None, True
+        segments = [segment for segment in parts.path.split('/') if segment]
+        if segments and max(Counter(segments).values()) >= self.repeat_limit:
+            return None, None, True
+        return parts.hostname or "-", url_template(parts.path, parts.query), False
+
+    def _over_budget(self, host, template):
+        if self.templates.get((host, template), 0) >= self.template_limit:
+            return True
+        return self.host_budget > 0 and self.hosts.get(host, 0) >= self.host_budget
+
+    # Checkpoint to the logs in directory from now on, the ScraperData one.
+    def open_checkpoint(self, directory):
+        self.close_checkpoint()
+        self.logs = {name: CheckpointLog(directory, name) for name in CHECKPOINT_LOGS}
+
+    # Log the pages counted since the last checkpoint, which costs the same
+    # whatever the number of hosts and templates tracked. A log is compacted
+    # into the totals once it grows a few times longer than them, hosts and
+    # templates evicted by then are dropped from it.
+    def write_checkpoint(self):
+        if not self.logs:
+            return
+        with self.checkpoint_lock:
+            with self.lock:
+                deltas = (("trap_hosts", self.host_deltas, self.hosts),
+                          ("trap_templates", self.template_deltas, self.templates))
+                self.host_deltas, self.template_deltas = Counter(), Counter()
+                totals = dict()
+                for name, _, counts in deltas:
+                    if self.logs[name].needs_compaction(len(counts)):
+                        totals[name] = list(counts.items())
+            for name, increments, _ in deltas:
+                log = self.logs[name]
+                log.extend(self._keys(name, increments.items()))
+                if name in totals:
+                    log.compact(self._keys(name, totals[name]))
+                else:
+                    log.flush()
+
+    # Replace the counters with what was checkpointed, in the order they were
+    # last compacted in, trimmed to max_entries. A host or template evicted
+    # since the last compaction comes back with its earlier pages counted
+    # too, so a recovered count is never under the one before the crash.
+    # Returns False if there is no checkpoint.
+    def read_checkpoint(self):
+        if not any(log.exists() for log in self.logs.values()):
+            return False
+        with self.checkpoint_lock, self.lock:
+            self.hosts, self.templates = OrderedDict(), OrderedDict()
+            for keys, values in self.logs["trap_hosts"].read():
+                for host, count in zip(keys, values):
+                    self._add(self.hosts, host, count)
+            for keys, values in self.logs["trap_templates"].read():
+                for key, count in zip(keys, values):
+                    host, _, template = key.partition(' ')
+                    self._add(self.templates, (host, template), count)
+            self.host_deltas, self.template_deltas = Counter(), Counter()
+        return True
+
+    # Delete the checkpoint, for a crawl started over from the seeds.
+    def clear_checkpoint(self):
+        for log in self.logs.values():
+            log.clear()
+
+    def close_checkpoint(self):
+        for log in self.logs.values():
+            log.close()
+
+    # Log records of counter items, templates keyed by "host template".
+    @staticmethod
+    def _keys(name, items):
+        if name == "trap_hosts":
+            return items
+        return ((f"{host} {template}", count) for (host, template), count in items)
+
+    # Add count to a key of an LRU-bounded counter.
+    def _add(self, counts, key, count):
+        counts[key] = counts.get(key, 0) + count
+        counts.move_to_end(key)
+        if len(counts) > self.max_entries:
+            counts.popitem(last=False)
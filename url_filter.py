@@ -0,0 +1,139 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# Default rules, the ones the crawler has always used. Each can be replaced
+# from the [FILTER] section of config.ini.
+ALLOWED_SCHEMES = ("http", "https")
+# A url's host has to end with one of these (so ics.uci.edu itself does not).
+ALLOWED_DOMAINS = (".informatics.uci.edu", ".stat.uci.edu", ".ics.uci.edu", ".cs.uci.edu")
+# File extensions that are never crawled.
+BLOCKED_EXTENSIONS = (
+    "css", "js", "bmp", "gif", "jpeg", "jpg", "ico",
+    "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4",
+    "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf",
+    "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls", "xlsx", "names",
+    "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv",
+    "rm", "smil", "wmv", "swf", "wma", "zip", "rar", "gz", "img", "mpg", "ppsx")
+# Path prefixes of known crawler traps.
+TRAP_PATHS = ("/~eppstein/pix", "/~eppstein/pubs/pubs.sh")
+# Urls whose query contains any of these are traps (downloads, logins, edit pages).
+TRAP_QUERIES = ("download", "login", "edit", "do=backlink")
+# Decisions remembered per filter, pages mostly link to the same navigation urls.
+DECISION_CACHE_SIZE = 1 << 16
+
+# Splits a url into scheme, netloc, path and query the way urlsplit does, for
+# urls made only of printable ASCII without spaces or brackets. Anything else
+# (IPv6 hosts, control characters, unicode) goes through urlsplit itself.
+URL_PARTS = re.compile(r"(?:([A-Za-z][A-Za-z0-9+.\-]*):)?(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?")
+NOT_PLAIN = re.compile(r"[^!-Z\\^-~]")
+# Characters of such urls, of their host and port, of their path, of their
+# query, and of the last path segment before any ';'. Rules made of anything else
+# are not compiled into VALID_URL.
+PLAIN = r"[!-Z\\^-~]"
+NETLOC = r'[!"$-.0-><@-Z\\^-~]'
+PATH = r'[!"$-><@-Z\\^-~]'
+QUERY = r'[!"$-Z\\^-~]'
+SEGMENT = r'[!"$-.0-:<=>@-Z\\^-~]'
+PLAIN_RULE = re.compile(r"[!-Z\\^-~]*")
+# The whole of a valid url as a regex, the rules filled in: an http(s)
+# scheme, a host ending with an allowed domain, a path that does not start
+# with a trap path and whose last segment, path parameters left out, does not
+# end with a blocked extension, and a query without a trap query. Domains and
+# extensions are checked by looking behind the host and the last segment once
+# they are matched whole, rather than tried at every character of them.
+VALID_URL = (r"(?i:https?)://{netloc}*{domains}(?=[/?#]|$)(?!{trap_paths})"
+             r"(?:{path}*/)?{segment}*{extensions}(?:;{netloc}*)?"
+             r"(?:\?(?![^#]*(?:{trap_queries})){query}*)?(?:#{plain}*)?")
+
+class UrlFilter(object):
+    # Decides which urls get crawled. Every rule is compiled once, all of them
+    # into one VALID_URL regex that accepts a plain valid url in a single
+    # match, and each on its own for the rest: the schemes and extensions are
+    # sets, the allowed domains a tuple for a single str.endswith, and the trap
+    # queries one regex. The last DECISION_CACHE_SIZE decisions are cached.
+    def __init__(self, allowed_domains=ALLOWED_DOMAINS, blocked_extensions=BLOCKED_EXTENSIONS,
+                 trap_paths=TRAP_PATHS, trap_queries=TRAP_QUERIES):
+        self.schemes = frozenset(ALLOWED_SCHEMES)
+        self.allowed_domains = tuple(allowed_domains)
+        self.blocked_extensions = frozenset(extension.lower().lstrip('.') for extension in blocked_extensions)
+        self.trap_paths = tuple(trap_paths)
+        self.trap_queries = tuple(trap_queries)
+        self.trap_query = re.compile('|'.join(re.escape(query) for query in trap_queries)) if trap_queries else None
+        self.valid_url = _compile_valid_url(
+            self.allowed_domains, self.blocked_extensions, self.trap_paths, self.trap_queries)
+        self.is_valid = lru_cache(maxsize=DECISION_CACHE_SIZE)(self._is_valid)
+
+    # Rebuilt from its rules when sent to a parser process, the cache is left behind.
+    def __reduce__(self):
+        return UrlFilter, (self.allowed_domains, tuple(self.blocked_extensions), self.trap_paths, self.trap_queries)
+
+    # Filter built from the [FILTER] section of config.ini, with the defaults
+    # above for anything left out.
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.filter_domains or ALLOWED_DOMAINS,
+                   config.filter_extensions or BLOCKED_EXTENSIONS,
+                   config.filter_trap_paths or TRAP_PATHS,
+                   config.filter_trap_queries or TRAP_QUERIES)
+
+    # A url VALID_URL matches is valid. One it does not match is either not
+    # valid or not plain ASCII, and goes through the rules one by one.
+    def _is_valid(self, url):
+        if self.valid_url is not None and self.valid_url.fullmatch(url) is not None:
+            return True
+        if NOT_PLAIN.search(url) is None:
+            scheme, netloc, path, query = URL_PARTS.match(url).groups('')
+            scheme = scheme.lower()
+        else:
+            scheme, netloc, path, query, _ = urlsplit(url)
+        if scheme not in self.schemes or not netloc.endswith(self.allowed_domains):
+            return False
+        if ';' in path:
+            # Path parameters of the last segment are not part of the path.
+            path = _strip_params(path)
+        if path.startswith(self.trap_paths):
+            return False
+        dot = path.rfind('.')
+        if dot != -1 and path[dot + 1:].lower() in self.blocked_extensions:
+            return False
+        if query and self.trap_query is not None and self.trap_query.search(query):
+            return False
+        return True
+
+    # The urls of a page's link list that should be crawled, in order.
+    def filter_links(self, urls):
+        is_valid = self.is_valid
+        return [url for url in urls if is_valid(url)]
+
+
+def _strip_params(path):
+    slash = path.rfind('/')
+    semicolon = path.find(';', slash + 1)
+    return path if semicolon == -1 else path[:semicolon]
+
+# VALID_URL for a filter's rules, None if a rule has characters a plain url
+# part can not have, or that change how it splits (';', '?', '#', '/' in a
+# domain, '.' in an extension), or there is no allowed domain.
+def _compile_valid_url(allowed_domains, blocked_extensions, trap_paths, trap_queries):
+    def plain(rules, forbidden):
+        return all(PLAIN_RULE.fullmatch(rule) and not set(rule) & set(forbidden) for rule in rules)
+    if not allowed_domains or not (plain(allowed_domains, "/?#") and plain(blocked_extensions, "/.;?#")
+                                   and plain(trap_paths, ";?#") and plain(trap_queries, "#")):
+        return None
+    def alternatives(rules):
+        # Longest first, so one rule that is a prefix of another is tried last.
+        return "|".join(re.escape(rule) for rule in sorted(rules, key=len, reverse=True)) or "(?!)"
+    # A lookbehind per length, lookbehinds have to be fixed-width.
+    def behind(rules, negative, flags=""):
+        lengths = sorted({len(rule) for rule in rules})
+        groups = [f"(?{'<!' if negative else '<='}(?{flags}:{alternatives(rule for rule in rules if len(rule) == length)}))"
+                  for length in lengths]
+        return "".join(groups) if negative else f"(?:{'|'.join(groups)})"
+    return re.compile(VALID_URL.format(
+        netloc=NETLOC, path=PATH, query=QUERY, segment=SEGMENT, plain=PLAIN,
+        domains=behind(allowed_domains, False), trap_paths=alternatives(trap_paths),
+        extensions=behind([f".{extension}" for extension in blocked_extensions], True, "i"),
+        trap_queries=alternatives(trap_queries)))
@@ -1,7 +1,6 @@
 import os
 import logging
-from hashlib import sha256
-from urllib.parse import urlparse
+from utils.canonical import canonicalize, url_digest, HASH_VERSION
 
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
@@ -22,14 +21,12 @@ def get_logger(name, filename=None):
     return logger
 
 
+# Hex of the compact hash of a normalized url, see utils/canonical.py.
 def get_urlhash(url):
-    parsed = urlparse(url)
-    # everything other than scheme.
-    return sha256(
-        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+    return url_digest(url).hex()
 
 def normalize(url):
+    url = canonicalize(url)
     if url.endswith("/"):
         return url.rstrip("/")
     return url
@@ -0,0 +1,94 @@
+from functools import lru_cache
+from hashlib import blake2b
+from urllib.parse import urlsplit, urlunsplit
+
+# Bumped whenever canonicalize or url_digest change, so saved crawls are rehashed.
+HASH_VERSION = 2
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Query parameters that only track where a visit came from. A trailing * matches any suffix.
+TRACKING_PARAMS = (
+    "utm_*", "fbclid", "gclid", "dclid", "gclsrc", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "ref_src")
+# Pages that are the same as the directory they are in, for hashing only.
+INDEX_PAGES = ("/index.html", "/index.htm", "/index.php")
+
+_tracking_names = frozenset()
+_tracking_prefixes = ()
+
+
+# Set the tracking parameters stripped from query strings (config TRACKINGPARAMS).
+def set_tracking_params(params):
+    global _tracking_names, _tracking_prefixes
+    params = [param.lower() for param in params]
+    _tracking_names = frozenset(param for param in params if not param.endswith("*"))
+    _tracking_prefixes = tuple(param[:-1] for param in params if param.endswith("*"))
+
+set_tracking_params(TRACKING_PARAMS)
+
+
+# Canonical form of a url, so variants of the same page are only fetched once:
+# lowercase scheme and host, no default port, dot segments resolved, tracking
+# parameters stripped, the query sorted by parameter name and no fragment.
+def canonicalize(url):
+    scheme, netloc, path, query, _ = urlsplit(url)
+    if netloc:
+        netloc = _canonical_netloc(scheme, netloc)
+    if "." in path:
+        path = _remove_dot_segments(path)
+    if query:
+        query = _canonical_query(query)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+# Compact 16 byte hash of a canonical url. The scheme is left out, like
+# before, and so is a trailing index page or slash.
+def url_digest(url):
+    parsed = urlsplit(url)
+    path = parsed.path
+    if path.endswith(INDEX_PAGES):
+        path = path[:path.rfind("/")]
+    key = f"{parsed.netloc}{path.rstrip('/')}?{parsed.query}"
+    return blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+# Hosts repeat on almost every link, so their canonical form is cached.
+@lru_cache(maxsize=4096)
+def _canonical_netloc(scheme, netloc):
+    userinfo, at, hostport = netloc.rpartition("@")
+    if hostport.startswith("["):
+        # IPv6 literal, the port comes after the closing bracket.
+        end = hostport.find("]") + 1
+        host, port = hostport[:end], hostport[end + 1:]
+    else:
+        host, _, port = hostport.partition(":")
+    host = host.lower().rstrip(".")
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    return f"{userinfo}{at}{host}"
+
+# RFC 3986 remove_dot_segments for an absolute path.
+def _remove_dot_segments(path):
+    segments = path.split("/")
+    output = []
+    for segment in segments:
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    if segments[-1] in (".", ".."):
+        output.append("")
+    return "/".join(output)
+
+def _canonical_query(query):
+    params = []
+    for param in query.split("&"):
+        if not param:
+            continue
+        name = param.partition("=")[0].lower()
+        if name in _tracking_names or name.startswith(_tracking_prefixes):
+            continue
+        params.append(param)
+    # Sorted by name only, repeated parameters keep their order.
+    params.sort(key=lambda param: param.partition("=")[0])
+    return "&".join(params)
@@ -1,5 +1,9 @@
 import re
 
+# Comma separated config value as a list, empty when it is not set.
+def _split_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 
 class Config(object):
     def __init__(self, config):
@@ -9,11 +13,56 @@ class Config(object):
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.journal_group_size = config.getint("LOCAL PROPERTIES", "JOURNALGROUP", fallback=256)
+        self.journal_group_ms = config.getfloat("LOCAL PROPERTIES", "JOURNALGROUPMS", fallback=50)
+        self.journal_sync = config.get("LOCAL PROPERTIES", "JOURNALSYNC", fallback="flush").strip().lower()
+        assert self.journal_sync in ("flush", "fsync"), "JOURNALSYNC should be flush or fsync"
+        self.journal_checkpoint = config.getint("LOCAL PROPERTIES", "JOURNALCHECKPOINT", fallback=100000)
+        self.seen_bloom_bits = config.getint("LOCAL PROPERTIES", "SEENBLOOM", fallback=0)
+        self.async_in_flight = config.getint("LOCAL PROPERTIES", "ASYNCINFLIGHT", fallback=100)
+        self.prefetch = max(config.getint("LOCAL PROPERTIES", "PREFETCH", fallback=4), 1)
+        self.parser_processes = config.getint("LOCAL PROPERTIES", "PARSERPROCESSES", fallback=0)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.pool_size = config.getint("CONNECTION", "POOLSIZE", fallback=10)
+        self.retries = config.getint("CONNECTION", "RETRIES", fallback=3)
+        self.backoff = config.getfloat("CONNECTION", "BACKOFF", fallback=0.5)
+        self.head_check = config.getboolean("CONNECTION", "HEADCHECK", fallback=False)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.host_in_flight = max(config.getint("CRAWLER", "HOSTINFLIGHT", fallback=1), 1)
+
+        self.page_store_file = config.get("LOCAL PROPERTIES", "PAGESTORE", fallback="pages.sqlite")
+        self.page_store_size = config.getint("LOCAL PROPERTIES", "PAGESTORESIZE", fallback=200000)
+        self.checkpoint_dir = config.get("LOCAL PROPERTIES", "CHECKPOINT", fallback="checkpoint")
+        self.token_counts = config.get("LOCAL PROPERTIES", "TOKENCOUNTS", fallback="exact").strip().lower()
+        assert self.token_counts in ("exact", "approximate"), "TOKENCOUNTS should be exact or approximate"
+        self.top_tokens = config.getint("LOCAL PROPERTIES", "TOPTOKENS", fallback=1000)
+        self.sketch_error = config.getfloat("LOCAL PROPERTIES", "SKETCHERROR", fallback=0.0001)
+        self.sketch_failure = config.getfloat("LOCAL PROPERTIES", "SKETCHFAILURE", fallback=0.001)
+        self.report_interval = config.getfloat("LOCAL PROPERTIES", "REPORTINTERVAL", fallback=0)
+        self.stats_interval = config.getfloat("LOCAL PROPERTIES", "STATSINTERVAL", fallback=60)
+        self.metrics_port = config.getint("LOCAL PROPERTIES", "METRICSPORT", fallback=0)
+        self.conditional_requests = config.getboolean("CONNECTION", "CONDITIONAL", fallback=False)
+
+        self.robots_file = config.get("LOCAL PROPERTIES", "ROBOTSCACHE", fallback="robots.cache")
+        self.robots_ttl = config.getfloat("CRAWLER", "ROBOTSTTL", fallback=86400)
+        self.robots_error_ttl = config.getfloat("CRAWLER", "ROBOTSERRORTTL", fallback=3600)
+        self.robots_cache_size = config.getint("CRAWLER", "ROBOTSCACHESIZE", fallback=10000)
+        self.sitemap_ttl = config.getfloat("CRAWLER", "SITEMAPTTL", fallback=86400)
+        self.sitemap_batch_size = config.getint("CRAWLER", "SITEMAPBATCH", fallback=500)
+        self.filter_domains = _split_list(config.get("FILTER", "DOMAINS", fallback=""))
+        self.filter_extensions = _split_list(config.get("FILTER", "EXTENSIONS", fallback=""))
+        self.filter_trap_paths = _split_list(config.get("FILTER", "TRAPPATHS", fallback=""))
+        self.filter_trap_queries = _split_list(config.get("FILTER", "TRAPQUERIES", fallback=""))
+        self.trap_template_limit = config.getint("CRAWLER", "TRAPTEMPLATELIMIT", fallback=500)
+        self.trap_host_budget = config.getint("CRAWLER", "TRAPHOSTBUDGET", fallback=0)
+        self.trap_repeat_limit = config.getint("CRAWLER", "TRAPREPEAT", fallback=3)
+        self.trap_max_entries = config.getint("CRAWLER", "TRAPMEMORY", fallback=100000)
+        self.tracking_params = _split_list(config.get("CRAWLER", "TRACKINGPARAMS", fallback=""))
+        self.frontier_queue = config.get("CRAWLER", "QUEUE", fallback="fifo").strip().lower()
+        assert self.frontier_queue in ("fifo", "priority"), "QUEUE should be fifo or priority"
 
         self.cache_server = None
\ No newline at end of file
@@ -1,19 +1,75 @@
+import asyncio
 import requests
 import cbor
 import time
+import aiohttp
 
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import get_urlhash
 from utils.response import Response
-from scraper import is_valid
+from utils.page_store import get_page_store
+from utils.telemetry import telemetry
+from scraper import is_valid, allow_fetch
+
+# Largest page that is downloaded.
+MAX_FILE_SIZE = 250 * 1024 #250 kb
+# Cache server statuses that are retried, same as the sync session's Retry.
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = Lock()
+
 
+# Keep-alive session shared by every worker, created on first use. Connections
+# to the cache server are pooled and reused instead of opened per request. The
+# pool holds at least a connection per download in flight, THREADCOUNT *
+# PREFETCH, or urllib3 would close the ones over it after every request.
+def get_session(config):
+    global _session
+    with _session_lock:
+        if _session is None:
+            retries = Retry(
+                total=config.retries, backoff_factor=config.backoff,
+                status_forcelist=RETRY_STATUSES, allowed_methods=("HEAD", "GET"),
+                raise_on_status=False)
+            adapter = HTTPAdapter(
+                pool_connections=config.pool_size,
+                pool_maxsize=max(config.pool_size, config.threads_count * config.prefetch),
+                max_retries=retries)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
 
 def _is_large_file(headers):
     if 'Content-Length' in headers:
         file_size = int(headers['Content-Length'])
-        print(file_size)
-        if file_size > (250 * 1024): #250 kb
+        if file_size > MAX_FILE_SIZE:
             return True
-    else:
-        return False
+    return False
+
+# Read a streamed response body, giving up with None as soon as it passes MAX_FILE_SIZE.
+def _read_capped(resp):
+    if _is_large_file(resp.headers):
+        return None
+    content = bytearray()
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        content += chunk
+        if len(content) > MAX_FILE_SIZE:
+            return None
+    return bytes(content)
+
+# If-None-Match / If-Modified-Since for a page fetched before, sent along to
+# the cache server when config.conditional_requests is on.
+def _conditional_headers(url, config):
+    page_store = get_page_store(config)
+    if not config.conditional_requests or page_store is None:
+        return None
+    return page_store.conditional_headers(get_urlhash(url)) or None
 
 def download(url, config, logger=None):
     if not is_valid(url):
@@ -21,25 +77,123 @@ def download(url, config, logger=None):
             "error": f"Invalid URL: {url}.",
             "status": 0,  # idk wha the code would be though
             "url": url})
+    if not allow_fetch(url):
+        return Response({
+            "error": f"Crawler trap: {url}.",
+            "status": 0,
+            "url": url})
 
     host, port = config.cache_server
-    headers = requests.head(f"http://{host}:{port}/", params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    if _is_large_file(headers):
+    session = get_session(config)
+    params = [("q", f"{url}"), ("u", f"{config.user_agent}")]
+    if config.head_check:
+        with telemetry.timer("download.head"):
+            headers = session.head(f"http://{host}:{port}/", params=params)
+        if _is_large_file(headers.headers):
+            return Response({
+                "error": f"File too large: {url}.",
+                "status": headers.status_code,  #idk wha the code would be though
+                "url": url})
+
+    # Stream the body so an oversized page is cut off at the cap instead of
+    # needing a HEAD round-trip first.
+    headers = _conditional_headers(url, config)
+    with telemetry.timer("download.get"):
+        with session.get(f"http://{host}:{port}/", params=params, headers=headers, stream=True) as resp:
+            content = _read_capped(resp)
+    if content is None:
         return Response({
             "error": f"File too large: {url}.",
-            "status": headers.status_code,  #idk wha the code would be though
+            "status": resp.status_code,
             "url": url})
-
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error {resp} with url {url}.")
     return Response({
         "error": f"Spacetime Response error {resp} with url {url}.",
         "status": resp.status_code,
         "url": url})
+
+
+# Same as _read_capped, for an aiohttp response.
+async def _read_capped_async(resp):
+    if _is_large_file(resp.headers):
+        return None
+    content = bytearray()
+    async for chunk in resp.content.iter_chunked(64 * 1024):
+        content += chunk
+        if len(content) > MAX_FILE_SIZE:
+            return None
+    return bytes(content)
+
+async def _no_body(resp):
+    return None
+
+# Send a request to the cache server with the same retries as the sync
+# session: up to config.retries more tries on a connection error or a
+# RETRY_STATUSES status, waiting backoff * 2 ** (try - 1) seconds in between.
+# Returns the response and what read, awaited with it, returned.
+async def _request_async(session, method, config, read, **kwargs):
+    host, port = config.cache_server
+    for attempt in range(config.retries + 1):
+        if attempt:
+            await asyncio.sleep(config.backoff * 2 ** (attempt - 1))
+        try:
+            async with session.request(method, f"http://{host}:{port}/", **kwargs) as resp:
+                if resp.status in RETRY_STATUSES and attempt < config.retries:
+                    continue
+                return resp, await read(resp)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == config.retries:
+                raise
+
+# Same as download, but non-blocking on top of a shared aiohttp session so
+# that many requests to the cache server can be in flight at once.
+async def download_async(url, config, session, logger=None):
+    if not is_valid(url):
+        return Response({
+            "error": f"Invalid URL: {url}.",
+            "status": 0,
+            "url": url})
+    if not allow_fetch(url):
+        return Response({
+            "error": f"Crawler trap: {url}.",
+            "status": 0,
+            "url": url})
+
+    params = [("q", f"{url}"), ("u", f"{config.user_agent}")]
+    if config.head_check:
+        with telemetry.timer("download.head"):
+            head, _ = await _request_async(session, "HEAD", config, _no_body, params=params)
+        if _is_large_file(head.headers):
+            return Response({
+                "error": f"File too large: {url}.",
+                "status": head.status,
+                "url": url})
+
+    # Streamed and cut off at the cap, like the sync download.
+    headers = _conditional_headers(url, config)
+    with telemetry.timer("download.get"):
+        resp, content = await _request_async(
+            session, "GET", config, _read_capped_async, params=params, headers=headers)
+    status = resp.status
+    if content is None:
+        return Response({
+            "error": f"File too large: {url}.",
+            "status": status,
+            "url": url})
+    try:
+        if status < 400 and content:
+            return Response(cbor.loads(content))
+    except (EOFError, ValueError) as e:
+        pass
+    if logger:
+        logger.error(f"Spacetime Response error {status} with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error {status} with url {url}.",
+        "status": status,
+        "url": url})
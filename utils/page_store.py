@@ -0,0 +1,144 @@
+import marshal
+import sqlite3
+import time
+import zlib
+
+from collections import Counter
+from hashlib import blake2b
+from threading import Lock
+
+# Puts between two commits, a crash loses at most this many entries.
+COMMIT_EVERY = 100
+
+
+# 16 byte digest of a page's content.
+def content_digest(content):
+    return blake2b(content, digest_size=16).digest()
+
+
+class StoredPage(object):
+    def __init__(self, etag, last_modified, digest, links, counts=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.links = links
+        # (fingerprint bits, simhash, tag count, token counts) the page was
+        # counted with, None for pages stored before they were kept.
+        self.counts = counts
+
+
+# Compressed (fingerprint bits, simhash, tag count, token counts) of a page.
+def encode_counts(fingerprint_bits, simhash, tag_count, word_counts):
+    return zlib.compress(marshal.dumps((fingerprint_bits, simhash, tag_count, dict(word_counts))))
+
+def decode_counts(blob):
+    if blob is None:
+        return None
+    fingerprint_bits, simhash, tag_count, word_counts = marshal.loads(zlib.decompress(blob))
+    return fingerprint_bits, simhash, tag_count, Counter(word_counts)
+
+
+class PageStore(object):
+    # What the crawler learned from each page it fetched, keyed by url hash:
+    # the ETag and Last-Modified validators, a digest of the content, the
+    # outlinks and what the page was counted with in ScraperData. A page that
+    # comes back unchanged (same digest, or a 304) is counted and followed
+    # from the store instead of being parsed again. Kept in a sqlite file, and
+    # the least recently used pages are evicted past max_pages.
+    def __init__(self, path, max_pages):
+        self.path = path
+        self.max_pages = max_pages
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "digest BLOB, links TEXT, used REAL, counts BLOB)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(pages)")]
+        if "counts" not in columns:
+            # A store from before page counts were kept.
+            self.connection.execute("ALTER TABLE pages ADD COLUMN counts BLOB")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages (used)")
+        self.count = self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        self.uncommitted = 0
+
+    def get(self, urlhash):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, digest, links, counts FROM pages WHERE urlhash = ?",
+                (urlhash,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE pages SET used = ? WHERE urlhash = ?", (time.time(), urlhash))
+            self._written()
+        etag, last_modified, digest, links, counts = row
+        return StoredPage(etag, last_modified, digest, links.split("\n") if links else [], decode_counts(counts))
+
+    # counts is from encode_counts, or None.
+    def put(self, urlhash, etag, last_modified, digest, links, counts=None):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (urlhash, etag, last_modified, digest, "\n".join(links), time.time(), counts))
+            # An upper bound, a replaced row is counted again. _evict recounts.
+            self.count += 1
+            if self.count > self.max_pages:
+                self._evict()
+            self._written()
+
+    # Request headers that let a server answer 304 Not Modified for a stored page.
+    def conditional_headers(self, urlhash):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified FROM pages WHERE urlhash = ?", (urlhash,)).fetchone()
+        headers = dict()
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        return headers
+
+    # Forget every page.
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM pages")
+            self.connection.commit()
+            self.count = 0
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    # Drop the least recently used tenth of the store, the caller holds self.lock.
+    def _evict(self):
+        self.count = self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        excess = self.count - self.max_pages
+        if excess <= 0:
+            return
+        excess += self.max_pages // 10
+        self.connection.execute(
+            "DELETE FROM pages WHERE urlhash IN "
+            "(SELECT urlhash FROM pages ORDER BY used LIMIT ?)", (excess,))
+        self.count -= excess
+
+    def _written(self):
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.connection.commit()
+            self.uncommitted = 0
+
+
+_page_store = None
+_page_store_lock = Lock()
+
+# Page store shared by every worker, created on first use. None when
+# config.page_store_size is 0.
+def get_page_store(config):
+    global _page_store
+    with _page_store_lock:
+        if _page_store is None and config.page_store_size > 0:
+            _page_store = PageStore(config.page_store_file, config.page_store_size)
+    return _page_store
@@ -0,0 +1,234 @@
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, Event
+
+from utils import get_logger
+
+# Histogram buckets: values (in microseconds) under 2 * SUB_BUCKETS get a
+# bucket each, every power of two above that is split into SUB_BUCKETS, so a
+# bucket is at most 1 / SUB_BUCKETS (about 3%) wide relative to its values.
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Enough buckets for values up to 2 ** 40 microseconds, about 12 days.
+BUCKETS = (41 - SUB_BUCKET_BITS) * SUB_BUCKETS
+# Percentiles shown for each stage.
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(micros):
+    if micros < 2 * SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return min((shift << SUB_BUCKET_BITS) + (micros >> shift), BUCKETS - 1)
+
+# Lowest value, in microseconds, of a bucket.
+def bucket_floor(index):
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return (index - (shift << SUB_BUCKET_BITS)) << shift
+
+
+class Histogram(object):
+    # Latencies in log-linear buckets, HDR histogram style: a fixed number of
+    # counters, any percentile within a few percent, and a record costs an
+    # index computation and an increment.
+    def __init__(self, name):
+        self.name = name
+        self.lock = Lock()
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = bucket_index(int(seconds * 1000000))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    # Value in seconds under which percentile percent of the records fall,
+    # the middle of its bucket.
+    def percentile(self, percentile):
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = max(self.count * percentile / 100, 1)
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    break
+        return (bucket_floor(index) + bucket_floor(index + 1)) / 2 / 1000000
+
+    # (upper bound in seconds, records under it) at every power of two
+    # microseconds up to the highest record, for the metrics endpoint, which
+    # gets the same bounds every time. Percentiles are exported separately.
+    def cumulative(self):
+        with self.lock:
+            counts = list(self.counts)
+        buckets = []
+        seen = 0
+        bound = 1
+        for index, count in enumerate(counts):
+            if bucket_floor(index) >= bound:
+                if seen == self.count:
+                    break
+                buckets.append((bound / 1000000, seen))
+                bound *= 2
+            seen += count
+        buckets.append((bound / 1000000, seen))
+        return buckets
+
+
+class Timer(object):
+    # Times the block of a with statement into a histogram.
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.record(time.perf_counter() - self.start)
+
+
+class Telemetry(object):
+    # Stage latencies, event counters and gauges of the crawl. Stages are
+    # timed with "with telemetry.timer(stage):" wherever the work is done,
+    # gauges are functions read when the stats are reported.
+    def __init__(self):
+        self.lock = Lock()
+        # key: stage, value: its Histogram
+        self.histograms = dict()
+        # key: event, value: times it happened
+        self.counters = defaultdict(int)
+        # key: gauge name, value: function returning {label: value}
+        self.gauges = dict()
+        self.started_at = time.monotonic()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram(stage))
+        return histogram
+
+    def timer(self, stage):
+        return Timer(self.histogram(stage))
+
+    def record(self, stage, seconds):
+        self.histogram(stage).record(seconds)
+
+    def count(self, event, n=1):
+        with self.lock:
+            self.counters[event] += n
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    # Current value of every gauge, {name: {label: value}}.
+    def read_gauges(self):
+        values = dict()
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = read()
+            except Exception:
+                continue
+        return values
+
+    # Text exposition format of every metric, as scraped from /metrics.
+    def metrics(self):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+        for event, value in sorted(counters.items()):
+            lines.append(f"crawler_{event}_total {value}")
+        elapsed = time.monotonic() - self.started_at
+        lines.append(f"crawler_uptime_seconds {elapsed:.3f}")
+        lines.append(f"crawler_pages_per_second {counters.get('pages', 0) / max(elapsed, 1e-9):.3f}")
+        for stage, histogram in sorted(self.histograms.items()):
+            for bound, seen in histogram.cumulative():
+                lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound:.6f}"}} {seen}')
+            lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            for percentile in PERCENTILES:
+                lines.append(f'crawler_stage_seconds_quantile{{stage="{stage}",quantile="{percentile / 100}"}} '
+                             f'{histogram.percentile(percentile):.6f}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, values in sorted(self.read_gauges().items()):
+            for label, value in sorted(values.items()):
+                lines.append(f'crawler_{name}{{name="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    # One line of counts, rates and stage percentiles, for the periodic log.
+    def summary(self, since, pages_before):
+        now = time.monotonic()
+        pages = self.counters.get("pages", 0)
+        parts = [f"pages {pages} ({(pages - pages_before) / max(now - since, 1e-9):.2f}/s)"]
+        for stage, histogram in sorted(self.histograms.items()):
+            percentiles = " ".join(
+                f"p{percentile} {histogram.percentile(percentile) * 1000:.1f}" for percentile in PERCENTILES)
+            parts.append(f"{stage} n={histogram.count} {percentiles} max {histogram.max * 1000:.1f} ms")
+        for name, values in sorted(self.read_gauges().items()):
+            parts.append(f"{name} " + " ".join(f"{label}={value}" for label, value in sorted(values.items())))
+        return " | ".join(parts), now, pages
+
+
+# Every stage of the crawler is timed into this one.
+telemetry = Telemetry()
+
+
+class TelemetryReporter(object):
+    # Logs telemetry.summary() every config.stats_interval seconds (0 for
+    # never) and serves telemetry.metrics() on 127.0.0.1:config.metrics_port
+    # (0 for no endpoint).
+    def __init__(self, config):
+        self.logger = get_logger("STATS")
+        self.interval = config.stats_interval
+        self.stopped = Event()
+        self.thread = None
+        self.server = None
+        if self.interval > 0:
+            self.thread = Thread(target=self._log_loop, daemon=True)
+            self.thread.start()
+        if config.metrics_port > 0:
+            self.server = ThreadingHTTPServer(("127.0.0.1", config.metrics_port), MetricsHandler)
+            self.server.daemon_threads = True
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{config.metrics_port}/metrics")
+
+    def _log_loop(self):
+        since, pages = time.monotonic(), 0
+        while not self.stopped.wait(self.interval):
+            line, since, pages = telemetry.summary(since, pages)
+            self.logger.info(line)
+
+    def close(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = telemetry.metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are not logged to stderr.
+    def log_message(self, format, *args):
+        pass